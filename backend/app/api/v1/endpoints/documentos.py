@@ -5,13 +5,15 @@ import os
 import tempfile
 
 from app.db.base import get_db
-from app.services.rag import RAGService
+from app.services.ingesta import encolar_ingesta, obtener_trabajo
+from app.services.indice_vectorial import indices_vectoriales
+from app.services.cache_respuestas import respuestas_cacheadas
 from app.models.empresa import Empresa
 from app.models.documento import Documento
 
 router = APIRouter(prefix="/documentos", tags=["documentos"])
 
-@router.post("/subir/{empresa_id}")
+@router.post("/subir/{empresa_id}", status_code=status.HTTP_202_ACCEPTED)
 async def subir_documento(
     empresa_id: int,
     archivo: UploadFile = File(...),
@@ -43,37 +45,46 @@ async def subir_documento(
             detail="tipo_campania debe ser 'producto_unico', 'pedido_multiple' o 'informativo'"
         )
     
-    try:
-        # Leer contenido del archivo
-        contenido = await archivo.read()
-        
-        # Procesar documento con RAG (pasando todos los parámetros)
-        rag_service = RAGService(db, empresa_id)
-        documento = rag_service.guardar_documento(
-            archivo.filename, 
-            contenido, 
-            campania_id,
-            mensaje_entrega,
-            precio,
-            tipo_campania  # 🔥 Pasar tipo_campania
-        )
-        
-        return {
-            "mensaje": "Documento procesado correctamente",
-            "documento_id": documento.id,
-            "nombre": documento.nombre,
-            "campania_id": documento.campania_id,
-            "mensaje_entrega": documento.mensaje_entrega,
-            "precio": documento.precio,
-            "tipo_campania": documento.tipo_campania,  # 🔥 Incluir en respuesta
-            "chunks": len(documento.chunks) if documento.chunks else 0
-        }
+    # Copiar el archivo a disco por bloques; el trabajo lo lee por páginas y lo borra al terminar
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as temporal:
+        try:
+            while bloque := await archivo.read(1024 * 1024):
+                temporal.write(bloque)
+        except Exception:
+            temporal.close()
+            os.remove(temporal.name)
+            raise
+    
+    # El procesamiento (texto, chunks, embeddings) corre en segundo plano
+    trabajo = encolar_ingesta(
+        empresa_id,
+        archivo.filename,
+        temporal.name,
+        campania_id,
+        mensaje_entrega,
+        precio,
+        tipo_campania
+    )
     
-    except Exception as e:
+    return {
+        "mensaje": "Documento recibido, procesando en segundo plano",
+        "job_id": trabajo.id,
+        "estado": trabajo.estado,
+        "nombre": archivo.filename,
+        "tipo_campania": tipo_campania
+    }
+
+@router.get("/jobs/{job_id}")
+def obtener_estado_ingesta(job_id: str):
+    """Consultar el avance del procesamiento de un documento subido"""
+    trabajo = obtener_trabajo(job_id)
+    if not trabajo:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error al procesar el documento: {str(e)}"
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Trabajo de ingesta no encontrado"
         )
+    
+    return trabajo.to_dict()
 
 @router.get("/listar/{empresa_id}")
 def listar_documentos(
@@ -125,6 +136,8 @@ def obtener_documento(
         "chunks": [
             {
                 "indice": chunk.indice,
+                "pagina_inicio": chunk.pagina_inicio,
+                "pagina_fin": chunk.pagina_fin,
                 "texto_preview": chunk.texto[:200] + "..." if len(chunk.texto) > 200 else chunk.texto
             }
             for chunk in documento.chunks[:5]
@@ -145,10 +158,17 @@ def actualizar_campania_documento(
             detail="Documento no encontrado"
         )
     
+    campania_anterior = documento.campania_id
     documento.campania_id = campania_id
     db.commit()
     db.refresh(documento)
     
+    # Los chunks cambian de campaña: la anterior y la nueva quedan desactualizadas
+    indices_vectoriales.invalidar(documento.empresa_id, campania_anterior)
+    indices_vectoriales.invalidar(documento.empresa_id, campania_id)
+    respuestas_cacheadas.invalidar(documento.empresa_id, campania_anterior)
+    respuestas_cacheadas.invalidar(documento.empresa_id, campania_id)
+    
     return {
         "mensaje": "Campaña actualizada correctamente",
         "documento_id": documento.id,
@@ -252,7 +272,10 @@ def eliminar_documento(
             detail="Documento no encontrado"
         )
     
+    empresa_id, campania_id = documento.empresa_id, documento.campania_id
     db.delete(documento)
     db.commit()
+    indices_vectoriales.invalidar(empresa_id, campania_id)
+    respuestas_cacheadas.invalidar(empresa_id, campania_id)
     
     return {"mensaje": "Documento eliminado correctamente"}
\ No newline at end of file
@@ -6,6 +6,8 @@ import secrets
 from app.db.base import get_db
 from app.models.empresa import Empresa as EmpresaModel
 from app.schemas.empresa import Empresa, EmpresaCreate, EmpresaUpdate
+from app.services.empresa_cache import invalidar_empresa
+from app.services.cache_respuestas import respuestas_cacheadas
 
 router = APIRouter(prefix="/empresas", tags=["empresas"])
 
@@ -105,6 +107,8 @@ def actualizar_empresa(
     
     db.commit()
     db.refresh(empresa)
+    invalidar_empresa(empresa_id)
+    respuestas_cacheadas.invalidar(empresa_id)
     
     return empresa
 
@@ -128,5 +132,7 @@ def eliminar_empresa(
     # Eliminar la empresa (las relaciones con CASCADE eliminarán documentos, chunks, etc.)
     db.delete(empresa)
     db.commit()
+    invalidar_empresa(empresa_id)
+    respuestas_cacheadas.invalidar(empresa_id)
     
     return {"mensaje": f"Empresa {empresa_id} eliminada correctamente"}
@@ -7,5 +7,107 @@ class Settings(BaseSettings):
     SECRET_KEY: str = os.getenv("SECRET_KEY", "tu_secreto_super_seguro_cambia_esto")
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    
+    # RAG: "pgvector" ordena por distancia coseno en SQL, "memoria" usa el índice NumPy en proceso
+    # (para bases sin índices pgvector) y "python" es el cálculo legacy fila por fila
+    RAG_MODO_BUSQUEDA: str = os.getenv("RAG_MODO_BUSQUEDA", "pgvector")
+    # Candidatos que explora el índice HNSW por consulta (más alto = más preciso, más lento)
+    RAG_HNSW_EF_SEARCH: int = int(os.getenv("RAG_HNSW_EF_SEARCH", "100"))
+    # Tope de memoria para los índices en proceso (todas las empresas juntas) y su vigencia
+    RAG_INDICE_MAX_MB: int = int(os.getenv("RAG_INDICE_MAX_MB", "256"))
+    RAG_INDICE_TTL_SEGUNDOS: int = int(os.getenv("RAG_INDICE_TTL_SEGUNDOS", "600"))
+    
+    # Cache de configuración de empresas (webhook: phone_number_id → credenciales)
+    EMPRESA_CACHE_MAX_ENTRADAS: int = int(os.getenv("EMPRESA_CACHE_MAX_ENTRADAS", "1000"))
+    EMPRESA_CACHE_TTL_SEGUNDOS: int = int(os.getenv("EMPRESA_CACHE_TTL_SEGUNDOS", "300"))
+    
+    # Cache de embeddings de mensajes de clientes ("hola", "precio?", ...)
+    EMBEDDING_CACHE_MAX_ENTRADAS: int = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRADAS", "10000"))
+    EMBEDDING_CACHE_TTL_SEGUNDOS: int = int(os.getenv("EMBEDDING_CACHE_TTL_SEGUNDOS", "86400"))
+    
+    # Ingesta de documentos: textos por llamada a la API de embeddings y lotes en paralelo
+    EMBEDDING_TAMANO_LOTE: int = int(os.getenv("EMBEDDING_TAMANO_LOTE", "100"))
+    EMBEDDING_CONCURRENCIA: int = int(os.getenv("EMBEDDING_CONCURRENCIA", "4"))
+    # Extracción de PDFs: desde cuántas páginas se usa el pool de procesos, páginas por tarea y procesos
+    PDF_PAGINAS_PARALELO: int = int(os.getenv("PDF_PAGINAS_PARALELO", "40"))
+    PDF_PAGINAS_POR_TAREA: int = int(os.getenv("PDF_PAGINAS_POR_TAREA", "16"))
+    PDF_WORKERS: int = int(os.getenv("PDF_WORKERS", str(os.cpu_count() or 1)))
+    # Tamaño de cada chunk y solapamiento entre chunks, en tokens del modelo de embeddings
+    CHUNK_TOKENS: int = int(os.getenv("CHUNK_TOKENS", "512"))
+    CHUNK_SOLAPAMIENTO_TOKENS: int = int(os.getenv("CHUNK_SOLAPAMIENTO_TOKENS", "64"))
+    # Documentos procesados a la vez en segundo plano y trabajos terminados que se recuerdan
+    INGESTA_WORKERS: int = int(os.getenv("INGESTA_WORKERS", "2"))
+    INGESTA_MAX_TRABAJOS_GUARDADOS: int = int(os.getenv("INGESTA_MAX_TRABAJOS_GUARDADOS", "500"))
+    
+    # Clientes de OpenAI/Groq abiertos a la vez (uno por credenciales de empresa); al pasarse
+    # se cierra el menos usado, por ejemplo el de una API key que la empresa ya cambió
+    CLIENTES_API_MAX_ENTRADAS: int = int(os.getenv("CLIENTES_API_MAX_ENTRADAS", "500"))
+    
+    # Hilos para las llamadas a SDKs síncronos desde el webhook asíncrono (Cloudinary, Redis)
+    SDK_HILOS: int = int(os.getenv("SDK_HILOS", "16"))
+    
+    # Cola de webhooks: workers por proceso, reintentos con backoff antes de pasar a fallidos,
+    # plazo para procesar un evento antes de que otro worker lo retome y cada cuánto se sondea
+    WEBHOOK_WORKERS: int = int(os.getenv("WEBHOOK_WORKERS", "8"))
+    WEBHOOK_MAX_INTENTOS: int = int(os.getenv("WEBHOOK_MAX_INTENTOS", "5"))
+    WEBHOOK_REINTENTO_BASE_SEGUNDOS: int = int(os.getenv("WEBHOOK_REINTENTO_BASE_SEGUNDOS", "5"))
+    WEBHOOK_TIMEOUT_PROCESAMIENTO_SEGUNDOS: int = int(os.getenv("WEBHOOK_TIMEOUT_PROCESAMIENTO_SEGUNDOS", "300"))
+    WEBHOOK_POLL_SEGUNDOS: float = float(os.getenv("WEBHOOK_POLL_SEGUNDOS", "1"))
+    # Mensajes más viejos que esto al llegar se descartan; 0 = aceptar todos (por defecto: las
+    # re-entregas de Meta ya las descarta el id del mensaje y un mensaje real demorado igual se responde)
+    WEBHOOK_MAX_ANTIGUEDAD_SEGUNDOS: int = int(os.getenv("WEBHOOK_MAX_ANTIGUEDAD_SEGUNDOS", "0"))
+    # Mensajes de un mismo webhook (Meta los agrupa con carga) que se atienden a la vez
+    WEBHOOK_CONCURRENCIA_LOTE: int = int(os.getenv("WEBHOOK_CONCURRENCIA_LOTE", "8"))
+    
+    # IDs de mensajes de WhatsApp ya procesados (descarta re-entregas de Meta sin ir a la base)
+    MENSAJES_VISTOS_MAX_ENTRADAS: int = int(os.getenv("MENSAJES_VISTOS_MAX_ENTRADAS", "100000"))
+    MENSAJES_VISTOS_TTL_SEGUNDOS: int = int(os.getenv("MENSAJES_VISTOS_TTL_SEGUNDOS", "86400"))
+    
+    # Espera para agrupar mensajes seguidos de un cliente en una sola respuesta (0 = responder cada uno)
+    # y tope de espera desde el primer mensaje del grupo
+    COALESCENCIA_SEGUNDOS: float = float(os.getenv("COALESCENCIA_SEGUNDOS", "2"))
+    COALESCENCIA_MAX_SEGUNDOS: float = float(os.getenv("COALESCENCIA_MAX_SEGUNDOS", "10"))
+    
+    # Respuestas del LLM en streaming: se mandan por WhatsApp frase a frase (de al menos N caracteres)
+    LLM_STREAMING: bool = os.getenv("LLM_STREAMING", "false").lower() == "true"
+    LLM_STREAMING_MIN_CARACTERES: int = int(os.getenv("LLM_STREAMING_MIN_CARACTERES", "80"))
+    
+    # Cache semántico de respuestas por campaña: una pregunta con similitud coseno >= umbral
+    # a otra ya respondida reutiliza esa respuesta sin llamar al LLM (0 entradas = desactivado)
+    RESPUESTAS_CACHE_UMBRAL: float = float(os.getenv("RESPUESTAS_CACHE_UMBRAL", "0.95"))
+    RESPUESTAS_CACHE_MAX_POR_CAMPANIA: int = int(os.getenv("RESPUESTAS_CACHE_MAX_POR_CAMPANIA", "200"))
+    RESPUESTAS_CACHE_MAX_CAMPANIAS: int = int(os.getenv("RESPUESTAS_CACHE_MAX_CAMPANIAS", "500"))
+    RESPUESTAS_CACHE_TTL_SEGUNDOS: int = int(os.getenv("RESPUESTAS_CACHE_TTL_SEGUNDOS", "86400"))
+    
+    # Mensajes de conversación: se insertan por lotes cada N segundos o al juntar N filas
+    CONVERSACIONES_ESCRITURA_SEGUNDOS: float = float(os.getenv("CONVERSACIONES_ESCRITURA_SEGUNDOS", "0.5"))
+    CONVERSACIONES_MAX_LOTE: int = int(os.getenv("CONVERSACIONES_MAX_LOTE", "500"))
+    # Tope de mensajes esperando en memoria si la base no responde (se descartan los más viejos)
+    CONVERSACIONES_MAX_PENDIENTES: int = int(os.getenv("CONVERSACIONES_MAX_PENDIENTES", "50000"))
+    
+    # Últimos mensajes por cliente en memoria para el historial del prompt y los comprobantes, y
+    # cada cuánto se vuelven a leer de la base (con varias réplicas trae lo que atendieron las otras)
+    HISTORIAL_RECIENTE_MAX_MENSAJES: int = int(os.getenv("HISTORIAL_RECIENTE_MAX_MENSAJES", "50"))
+    HISTORIAL_RECIENTE_MAX_CLIENTES: int = int(os.getenv("HISTORIAL_RECIENTE_MAX_CLIENTES", "10000"))
+    HISTORIAL_RECIENTE_TTL_SEGUNDOS: float = float(os.getenv("HISTORIAL_RECIENTE_TTL_SEGUNDOS", "60"))
+    
+    # Comprobantes: descarga de WhatsApp -> Cloudinary. Tamaño máximo, cuánto se guarda en
+    # memoria antes de pasar a un archivo temporal y reintentos (espera exponencial) por paso
+    MEDIOS_MAX_BYTES: int = int(os.getenv("MEDIOS_MAX_BYTES", "10485760"))
+    MEDIOS_BYTES_EN_MEMORIA: int = int(os.getenv("MEDIOS_BYTES_EN_MEMORIA", "1048576"))
+    MEDIOS_REINTENTOS: int = int(os.getenv("MEDIOS_REINTENTOS", "2"))
+    MEDIOS_ESPERA_REINTENTO_SEGUNDOS: float = float(os.getenv("MEDIOS_ESPERA_REINTENTO_SEGUNDOS", "0.5"))
+    
+    # Dónde se guardan los comprobantes: "cloudinary" (cuenta de cada empresa) o "local"
+    # (backend falso para pruebas y desarrollo, en MEDIOS_DIRECTORIO_LOCAL)
+    MEDIOS_BACKEND: str = os.getenv("MEDIOS_BACKEND", "cloudinary")
+    MEDIOS_DIRECTORIO_LOCAL: str = os.getenv("MEDIOS_DIRECTORIO_LOCAL", "medios_local")
+    
+    # Notas de voz: transcripciones a la vez por empresa, cuánto se espera antes de avisar al
+    # cliente que se está procesando y cache por sha256/id del medio (re-entregas y reintentos)
+    TRANSCRIPCION_CONCURRENCIA_POR_EMPRESA: int = int(os.getenv("TRANSCRIPCION_CONCURRENCIA_POR_EMPRESA", "4"))
+    TRANSCRIPCION_ESPERA_SEGUNDOS: float = float(os.getenv("TRANSCRIPCION_ESPERA_SEGUNDOS", "8"))
+    TRANSCRIPCIONES_CACHE_MAX_ENTRADAS: int = int(os.getenv("TRANSCRIPCIONES_CACHE_MAX_ENTRADAS", "10000"))
+    TRANSCRIPCIONES_CACHE_TTL_SEGUNDOS: int = int(os.getenv("TRANSCRIPCIONES_CACHE_TTL_SEGUNDOS", "86400"))
 
-settings = Settings()
\ No newline at end of file
+settings = Settings()
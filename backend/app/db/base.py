@@ -1,4 +1,5 @@
 from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
@@ -18,6 +19,29 @@ with engine.connect() as conn:
 # Crear una fábrica de sesiones
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# --- Motor asíncrono (asyncpg) para el webhook de WhatsApp ---
+def _url_asyncpg(url: str) -> str:
+    """Misma base que DATABASE_URL pero con el driver asyncpg"""
+    for prefijo in ("postgresql+psycopg2://", "postgresql://", "postgres://"):
+        if url.startswith(prefijo):
+            url = "postgresql+asyncpg://" + url[len(prefijo):]
+            break
+    # asyncpg no entiende el parámetro sslmode de libpq
+    return url.replace("sslmode=", "ssl=")
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", _url_asyncpg(DATABASE_URL))
+
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    pool_size=int(os.getenv("DB_POOL_TAMANO", "20")),
+    max_overflow=int(os.getenv("DB_POOL_EXTRA", "20")),
+    pool_pre_ping=True
+)
+
+# expire_on_commit=False: los objetos siguen usables después del commit sin volver a consultar
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+# ---------------------------------------------------------
+
 # Base para modelos declarativos
 Base = declarative_base()
 
@@ -27,4 +51,9 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+# Igual que get_db pero con una sesión asíncrona (no bloquea el event loop)
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
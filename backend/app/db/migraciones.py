@@ -0,0 +1,47 @@
+import os
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import text
+
+from app.core.config import settings
+
+# alembic.ini está en la raíz del backend (junto a migrations/)
+ALEMBIC_INI = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "alembic.ini")
+
+# Varias réplicas arrancando a la vez: solo una aplica las migraciones, el resto espera
+LOCK_MIGRACIONES = 7243019
+
+# Índice ANN para buscar por distancia coseno sin recorrer todos los chunks. Solo lo
+# usa RAG_MODO_BUSQUEDA=pgvector, así que no es parte de las migraciones
+INDICE_HNSW = """
+CREATE INDEX IF NOT EXISTS ix_chunks_documento_embedding_hnsw
+ON chunks_documento USING hnsw (embedding vector_cosine_ops)
+WITH (m = 16, ef_construction = 64)
+"""
+INDICES_FUERA_DE_MIGRACIONES = {"ix_chunks_documento_embedding_hnsw"}
+
+def aplicar_migraciones():
+    """
+    Lleva la base a la última migración de Alembic (migrations/versions).
+    Las bases creadas antes con create_all las adopta la migración inicial.
+    """
+    command.upgrade(Config(ALEMBIC_INI), "head")
+    asegurar_indice_hnsw()
+
+def asegurar_indice_hnsw():
+    """
+    Crea el índice HNSW si falta y la búsqueda es por pgvector. Si la base no lo
+    soporta (pgvector < 0.5, sin permisos) se avisa y se sigue: pgvector busca sin
+    índice y los modos memoria/python no lo necesitan.
+    """
+    if settings.RAG_MODO_BUSQUEDA != "pgvector":
+        return
+
+    from app.db.base import engine
+    try:
+        with engine.begin() as conexion:
+            conexion.execute(text("SELECT pg_advisory_xact_lock(:clave)"), {"clave": LOCK_MIGRACIONES})
+            conexion.execute(text(INDICE_HNSW))
+    except Exception as e:
+        print(f"⚠️ No se pudo crear el índice HNSW de chunks (se busca sin índice): {e}")
@@ -0,0 +1,27 @@
+import os
+
+try:
+    import redis
+except ImportError:  # Redis es opcional: sin la librería se usa solo el cache en proceso
+    redis = None
+
+# Obtener la URL de Redis desde variables de entorno (docker-compose la define)
+REDIS_URL = os.getenv("REDIS_URL", "")
+
+_cliente_redis = None
+
+def obtener_redis():
+    """
+    Devuelve el cliente de Redis compartido, o None si Redis no está configurado.
+    Los timeouts son cortos: si Redis no responde es mejor seguir sin cache.
+    """
+    global _cliente_redis
+    if not REDIS_URL or redis is None:
+        return None
+    if _cliente_redis is None:
+        _cliente_redis = redis.Redis.from_url(
+            REDIS_URL,
+            socket_timeout=0.5,
+            socket_connect_timeout=0.5
+        )
+    return _cliente_redis
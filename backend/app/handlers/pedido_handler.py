@@ -1,78 +1,15 @@
 import datetime
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.models.cliente import Cliente
-from app.models.empresa import Empresa
+from app.services.empresa_cache import EmpresaConfig
 from app.models.pedido import Pedido, EstadoPedido
-from app.models.conversacion import Conversacion, TipoEmisor
-from app.services.rag import RAGService
-from app.services.memoria import MemoriaService
 from app.services.whatsapp_sender import enviar_mensaje_whatsapp, enviar_mensaje_con_botones
 from app.socket_manager import emitir_nuevo_pedido, emitir_pedido_actualizado  # 🔥 NUEVO
 
-async def responder_pregunta_restaurante(
-    db: Session,
-    empresa: Empresa,
-    cliente: Cliente,
-    texto_mensaje: str,
-    campania_id: str,
-    whatsapp_token: str,
-    phone_number_id: str
-):
-    """
-    Responde preguntas del restaurante usando RAG (menú, horarios, direcciones, etc.)
-    """
-    # Inicializar RAG y Memoria
-    rag = RAGService(
-        db=db,
-        empresa_id=empresa.id,
-        cliente_id=cliente.id,
-        campania_id=campania_id
-    )
-    memoria = MemoriaService(db, cliente.id)
-    
-    # Buscar documentos relevantes del menú
-    print(f"🔍 Buscando en campaña '{campania_id}' para: '{texto_mensaje}'")
-    resumen_cliente = memoria.obtener_resumen()
-    documentos_relevantes = rag.buscar_similares(texto_mensaje, top_k=3)
-    
-    print(f"📚 Documentos encontrados: {len(documentos_relevantes)}")
-    for i, doc in enumerate(documentos_relevantes):
-        print(f"  {i+1}. Documento: {doc.get('documento', 'N/A')} - Similitud: {doc.get('similitud', 0):.4f}")
-    
-    contexto = "\n\n".join([doc["texto"] for doc in documentos_relevantes])
-    
-    # Generar respuesta con LLM
-    respuesta_texto = rag.generar_respuesta_llm(
-        consulta=texto_mensaje,
-        contexto=contexto,
-        resumen_cliente=resumen_cliente
-    )
-    
-    # Guardar respuesta del bot en conversación
-    mensaje_bot = Conversacion(
-        cliente_id=cliente.id,
-        mensaje=respuesta_texto,
-        emisor=TipoEmisor.BOT
-    )
-    db.add(mensaje_bot)
-    db.commit()
-    
-    # Enviar respuesta al cliente
-    await enviar_mensaje_whatsapp(
-        telefono_destino=cliente.telefono,
-        mensaje=respuesta_texto,
-        token=whatsapp_token,
-        phone_number_id=phone_number_id
-    )
-    
-    # Actualizar memoria con la conversación
-    memoria.actualizar_resumen(texto_mensaje, respuesta_texto)
-    
-    return respuesta_texto
-
 async def procesar_comprobante_pedido(
-    db: Session,
-    empresa: Empresa,
+    db: AsyncSession,
+    empresa: EmpresaConfig,
     cliente: Cliente,
     comprobante_url: str,
     imagen_info: dict,
@@ -95,14 +32,14 @@ async def procesar_comprobante_pedido(
         estado=EstadoPedido.PENDIENTE
     )
     db.add(nuevo_pedido)
-    db.commit()
-    db.refresh(nuevo_pedido)
+    await db.commit()
+    await db.refresh(nuevo_pedido)
     
     # Guardar referencia del pedido en datos_estructurados del cliente
     if not cliente.datos_estructurados:
         cliente.datos_estructurados = {}
     cliente.datos_estructurados["ultimo_pedido_id"] = nuevo_pedido.id
-    db.commit()
+    await db.commit()
     
     # 🔥 Construir diccionario del pedido para WebSocket
     pedido_dict = {
@@ -155,8 +92,8 @@ async def procesar_comprobante_pedido(
     return nuevo_pedido
 
 async def aprobar_pedido(
-    db: Session,
-    empresa: Empresa,
+    db: AsyncSession,
+    empresa: EmpresaConfig,
     cliente_pendiente: Cliente,
     accion: str,
     whatsapp_token: str,
@@ -166,11 +103,11 @@ async def aprobar_pedido(
     Procesa la aprobación o rechazo del dueño para un pedido
     """
     # Obtener el pedido pendiente más reciente del cliente
-    pedido = db.query(Pedido).filter(
+    pedido = await db.scalar(select(Pedido).where(
         Pedido.cliente_id == cliente_pendiente.id,
         Pedido.empresa_id == empresa.id,
         Pedido.estado == EstadoPedido.PENDIENTE
-    ).order_by(Pedido.fecha_creacion.desc()).first()
+    ).order_by(Pedido.fecha_creacion.desc()).limit(1))
     
     if not pedido:
         print(f"⚠️ No se encontró pedido pendiente para cliente {cliente_pendiente.id}")
@@ -180,7 +117,7 @@ async def aprobar_pedido(
         # Actualizar estado del pedido
         pedido.estado = EstadoPedido.CONFIRMADO
         pedido.fecha_confirmacion = datetime.datetime.now()
-        db.commit()
+        await db.commit()
         
         # Enviar mensaje de confirmación al cliente
         mensaje_confirmacion = f"✅ ¡Pedido confirmado! Tu pedido ha sido aprobado. En breve lo estaremos preparando.\n\n📋 *Resumen:* {pedido.texto_pedido}\n💰 *Total pagado:* ${pedido.monto_total:.2f}"
@@ -194,7 +131,7 @@ async def aprobar_pedido(
     else:  # RECHAZAR
         # Actualizar estado del pedido
         pedido.estado = EstadoPedido.RECHAZADO
-        db.commit()
+        await db.commit()
         
         # Enviar mensaje de rechazo al cliente
         mensaje_rechazo = f"❌ Hubo un problema con tu comprobante o con tu pedido. Por favor, contacta al restaurante directamente para más detalles.\n\n📋 *Pedido:* {pedido.texto_pedido}\n💰 *Total:* ${pedido.monto_total:.2f}"
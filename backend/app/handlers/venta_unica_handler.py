@@ -1,86 +1,17 @@
 import datetime
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.models.cliente import Cliente
-from app.models.empresa import Empresa
+from app.services.empresa_cache import EmpresaConfig
 from app.models.documento import Documento
 from app.models.ventas import Venta, EstadoVenta
-from app.models.conversacion import Conversacion, TipoEmisor
 from app.services.rag import RAGService
-from app.services.memoria import MemoriaService
 from app.services.whatsapp_sender import enviar_mensaje_whatsapp, enviar_mensaje_con_botones
 from app.socket_manager import emitir_nueva_venta
 
-async def procesar_mensaje_venta_unica(
-    db: Session,
-    empresa: Empresa,
-    cliente: Cliente,
-    texto_mensaje: str,
-    imagen_info: dict,
-    audio_url: str,
-    campania_activa: str,
-    whatsapp_token: str,
-    phone_number_id: str
-):
-    """
-    Procesa un mensaje normal de venta única (respuesta RAG)
-    """
-    # Inicializar servicios
-    rag = RAGService(
-        db=db, 
-        empresa_id=empresa.id, 
-        cliente_id=cliente.id,
-        campania_id=campania_activa
-    )
-    memoria = MemoriaService(db, cliente.id)
-    
-    # Buscar documentos
-    print(f"🔍 Buscando documentos para: '{texto_mensaje}' con campaña '{campania_activa}'")
-    resumen_cliente = memoria.obtener_resumen()
-    documentos_relevantes = rag.buscar_similares(texto_mensaje, top_k=3)
-    
-    print(f"📚 Documentos encontrados: {len(documentos_relevantes)}")
-    for i, doc in enumerate(documentos_relevantes):
-        print(f"  {i+1}. Documento: {doc.get('documento', 'N/A')} - Similitud: {doc.get('similitud', 0):.4f}")
-        print(f"     Texto: {doc.get('texto', '')[:100]}...")
-    
-    contexto = "\n\n".join([doc["texto"] for doc in documentos_relevantes])
-    
-    respuesta_texto = rag.generar_respuesta_llm(
-        consulta=texto_mensaje,
-        contexto=contexto,
-        resumen_cliente=resumen_cliente
-    )
-    
-    if imagen_info:
-        respuesta_texto = "✅ ¡Gracias por enviar tu comprobante! Hemos notificado al asesor. En breve recibirás la confirmación. 😊"
-    elif audio_url:
-        respuesta_texto = f"🎤 He recibido tu audio. {respuesta_texto}"
-    
-    # Guardar respuesta del bot
-    mensaje_bot = Conversacion(
-        cliente_id=cliente.id,
-        mensaje=respuesta_texto,
-        emisor=TipoEmisor.BOT
-    )
-    db.add(mensaje_bot)
-    db.commit()
-    
-    # Enviar respuesta al cliente
-    await enviar_mensaje_whatsapp(
-        telefono_destino=cliente.telefono,
-        mensaje=respuesta_texto,
-        token=whatsapp_token,
-        phone_number_id=phone_number_id
-    )
-    
-    # Actualizar memoria
-    memoria.actualizar_resumen(texto_mensaje, respuesta_texto)
-    
-    return respuesta_texto
-
 async def procesar_comprobante_venta_unica(
-    db: Session,
-    empresa: Empresa,
+    db: AsyncSession,
+    empresa: EmpresaConfig,
     cliente: Cliente,
     url_comprobante: str,
     imagen_info: dict,
@@ -98,7 +29,7 @@ async def procesar_comprobante_venta_unica(
         "tipo": imagen_info["mime_type"]
     }
     cliente.datos_estructurados = datos_cliente
-    db.commit()
+    await db.commit()
     
     if empresa.telefono_dueño:
         texto_cabecera = (
@@ -118,8 +49,8 @@ async def procesar_comprobante_venta_unica(
     return True
 
 async def aprobar_venta_unica(
-    db: Session,
-    empresa: Empresa,
+    db: AsyncSession,
+    empresa: EmpresaConfig,
     cliente_pendiente: Cliente,
     accion: str,
     whatsapp_token: str,
@@ -145,10 +76,10 @@ async def aprobar_venta_unica(
         
         print(f"📦 Buscando mensaje de entrega para campaña: {campania_cliente}")
         
-        documento = db.query(Documento).filter(
+        documento = await db.scalar(select(Documento).where(
             Documento.empresa_id == empresa.id,
             Documento.campania_id == campania_cliente
-        ).first()
+        ).limit(1))
         
         if documento and documento.mensaje_entrega:
             mensaje_material = documento.mensaje_entrega
@@ -158,7 +89,7 @@ async def aprobar_venta_unica(
             precio_unitario = documento.precio if documento.precio else 0
             monto_total = cantidad * precio_unitario
             estado_valor = "confirmada"
-
+            
             nueva_venta = Venta(
                 empresa_id=empresa.id,
                 cliente_id=cliente_pendiente.id,
@@ -172,8 +103,8 @@ async def aprobar_venta_unica(
                 notas=f"Venta aprobada el {datetime.datetime.now()}"
             )
             db.add(nueva_venta)
-            db.commit()
-            db.refresh(nueva_venta)
+            await db.commit()
+            await db.refresh(nueva_venta)
             
             venta_dict = {
                 "id": nueva_venta.id,
@@ -195,10 +126,10 @@ async def aprobar_venta_unica(
             await emitir_nueva_venta(venta_dict, empresa.id)
             print(f"📡 Evento WebSocket emitido para venta ID: {nueva_venta.id}")
             print(f"💰 Venta registrada: {campania_cliente} - ${monto_total}")
-            
+        
         else:
             print(f"⚠️ No se encontró mensaje de entrega para campaña {campania_cliente}, usando legacy")
-            rag_temp = RAGService(db, empresa.id, cliente_pendiente.id, campania_cliente)
+            rag_temp = RAGService(db, empresa.id, cliente_pendiente.id, campania_cliente, empresa=empresa)
             mensaje_material = rag_temp.obtener_mensaje_entrega_legacy(campania_cliente)
         
         await enviar_mensaje_whatsapp(
@@ -207,7 +138,7 @@ async def aprobar_venta_unica(
             token=whatsapp_token,
             phone_number_id=phone_number_id
         )
-        
+    
     else:  # RECHAZAR
         datos["ultimo_comprobante"]["estado_pago"] = "rechazado"
         datos["ultimo_comprobante"]["fecha_rechazo"] = str(datetime.datetime.now())
@@ -220,6 +151,6 @@ async def aprobar_venta_unica(
         )
     
     cliente_pendiente.datos_estructurados = datos
-    db.commit()
+    await db.commit()
     
     return True
\ No newline at end of file
@@ -0,0 +1,676 @@
+import asyncio
+import datetime
+import re
+import json
+from typing import List, Optional, Tuple
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.services.empresa_cache import EmpresaConfig, obtener_empresa_por_phone_number_id, obtener_empresa_por_telefono
+from app.services.despachador import despachador
+from app.services.cola_webhook import encolar_evento
+from app.services.coalescedor import coalescedor
+from app.services.registro_conversaciones import registro_conversaciones
+from app.core.config import settings
+from app.db.base import AsyncSessionLocal
+from app.models.cliente import Cliente
+from app.models.documento import Documento
+from app.models.conversacion import Conversacion, TipoEmisor
+from app.models.comprobante import Comprobante
+from app.services.clientes_api import obtener_openai_async
+from app.services.medios import pipeline_medios
+from app.services.transcripciones import transcriptor
+from app.services.comprobantes import buscar_comprobante, contar_repeticion, estado_comprobante, registrar_comprobante
+from app.services.whatsapp_sender import enviar_mensaje_whatsapp
+from app.handlers.venta_unica_handler import procesar_comprobante_venta_unica, aprobar_venta_unica
+from app.handlers.pedido_handler import procesar_comprobante_pedido, aprobar_pedido
+from app.services.motor_conversacion import Turno, motor_conversacion
+
+ACUSE_COMPROBANTE_PEDIDO = "📷 ¡Recibimos tu comprobante! Estamos registrando tu pedido, en un momento te confirmamos."
+COMPROBANTE_FALLIDO = "⚠️ No pudimos procesar la imagen de tu comprobante. ¿Podrías enviarla de nuevo?"
+AUDIO_EN_PROCESO = "🎤 Estoy procesando tu audio, en un momento te respondo. 😊"
+# Respuesta a un comprobante reenviado según cómo quedó su pago (None: no se sabe)
+COMPROBANTE_REPETIDO = {
+    "pendiente": "✅ Ya habíamos recibido este comprobante y está en revisión, no hace falta enviarlo de nuevo. Te avisaremos apenas sea revisado. 😊",
+    "confirmado": "✅ Este comprobante ya fue revisado y tu pago está confirmado, no hace falta enviarlo de nuevo. 😊",
+    "rechazado": "❌ Este comprobante ya fue revisado y no pudo ser aprobado. Por favor, contacta a un asesor para más detalles.",
+    None: "✅ Ya habíamos recibido este comprobante, no hace falta enviarlo de nuevo. 😊"
+}
+
+def mensajes_del_webhook(body: dict) -> List[Tuple[dict, dict]]:
+    """
+    (value, mensaje) de todos los entries y changes del webhook: con carga Meta
+    agrupa varios mensajes (incluso de distintos números) en una sola entrega
+    """
+    return [
+        (change.get("value") or {}, msg)
+        for entry in body.get("entry") or []
+        for change in entry.get("changes") or []
+        for msg in (change.get("value") or {}).get("messages") or []
+    ]
+
+def tiene_statuses(body: dict) -> bool:
+    return any(
+        "statuses" in (change.get("value") or {})
+        for entry in body.get("entry") or []
+        for change in entry.get("changes") or []
+    )
+
+async def procesar_evento_webhook(db: AsyncSession, body: dict) -> dict:
+    """
+    Procesa un webhook de WhatsApp ya encolado (lo llaman los workers de la cola).
+    Atiende todos sus mensajes a la vez, salvo los del mismo cliente que van en orden.
+    Si alguno falla se propaga el error para que la cola reintente el evento: los que
+    ya se atendieron se descartan como duplicados.
+    """
+    if body.get("seguimiento"):
+        return await _procesar_seguimiento(db, body)
+    
+    mensajes = mensajes_del_webhook(body)
+    
+    # 🔥 NUEVO: Ignorar webhooks que no contengan mensajes de usuario (solo statuses)
+    if not mensajes:
+        # Verificar si hay statuses para no imprimir innecesariamente
+        if not tiene_statuses(body):
+            print("📩 Webhook sin mensajes ni statuses")
+        return {"status": "ok", "message": "Sin mensajes"}
+    
+    # La empresa de cada mensaje se resuelve antes de repartirlos (está cacheada)
+    trabajos = []
+    for value, msg in mensajes:
+        trabajos.append((await _empresa_del_webhook(db, value.get("metadata", {})), msg))
+    
+    if len(trabajos) == 1:
+        empresa, msg = trabajos[0]
+        return await _procesar_mensaje(empresa, msg, db)
+    
+    print(f"📦 Webhook con {len(trabajos)} mensajes")
+    # Cada mensaje con su propia sesión, y no más de WEBHOOK_CONCURRENCIA_LOTE a la vez
+    limite = asyncio.Semaphore(settings.WEBHOOK_CONCURRENCIA_LOTE)
+    resultados = await asyncio.gather(
+        *(_procesar_mensaje(empresa, msg, limite=limite) for empresa, msg in trabajos),
+        return_exceptions=True
+    )
+    
+    resumen = []
+    fallidos = []
+    for (empresa, msg), resultado in zip(trabajos, resultados):
+        if isinstance(resultado, BaseException):
+            fallidos.append(f"{msg.get('id')}: {type(resultado).__name__}: {resultado}")
+            resultado = {"status": "error", "error": str(resultado)}
+        resumen.append({"mensaje_id": msg.get("id"), **resultado})
+    
+    if fallidos:
+        print(f"❌ Fallaron {len(fallidos)} de {len(trabajos)} mensajes: {resumen}")
+        raise Exception(f"Fallaron {len(fallidos)} de {len(trabajos)} mensajes del webhook: " + "; ".join(fallidos))
+    return {"status": "ok", "mensajes": resumen}
+
+async def _empresa_del_webhook(db: AsyncSession, metadata: dict) -> Optional[EmpresaConfig]:
+    # 🔥 IDENTIFICAR EMPRESA POR PHONE_NUMBER_ID O DISPLAY_PHONE_NUMBER
+    phone_number_id = metadata.get("phone_number_id")
+    telefono_empresa = metadata.get("display_phone_number", "")
+    telefono_empresa = telefono_empresa.replace("+", "")
+    
+    # Buscar empresa por phone_number_id o por telefono_whatsapp (cacheado)
+    empresa = None
+    if phone_number_id:
+        empresa = await obtener_empresa_por_phone_number_id(db, phone_number_id)
+    
+    if not empresa and telefono_empresa:
+        empresa = await obtener_empresa_por_telefono(db, telefono_empresa)
+    
+    if not empresa:
+        print(f"⚠️ Empresa no encontrada para phone_number_id: {phone_number_id} o teléfono: {telefono_empresa}")
+    return empresa
+
+async def _procesar_mensaje(
+    empresa: Optional[EmpresaConfig],
+    msg: dict,
+    db: Optional[AsyncSession] = None,
+    limite: Optional[asyncio.Semaphore] = None
+) -> dict:
+    """Atiende un mensaje con la sesión dada o, sin ella, con una propia"""
+    if not empresa:
+        return {"status": "ok", "message": "Empresa no identificada"}
+    
+    async def atender():
+        if db is not None:
+            return await _atender_mensaje(db, empresa, msg)
+        async with limite, AsyncSessionLocal() as db_mensaje:
+            return await _atender_mensaje(db_mensaje, empresa, msg)
+    
+    # Mensajes del mismo cliente de a uno y en orden; clientes distintos en paralelo.
+    # Las re-entregas de Meta (mismo msg["id"]) se descartan sin procesarlas de nuevo.
+    # No hay awaits antes de ejecutar: los mensajes de un lote toman el turno en orden
+    resultado = await despachador.ejecutar(
+        (empresa.id, msg.get("from")),
+        atender,
+        mensaje_id=msg.get("id")
+    )
+    if resultado is None:
+        return {"status": "ok", "message": "Mensaje duplicado ignorado"}
+    return resultado
+
+async def _atender_mensaje(db: AsyncSession, empresa: EmpresaConfig, msg: dict) -> dict:
+    """Procesa un mensaje ya identificado (corre serializado por cliente)"""
+    telefono_cliente = msg.get("from")
+    
+    # 🔥 EXTRAER CREDENCIALES DE LA EMPRESA
+    whatsapp_token = empresa.whatsapp_token
+    groq_api_key = empresa.groq_api_key
+    phone_number_id = empresa.phone_number_id
+    
+    tipo_mensaje = msg.get("type", "text")
+    texto_mensaje = ""
+    imagen_info = None
+    audio_url = None
+    clave_audio = None
+    
+    # Detectar tipo de mensaje
+    if tipo_mensaje == "text":
+        texto_mensaje = msg.get("text", {}).get("body", "")
+        print(f"📝 Texto recibido: '{texto_mensaje}'")
+    elif tipo_mensaje == "image":
+        imagen_data = msg.get("image", {})
+        imagen_id = imagen_data.get("id")
+        if imagen_id:
+            texto_mensaje = "📷 [El cliente envió un comprobante de pago]"
+            imagen_info = {
+                "id": imagen_id,
+                "mime_type": imagen_data.get("mime_type"),
+                "sha256": imagen_data.get("sha256"),
+                "url": imagen_data.get("url")
+            }
+    elif tipo_mensaje == "audio":
+        audio_data = msg.get("audio", {})
+        audio_url = audio_data.get("url")
+        clave_audio = audio_data.get("sha256") or audio_data.get("id")
+        if audio_url:
+            texto_mensaje = "🎤 [El cliente envió un audio]"
+    elif tipo_mensaje == "interactive":
+        interactive_data = msg.get("interactive", {})
+        if interactive_data.get("type") == "button_reply":
+            button_reply = interactive_data.get("button_reply", {})
+            texto_mensaje = f"🔘 [Respuesta de botón: {button_reply.get('title')}]"
+            msg["callback_data"] = button_reply.get("id")
+    
+    # Detectar campaña desde el primer mensaje
+    campania_detectada = None
+    if tipo_mensaje == "text" and texto_mensaje:
+        print(f"🔍 Evaluando si es campaña: '{texto_mensaje}'")
+        
+        if texto_mensaje.startswith("campaña_"):
+            print("✅ ¡Empieza con 'campaña_'!")
+            partes = texto_mensaje.split("_", 1)
+            if len(partes) > 1:
+                campania_detectada = partes[1].strip().lower()
+                print(f"🎯 CAMPAÑA DETECTADA: '{campania_detectada}'")
+                texto_mensaje = ""
+        
+        elif "campaña=" in texto_mensaje:
+            print("✅ ¡Contiene 'campaña='!")
+            match = re.search(r'campaña=(\w+)', texto_mensaje)
+            if match:
+                campania_detectada = match.group(1).strip().lower()
+                print(f"🎯 CAMPAÑA DETECTADA: '{campania_detectada}'")
+                texto_mensaje = re.sub(r'campaña=\w+\s*', '', texto_mensaje).strip()
+        else:
+            print("❌ No es un mensaje de campaña")
+    
+    if not telefono_cliente or (not texto_mensaje and not imagen_info and not audio_url and not campania_detectada):
+        return {"status": "ok", "message": "Mensaje sin contenido"}
+    
+    # Buscar cliente existente
+    print(f"🔍 Buscando cliente con teléfono: {telefono_cliente}")
+    cliente = await db.scalar(select(Cliente).where(
+        Cliente.empresa_id == empresa.id,
+        Cliente.telefono == telefono_cliente
+    ).limit(1))
+    
+    if cliente:
+        print(f"👤 Cliente existente encontrado. Datos actuales: {cliente.datos_estructurados}")
+    else:
+        print("👤 Cliente no existe, se creará uno nuevo")
+    
+    # PROCESAR RESPUESTAS DEL DUEÑO
+    if empresa.telefono_dueño and telefono_cliente == empresa.telefono_dueño:
+        
+        if tipo_mensaje == "interactive" and msg.get("callback_data"):
+            callback_id = msg.get("callback_data")
+            
+            if callback_id.startswith("APROBAR_") or callback_id.startswith("RECHAZAR_"):
+                partes = callback_id.split("_")
+                accion = partes[0]
+                cliente_id = int(partes[1])
+                
+                cliente_pendiente = await db.scalar(select(Cliente).where(
+                    Cliente.id == cliente_id,
+                    Cliente.empresa_id == empresa.id
+                ).limit(1))
+                
+                if cliente_pendiente and cliente_pendiente.datos_estructurados:
+                    # Determinar si es pedido múltiple o venta única
+                    campania_cliente = cliente_pendiente.datos_estructurados.get("campania_activa")
+                    es_restaurante = False
+                    if campania_cliente:
+                        tipo_doc = await db.scalar(select(Documento.tipo_campania).where(
+                            Documento.empresa_id == empresa.id,
+                            Documento.campania_id == campania_cliente
+                        ).limit(1))
+                        if tipo_doc == "pedido_multiple":
+                            es_restaurante = True
+                    
+                    if es_restaurante:
+                        # Aprobar pedido múltiple
+                        await aprobar_pedido(db, empresa, cliente_pendiente, accion, whatsapp_token, phone_number_id)
+                    else:
+                        # Aprobar venta única
+                        datos = cliente_pendiente.datos_estructurados
+                        if datos.get("ultimo_comprobante", {}).get("estado_pago") == "pendiente":
+                            if accion == "APROBAR":
+                                await aprobar_venta_unica(db, empresa, cliente_pendiente, "APROBAR", whatsapp_token, phone_number_id)
+                            else:
+                                await aprobar_venta_unica(db, empresa, cliente_pendiente, "RECHAZAR", whatsapp_token, phone_number_id)
+                    
+                    return {"status": "ok", "message": f"Pago {accion} para cliente {cliente_id}"}
+        
+        return {"status": "ok", "message": "Formato no reconocido o cliente sin pago pendiente"}
+    
+    # Guardar/Actualizar cliente con campaña y limpiar historial
+    if not cliente:
+        datos_iniciales = {}
+        if campania_detectada:
+            datos_iniciales["campania_activa"] = campania_detectada
+            print(f"✅ GUARDANDO: Campaña {campania_detectada} en cliente NUEVO {telefono_cliente}")
+        
+        cliente = Cliente(
+            empresa_id=empresa.id,
+            telefono=telefono_cliente,
+            nombre=msg.get("profile", {}).get("name", ""),
+            resumen="Cliente nuevo",
+            datos_estructurados=datos_iniciales
+        )
+        db.add(cliente)
+        await db.commit()
+        await db.refresh(cliente)
+        print(f"🆔 Cliente creado con ID: {cliente.id}, datos: {cliente.datos_estructurados}")
+        
+        if campania_detectada:
+            conversaciones_eliminadas = (await db.execute(delete(Conversacion).where(
+                Conversacion.cliente_id == cliente.id
+            ))).rowcount
+            await db.commit()
+            print(f"🧹 Historial limpiado para cliente nuevo: {conversaciones_eliminadas} mensajes eliminados")
+    
+    else:
+        if campania_detectada:
+            print(f"🔄 ACTUALIZANDO: Cliente existente. Campaña detectada: {campania_detectada}")
+            # Lo que estaba esperando respuesta era de la campaña anterior
+            await coalescedor.descartar(db, (empresa.id, telefono_cliente))
+            
+            datos = cliente.datos_estructurados or {}
+            datos["campania_activa"] = campania_detectada
+            cliente.datos_estructurados = datos
+            
+            # 🔥 LIMPIAR HISTORIAL PARA PEDIDOS MÚLTIPLES TAMBIÉN (igual que ventas individuales)
+            # (incluidos los mensajes que todavía no se escribieron)
+            await registro_conversaciones.descartar(cliente.id)
+            conversaciones_eliminadas = (await db.execute(delete(Conversacion).where(
+                Conversacion.cliente_id == cliente.id
+            ))).rowcount
+            
+            cliente.resumen = f"Cliente nuevo - campaña {campania_detectada}"
+            
+            await db.commit()
+            await db.refresh(cliente)
+            print(f"✅ Campaña actualizada. Datos ahora: {cliente.datos_estructurados}")
+            print(f"🧹 Historial limpiado: {conversaciones_eliminadas} mensajes eliminados para cliente {cliente.id}")
+        else:
+            print(f"ℹ️ Cliente existente sin nueva campaña. Datos actuales: {cliente.datos_estructurados}")
+    
+    # Procesar audio si existe: la transcripción corre en el transcriptor y se espera
+    # hasta TRANSCRIPCION_ESPERA_SEGUNDOS; si tarda más se responde desde la cola
+    transcripcion_pendiente = False
+    if audio_url:
+        transcripcion = transcriptor.transcribir(empresa.id, clave_audio, audio_url, groq_api_key, whatsapp_token)
+        try:
+            await asyncio.wait_for(asyncio.shield(transcripcion), timeout=settings.TRANSCRIPCION_ESPERA_SEGUNDOS)
+            texto_mensaje = _texto_audio(transcripcion)
+        except asyncio.TimeoutError:
+            transcripcion_pendiente = True
+        except Exception:
+            texto_mensaje = _texto_audio(transcripcion)
+    
+    # Verificar el tipo de campaña del documento
+    campania_activa = None
+    if cliente.datos_estructurados:
+        campania_activa = cliente.datos_estructurados.get("campania_activa")
+    
+    tipo_campania = await _tipo_campania(db, empresa.id, campania_activa)
+    
+    es_restaurante = (tipo_campania == "pedido_multiple")
+    
+    # Procesar imagen (comprobante): la descarga y la subida a Cloudinary corren en
+    # segundo plano mientras se extrae el pedido o se responde al cliente
+    subida_comprobante = None
+    comprobante_previo = None
+    if imagen_info:
+        # La misma imagen ya procesada para este cliente: se reutiliza sin descargar, subir ni extraer el pedido
+        comprobante_previo = await buscar_comprobante(db, empresa.id, cliente.id, imagen_info.get("sha256"))
+    
+    if comprobante_previo:
+        await _comprobante_repetido(db, empresa, cliente, comprobante_previo)
+    elif imagen_info:
+        subida_comprobante = asyncio.create_task(pipeline_medios.subir_comprobante(
+            imagen_info.get("url"),
+            whatsapp_token,
+            empresa,
+            public_id=f"comprobante_{cliente.id}_{int(datetime.datetime.now().timestamp())}"
+        ))
+        
+        if es_restaurante:
+            await _comprobante_restaurante(db, empresa, cliente, imagen_info, campania_activa, subida_comprobante)
+    
+    if not texto_mensaje:
+        print("⏸️ No hay mensaje de texto, esperando siguiente interacción")
+        return {"status": "ok", "message": "Parámetro de campaña recibido, esperando mensaje del cliente"}
+    
+    # Los comprobantes se atienden al instante; el resto espera a ver si el cliente sigue escribiendo
+    agrupar = coalescedor.activo and not imagen_info
+    # Pedido múltiple o comprobante repetido: ya se procesó y no lleva respuesta adicional
+    sin_respuesta = (es_restaurante and imagen_info) or comprobante_previo
+    
+    # Lo que necesita un evento de seguimiento para terminar el turno desde la cola
+    seguimiento = {
+        "phone_number_id": phone_number_id,
+        "telefono": telefono_cliente,
+        "cliente_id": cliente.id,
+        "campania_id": campania_activa,
+        "audio_url": audio_url
+    }
+    
+    if transcripcion_pendiente:
+        # Se avisa al cliente y el mensaje se guarda y responde cuando llegue la transcripción
+        await enviar_mensaje_whatsapp(
+            telefono_destino=telefono_cliente,
+            mensaje=AUDIO_EN_PROCESO,
+            token=whatsapp_token,
+            phone_number_id=phone_number_id
+        )
+        evento_id = await encolar_evento(db, {**seguimiento, "seguimiento": "audio", "clave_audio": clave_audio})
+        return {"status": "ok", "cliente_id": cliente.id, "transcripcion_pendiente": evento_id}
+    
+    # El mensaje del cliente se guarda con la respuesta (MotorConversacion.responder),
+    # así un turno que falla y se reintenta no lo deja repetido
+    if sin_respuesta:
+        registro_conversaciones.registrar(cliente.id, texto_mensaje, TipoEmisor.CLIENTE)
+        print("📷 Comprobante ya procesado, no se envía respuesta adicional")
+        return {"status": "ok", "cliente_id": cliente.id}
+    
+    if agrupar:
+        evento_id = await coalescedor.agregar(
+            db,
+            (empresa.id, telefono_cliente),
+            texto_mensaje,
+            {**seguimiento, "seguimiento": "agrupado"}
+        )
+        return {"status": "ok", "cliente_id": cliente.id, "agrupado": evento_id}
+    
+    try:
+        await _responder(db, empresa, cliente, tipo_campania, texto_mensaje, imagen_info=imagen_info, audio_url=audio_url)
+    except BaseException:
+        # El turno se reintenta desde la cola y vuelve a subir la imagen: esta subida sobra
+        if subida_comprobante:
+            subida_comprobante.cancel()
+        raise
+    
+    if subida_comprobante:
+        # El cliente ya recibió la respuesta; se notifica al dueño cuando termina la subida
+        await _comprobante_venta_unica(db, empresa, cliente, imagen_info, subida_comprobante)
+    
+    return {"status": "ok", "cliente_id": cliente.id}
+
+async def _comprobante_restaurante(
+    db: AsyncSession,
+    empresa: EmpresaConfig,
+    cliente: Cliente,
+    imagen_info: dict,
+    campania_activa: Optional[str],
+    subida_comprobante: asyncio.Task
+):
+    """
+    Pedido múltiple: avisa al cliente que llegó el comprobante y extrae el pedido con
+    el LLM mientras termina la subida; con la URL se registra el Pedido. Si algo falla
+    (o se cancela) antes de esperar la subida, se cancela para no dejarla huérfana.
+    """
+    try:
+        (texto_pedido, monto_total), _ = await asyncio.gather(
+            _extraer_pedido(db, empresa, cliente, campania_activa),
+            enviar_mensaje_whatsapp(
+                telefono_destino=cliente.telefono,
+                mensaje=ACUSE_COMPROBANTE_PEDIDO,
+                token=empresa.whatsapp_token,
+                phone_number_id=empresa.phone_number_id
+            )
+        )
+        url_comprobante = await subida_comprobante
+        if not url_comprobante:
+            await _avisar_comprobante_fallido(empresa, cliente)
+            return
+        
+        print(f"🔍🔍🔍 DEBUG FIN - llamando a procesar_comprobante_pedido 🔍🔍🔍")
+        
+        nuevo_pedido = await procesar_comprobante_pedido(
+            db, empresa, cliente, url_comprobante, imagen_info, texto_pedido, monto_total, empresa.whatsapp_token, empresa.phone_number_id
+        )
+        await registrar_comprobante(db, empresa.id, cliente.id, imagen_info.get("sha256"), url_comprobante, pedido_id=nuevo_pedido.id)
+    except Exception as e:
+        print(f"❌ Error procesando comprobante del pedido: {e}")
+    finally:
+        if not subida_comprobante.done():
+            subida_comprobante.cancel()
+
+async def _extraer_pedido(db: AsyncSession, empresa: EmpresaConfig, cliente: Cliente, campania_activa: Optional[str]) -> Tuple[str, float]:
+    """Texto y monto total del pedido, extraídos por el LLM de la conversación del cliente"""
+    print(f"\n🔍🔍🔍 DEBUG INICIO - PROCESAMIENTO COMPROBANTE RESTAURANTE 🔍🔍🔍")
+    print(f"🔍 DEBUG: cliente.id = {cliente.id}")
+    print(f"🔍 DEBUG: campania_activa = {campania_activa}")
+    print(f"🔍 DEBUG: empresa.id = {empresa.id}")
+    
+    # Obtener todos los mensajes de la conversación (cliente y bot) desde que se activó la
+    # campaña: un pedido largo no entra en el historial reciente que se guarda en memoria
+    mensajes_conversacion = await registro_conversaciones.leer(db, cliente.id)
+    
+    print(f"🔍 DEBUG: mensajes_conversacion encontrados = {len(mensajes_conversacion)}")
+    for i, m in enumerate(mensajes_conversacion):
+        print(f"  DEBUG mensaje {i+1}: emisor={m.emisor.value}, texto={m.mensaje[:100]}")
+    
+    # Unir todos los mensajes en un solo texto con el formato "Cliente: ..." o "Bot: ..."
+    historial_completo = "\n".join([f"{'Cliente' if msg.emisor == TipoEmisor.CLIENTE else 'Bot'}: {msg.mensaje}" for msg in mensajes_conversacion])
+    
+    print(f"🔍 DEBUG: historial_completo LENGTH = {len(historial_completo)} caracteres")
+    print(f"🔍 DEBUG: historial_completo CONTENIDO:\n{historial_completo}")
+    
+    # Usar LLM para extraer el pedido y el total del historial completo
+    client_openai = obtener_openai_async(empresa.openai_api_key)
+    
+    prompt_extractor = f"""
+    Extrae el pedido y el monto total de la siguiente conversación entre el cliente y el bot:
+    
+    {historial_completo}
+    
+    Devuelve SOLO un JSON con esta estructura:
+    {{
+        "texto_pedido": "resumen del pedido",
+        "monto_total": numero
+    }}
+    
+    Si no hay un pedido claro, devuelve monto_total 0.
+    """
+    
+    print(f"🔍 DEBUG: prompt_extractor (primeros 500 chars): {prompt_extractor[:500]}...")
+    
+    respuesta_llm = await client_openai.chat.completions.create(
+        model=empresa.openai_chat_model or "gpt-4o",
+        messages=[{"role": "user", "content": prompt_extractor}],
+        temperature=0.2
+    )
+    
+    contenido = respuesta_llm.choices[0].message.content
+    print(f"🔍 DEBUG: respuesta_llm RAW = {contenido}")
+    
+    contenido = re.sub(r'```json\n?', '', contenido)
+    contenido = re.sub(r'```\n?', '', contenido)
+    
+    try:
+        datos_pedido = json.loads(contenido)
+        texto_pedido = datos_pedido.get("texto_pedido", "No se pudo determinar el pedido")
+        monto_total = float(datos_pedido.get("monto_total", 0))
+        print(f"🔍 DEBUG: texto_pedido extraído = {texto_pedido}")
+        print(f"🔍 DEBUG: monto_total extraído = {monto_total}")
+    except Exception as e:
+        print(f"🔍 DEBUG: ERROR parseando JSON: {e}")
+        texto_pedido = "No se pudo determinar el pedido"
+        monto_total = 0
+    
+    return texto_pedido, monto_total
+
+async def _comprobante_venta_unica(db: AsyncSession, empresa: EmpresaConfig, cliente: Cliente, imagen_info: dict, subida_comprobante: asyncio.Task):
+    """Venta única: el cliente ya tiene su respuesta; con la URL se notifica al dueño"""
+    try:
+        url_comprobante = await subida_comprobante
+        if not url_comprobante:
+            await _avisar_comprobante_fallido(empresa, cliente)
+            return
+        await procesar_comprobante_venta_unica(
+            db, empresa, cliente, url_comprobante, imagen_info, empresa.whatsapp_token, empresa.phone_number_id
+        )
+        await registrar_comprobante(db, empresa.id, cliente.id, imagen_info.get("sha256"), url_comprobante)
+    except Exception as e:
+        print(f"❌ Error procesando comprobante: {e}")
+
+async def _comprobante_repetido(db: AsyncSession, empresa: EmpresaConfig, cliente: Cliente, comprobante: Comprobante):
+    """El cliente reenvió una imagen ya procesada: se avisa al dueño en vez de registrar otro pedido"""
+    try:
+        estado = await estado_comprobante(db, cliente, comprobante)
+        veces = await contar_repeticion(db, comprobante)
+        print(f"♻️ Comprobante repetido (sha256 {comprobante.sha256[:12]}..., {veces} reenvíos, pago {estado or 'desconocido'}): {comprobante.url}")
+        
+        envios = [enviar_mensaje_whatsapp(
+            telefono_destino=cliente.telefono,
+            mensaje=COMPROBANTE_REPETIDO.get(estado, COMPROBANTE_REPETIDO[None]),
+            token=empresa.whatsapp_token,
+            phone_number_id=empresa.phone_number_id
+        )]
+        if empresa.telefono_dueño:
+            texto_aviso = (
+                f"⚠️ *COMPROBANTE REPETIDO*\n\n"
+                f"*Cliente:* {cliente.nombre or 'Desconocido'}\n"
+                f"*Teléfono:* {cliente.telefono}\n"
+                f"*Comprobante:* {comprobante.url}\n"
+                + (f"*Pedido:* #{comprobante.pedido_id}\n" if comprobante.pedido_id else "")
+                + (f"*Estado del pago:* {estado}\n" if estado else "")
+                + f"*Reenvíos:* {veces}\n\n"
+                f"No se registró un pedido nuevo."
+            )
+            envios.append(enviar_mensaje_whatsapp(
+                telefono_destino=empresa.telefono_dueño,
+                mensaje=texto_aviso,
+                token=empresa.whatsapp_token,
+                phone_number_id=empresa.phone_number_id
+            ))
+        await asyncio.gather(*envios)
+    except Exception as e:
+        print(f"❌ Error avisando comprobante repetido: {e}")
+
+async def _avisar_comprobante_fallido(empresa: EmpresaConfig, cliente: Cliente):
+    """El acuse ya salió: si la imagen no se pudo guardar se le pide al cliente que la reenvíe"""
+    await enviar_mensaje_whatsapp(
+        telefono_destino=cliente.telefono,
+        mensaje=COMPROBANTE_FALLIDO,
+        token=empresa.whatsapp_token,
+        phone_number_id=empresa.phone_number_id
+    )
+
+def _texto_audio(transcripcion: "asyncio.Future[str]") -> str:
+    """Mensaje del cliente para un audio ya transcrito (o que no se pudo transcribir)"""
+    if transcripcion.exception():
+        print(f"❌ Error procesando audio: {transcripcion.exception()}")
+        return "🎤 [Error al procesar el audio]"
+    print(f"📝 Transcripción: {transcripcion.result()}")
+    return f"🎤 [Audio transcrito]: {transcripcion.result()}"
+
+async def _tipo_campania(db: AsyncSession, empresa_id: int, campania_activa: Optional[str]) -> str:
+    """Tipo de campaña del documento de la campaña activa (producto_unico por defecto)"""
+    if not campania_activa:
+        return "producto_unico"
+    # Solo la columna: la cubre ix_documentos_empresa_campania
+    tipo_documento = await db.scalar(select(Documento.tipo_campania).where(
+        Documento.empresa_id == empresa_id,
+        Documento.campania_id == campania_activa
+    ).limit(1))
+    return tipo_documento or "producto_unico"
+
+async def _responder(
+    db: AsyncSession,
+    empresa: EmpresaConfig,
+    cliente: Cliente,
+    tipo_campania: str,
+    texto_mensaje: str,
+    imagen_info: Optional[dict] = None,
+    audio_url: Optional[str] = None,
+    mensajes_cliente: Optional[List[str]] = None
+):
+    """Responde con la estrategia del tipo de campaña"""
+    campania_activa = (cliente.datos_estructurados or {}).get("campania_activa")
+    await motor_conversacion.responder(tipo_campania, Turno(
+        db=db,
+        empresa=empresa,
+        cliente=cliente,
+        texto_mensaje=texto_mensaje,
+        campania_id=campania_activa,
+        whatsapp_token=empresa.whatsapp_token,
+        phone_number_id=empresa.phone_number_id,
+        imagen_info=imagen_info,
+        audio_url=audio_url,
+        mensajes_cliente=mensajes_cliente
+    ))
+
+async def _procesar_seguimiento(db: AsyncSession, datos: dict) -> dict:
+    """
+    Termina un turno que el handler dejó en la cola: los mensajes agrupados por el
+    coalescedor ("agrupado") o un audio cuya transcripción no llegó a tiempo
+    ("audio"). Un error se propaga para que la cola lo reintente como a cualquier
+    webhook, y se atiende en el despachador para no cruzarse con otros mensajes del
+    mismo cliente.
+    """
+    empresa = await obtener_empresa_por_phone_number_id(db, datos["phone_number_id"])
+    if not empresa:
+        return {"status": "ok", "message": "Empresa no identificada"}
+    
+    if datos["seguimiento"] == "audio":
+        # Se espera fuera del despachador: mientras tanto el cliente puede seguir escribiendo
+        transcripcion = transcriptor.transcribir(
+            empresa.id, datos.get("clave_audio"), datos["audio_url"], empresa.groq_api_key, empresa.whatsapp_token
+        )
+        await asyncio.wait([transcripcion])
+        texto = _texto_audio(transcripcion)
+    else:
+        texto = "\n".join(datos["textos"])
+        if len(datos["textos"]) > 1:
+            print(f"🧺 Respondiendo {len(datos['textos'])} mensajes agrupados")
+    
+    async def atender():
+        cliente = await db.get(Cliente, datos["cliente_id"])
+        if not cliente or (cliente.datos_estructurados or {}).get("campania_activa") != datos.get("campania_id"):
+            # El cliente cambió de campaña mientras tanto: lo pendiente era de la anterior
+            return {"status": "ok", "message": "Seguimiento de otra campaña descartado"}
+        
+        tipo_campania = await _tipo_campania(db, empresa.id, datos.get("campania_id"))
+        await _responder(
+            db, empresa, cliente, tipo_campania, texto,
+            audio_url=datos.get("audio_url"),
+            mensajes_cliente=datos.get("textos")
+        )
+        return {"status": "ok", "cliente_id": cliente.id, "seguimiento": datos["seguimiento"]}
+    
+    return await despachador.ejecutar((empresa.id, datos["telefono"]), atender)
@@ -1,14 +1,46 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.db.base import engine, Base
+from app.db.base import async_engine
+from app.db.migraciones import aplicar_migraciones
 from app.api.v1.endpoints import empresas, documentos, whatsapp, ventas, usuarios, auth, pedidos  
-from app.models import empresa, cliente, conversacion, documento 
+from app.models import empresa, cliente, conversacion, documento, evento_webhook, comprobante
 from app.socket_manager import socket_app  # 🔥 IMPORTAR
+from app.services.cache import cache_embeddings
+from app.services.cache_respuestas import respuestas_cacheadas
+from app.services.despachador import despachador
+from app.services.coalescedor import coalescedor
+from app.services.registro_conversaciones import registro_conversaciones
+from app.services.medios import pipeline_medios
+from app.services.transcripciones import transcriptor
+from app.services.clientes_api import cerrar_clientes
+from app.services.ingesta import cerrar_ingesta
+from app.utils.hilos import cerrar_hilos
+from app.services.cola_webhook import iniciar_workers, detener_workers
+from app.handlers.webhook_handler import procesar_evento_webhook
 
-# Crear tablas
-Base.metadata.create_all(bind=engine)
+# Crear/actualizar el esquema con las migraciones de Alembic
+aplicar_migraciones()
 
-app = FastAPI(title="Chatbot Sublimados API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Escritura por lotes de los mensajes y workers que procesan la cola de webhooks de WhatsApp
+    registro_conversaciones.iniciar()
+    iniciar_workers(procesar_evento_webhook)
+    yield
+    await detener_workers()
+    # Terminar los documentos que se están procesando (los de la cola quedan con error)
+    await asyncio.to_thread(cerrar_ingesta)
+    # Guardar los mensajes antes de cerrar las conexiones (lo agrupado o esperando una
+    # transcripción queda en la cola de webhooks)
+    await registro_conversaciones.cerrar()
+    # Cerrar las conexiones compartidas con OpenAI/Groq/Meta y la base
+    await cerrar_clientes()
+    await async_engine.dispose()
+    cerrar_hilos()
+
+app = FastAPI(title="Chatbot Sublimados API", lifespan=lifespan)
 
 # ✅ CORS CORRECTO
 app.add_middleware(
@@ -41,4 +73,16 @@ def read_root():
 
 @app.get("/health")
 def health_check():
-    return {"status": "ok"}
\ No newline at end of file
+    return {"status": "ok"}
+
+@app.get("/metricas/cache")
+def metricas_cache():
+    return {
+        "embeddings": cache_embeddings.estadisticas(),
+        "respuestas": respuestas_cacheadas.estadisticas(),
+        "despachador": despachador.estadisticas(),
+        "coalescencia": coalescedor.estadisticas(),
+        "conversaciones": registro_conversaciones.estadisticas(),
+        "medios": pipeline_medios.estadisticas(),
+        "transcripciones": transcriptor.estadisticas()
+    }
\ No newline at end of file
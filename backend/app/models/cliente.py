@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, JSON, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, Text, JSON, ForeignKey, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.mutable import MutableDict  # 🔥 IMPORTAR ESTO
@@ -21,5 +21,10 @@ class Cliente(Base):
     # Relación con empresa
     empresa = relationship("Empresa", backref="clientes")
 
+    # Cada mensaje del webhook busca el cliente por empresa y teléfono
+    __table_args__ = (
+        Index("ix_clientes_empresa_telefono", "empresa_id", "telefono"),
+    )
+
     def __repr__(self):
         return f"<Cliente {self.telefono} de empresa {self.empresa_id}>"
\ No newline at end of file
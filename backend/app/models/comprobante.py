@@ -0,0 +1,28 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, UniqueConstraint
+from sqlalchemy.sql import func
+from app.db.base import Base
+
+class Comprobante(Base):
+    """
+    Comprobantes de pago ya procesados, por el sha256 que WhatsApp manda con cada
+    imagen: si el cliente reenvía la misma imagen se reutiliza la URL y no se vuelve
+    a descargar, subir ni registrar otro pedido.
+    """
+    __tablename__ = "comprobantes"
+
+    id = Column(Integer, primary_key=True, index=True)
+    empresa_id = Column(Integer, ForeignKey("empresas.id"), nullable=False)
+    cliente_id = Column(Integer, ForeignKey("clientes.id"), nullable=False)
+    sha256 = Column(String(64), nullable=False)  # Hash de la imagen según WhatsApp
+    url = Column(String(500), nullable=False)  # URL del comprobante en Cloudinary
+    pedido_id = Column(Integer, ForeignKey("pedidos.id", ondelete="SET NULL"), nullable=True)  # Pedido múltiple que generó
+    veces_repetido = Column(Integer, default=0, nullable=False)  # Reenvíos de la misma imagen
+    fecha_creacion = Column(DateTime(timezone=True), server_default=func.now())
+
+    # Búsqueda del comprobante de un cliente por hash
+    __table_args__ = (
+        UniqueConstraint("empresa_id", "cliente_id", "sha256", name="uq_comprobantes_empresa_cliente_sha256"),
+    )
+
+    def __repr__(self):
+        return f"<Comprobante {self.id} - Cliente {self.cliente_id} - {self.sha256[:12]}>"
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Enum
+from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Enum, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.db.base import Base
@@ -21,5 +21,10 @@ class Conversacion(Base):
     # Relación con cliente
     cliente = relationship("Cliente", backref="mensajes")
 
+    # Historial de un cliente ordenado por fecha
+    __table_args__ = (
+        Index("ix_conversaciones_cliente_timestamp", "cliente_id", "timestamp"),
+    )
+
     def __repr__(self):
         return f"<Mensaje {self.emisor} a las {self.timestamp}>"
\ No newline at end of file
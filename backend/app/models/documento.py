@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Float
+from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Float, Index, UniqueConstraint
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.db.base import Base
@@ -12,7 +12,8 @@ class Documento(Base):
     # Identificador de la campaña (ej: "reposteria", "lettering")
     campania_id = Column(String(100), nullable=True, index=True)  
     nombre = Column(String(255), nullable=False)
-    hash_contenido = Column(String(64), unique=True)
+    # MD5 del archivo: el mismo PDF no se procesa dos veces para la misma empresa
+    hash_contenido = Column(String(64))
     fecha_subida = Column(DateTime(timezone=True), server_default=func.now())
     # Mensaje de entrega del producto
     mensaje_entrega = Column(Text, nullable=True)
@@ -25,6 +26,12 @@ class Documento(Base):
     empresa = relationship("Empresa", backref="documentos")
     chunks = relationship("ChunkDocumento", back_populates="documento", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        UniqueConstraint("empresa_id", "hash_contenido", name="uq_documentos_empresa_hash"),
+        # Tipo de la campaña activa de un cliente sin leer la tabla (index-only scan)
+        Index("ix_documentos_empresa_campania", "empresa_id", "campania_id", postgresql_include=["tipo_campania"]),
+    )
+
 class ChunkDocumento(Base):
     __tablename__ = "chunks_documento"
 
@@ -32,7 +39,17 @@ class ChunkDocumento(Base):
     documento_id = Column(Integer, ForeignKey("documentos.id"), nullable=False)
     indice = Column(Integer, nullable=False)
     texto = Column(Text, nullable=False)
+    # SHA-256 del modelo de embeddings + texto: permite reutilizar el embedding si el chunk no cambió
+    hash_texto = Column(String(64), nullable=True, index=True)
     embedding = Column(Vector(1536))
+    # Ubicación del chunk en el documento original (páginas desde 1, offsets sobre el texto completo)
+    pagina_inicio = Column(Integer, nullable=True)
+    pagina_fin = Column(Integer, nullable=True)
+    char_inicio = Column(Integer, nullable=True)
+    char_fin = Column(Integer, nullable=True)
     
     # Relaciones
-    documento = relationship("Documento", back_populates="chunks")
\ No newline at end of file
+    documento = relationship("Documento", back_populates="chunks")
+
+    # El índice HNSW (ix_chunks_documento_embedding_hnsw) se crea al arrancar solo con
+    # RAG_MODO_BUSQUEDA=pgvector: ver asegurar_indice_hnsw en app/db/migraciones.py
\ No newline at end of file
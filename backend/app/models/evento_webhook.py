@@ -0,0 +1,32 @@
+from sqlalchemy import Column, Integer, DateTime, Enum, Text, JSON, Index
+from sqlalchemy.sql import func
+from app.db.base import Base
+import enum
+
+class EstadoEvento(str, enum.Enum):
+    PENDIENTE = "pendiente"
+    PROCESANDO = "procesando"
+    FALLIDO = "fallido"  # agotó los reintentos (dead-letter)
+
+class EventoWebhook(Base):
+    """
+    Cola durable de webhooks de WhatsApp: el endpoint guarda el evento crudo y
+    responde al instante; los workers lo procesan y borran la fila al terminar.
+    """
+    __tablename__ = "eventos_webhook"
+
+    id = Column(Integer, primary_key=True, index=True)
+    payload = Column(JSON, nullable=False)  # Body tal cual lo envió Meta
+    estado = Column(Enum(EstadoEvento, values_callable=lambda obj: [e.value for e in obj]), default=EstadoEvento.PENDIENTE, nullable=False)
+    intentos = Column(Integer, default=0, nullable=False)
+    error = Column(Text, nullable=True)  # Último error al procesarlo
+    # Cuándo puede tomarlo un worker: reintento con backoff, o vencimiento de un worker que se cayó
+    proximo_intento = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    fecha_creacion = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_eventos_webhook_estado_proximo", "estado", "proximo_intento"),
+    )
+
+    def __repr__(self):
+        return f"<EventoWebhook {self.id} - {self.estado} ({self.intentos} intentos)>"
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Float, ForeignKey, Enum, Text
+from sqlalchemy import Column, Integer, String, DateTime, Float, ForeignKey, Enum, Text, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.db.base import Base
@@ -28,5 +28,10 @@ class Pedido(Base):
     empresa = relationship("Empresa", backref="pedidos")
     cliente = relationship("Cliente", backref="pedidos")
 
+    # Último pedido pendiente de un cliente (aprobación del dueño)
+    __table_args__ = (
+        Index("ix_pedidos_cliente_empresa_estado_fecha", "cliente_id", "empresa_id", "estado", "fecha_creacion"),
+    )
+
     def __repr__(self):
         return f"<Pedido {self.id} - Campaña {self.campania_id} - Total ${self.monto_total}>"
\ No newline at end of file
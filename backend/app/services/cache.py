@@ -0,0 +1,127 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from app.core.config import settings
+from app.db.redis import obtener_redis
+
+class CacheTTL:
+    """
+    Cache en proceso con vencimiento por TTL y desalojo LRU cuando se supera
+    la cantidad máxima de entradas. Es seguro usarlo desde varios hilos.
+    """
+    def __init__(self, max_entradas: int, ttl_segundos: float):
+        self.max_entradas = max_entradas
+        self.ttl_segundos = ttl_segundos
+        self._datos: "OrderedDict[Any, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obtener(self, clave, default=None):
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                return default
+            valor, vence = entrada
+            if vence < time.monotonic():
+                del self._datos[clave]
+                return default
+            self._datos.move_to_end(clave)
+            return valor
+
+    def guardar(self, clave, valor):
+        with self._lock:
+            self._datos[clave] = (valor, time.monotonic() + self.ttl_segundos)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_entradas:
+                self._datos.popitem(last=False)
+
+    def eliminar(self, clave):
+        with self._lock:
+            self._datos.pop(clave, None)
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+
+    def __len__(self):
+        return len(self._datos)
+
+class CacheEmbeddings:
+    """
+    Cache de embeddings de consultas indexado por (modelo, texto normalizado).
+    Primero busca en memoria y, si hay REDIS_URL, en Redis (compartido entre workers).
+    """
+    def __init__(self, max_entradas: int, ttl_segundos: int, prefijo: str = "emb:"):
+        self.local = CacheTTL(max_entradas, ttl_segundos)
+        self.ttl_segundos = ttl_segundos
+        self.prefijo = prefijo
+        self.aciertos_local = 0
+        self.aciertos_redis = 0
+        self.fallos = 0
+
+    @staticmethod
+    def normalizar(texto: str) -> str:
+        """'  Hola   ' y 'hola' comparten entrada"""
+        return " ".join(texto.casefold().split())
+
+    def _clave(self, modelo: str, texto: str) -> str:
+        digest = hashlib.sha256(f"{modelo}\x00{texto}".encode("utf-8")).hexdigest()
+        return f"{self.prefijo}{digest}"
+
+    def obtener(self, modelo: str, texto: str) -> Optional[List[float]]:
+        clave = self._clave(modelo, texto)
+
+        embedding = self.local.obtener(clave)
+        if embedding is not None:
+            self.aciertos_local += 1
+            return embedding
+
+        cliente_redis = obtener_redis()
+        if cliente_redis is not None:
+            try:
+                crudo = cliente_redis.get(clave)
+            except Exception as e:
+                print(f"⚠️ Redis no disponible para cache de embeddings: {e}")
+                crudo = None
+            if crudo:
+                embedding = np.frombuffer(crudo, dtype=np.float32).tolist()
+                self.local.guardar(clave, embedding)
+                self.aciertos_redis += 1
+                return embedding
+
+        self.fallos += 1
+        return None
+
+    def guardar(self, modelo: str, texto: str, embedding: List[float]):
+        clave = self._clave(modelo, texto)
+        self.local.guardar(clave, embedding)
+
+        cliente_redis = obtener_redis()
+        if cliente_redis is not None:
+            try:
+                cliente_redis.setex(
+                    clave,
+                    self.ttl_segundos,
+                    np.asarray(embedding, dtype=np.float32).tobytes()
+                )
+            except Exception as e:
+                print(f"⚠️ No se pudo guardar el embedding en Redis: {e}")
+
+    def estadisticas(self) -> Dict[str, Any]:
+        consultas = self.aciertos_local + self.aciertos_redis + self.fallos
+        return {
+            "entradas_local": len(self.local),
+            "aciertos_local": self.aciertos_local,
+            "aciertos_redis": self.aciertos_redis,
+            "fallos": self.fallos,
+            "tasa_aciertos": (self.aciertos_local + self.aciertos_redis) / consultas if consultas else 0.0
+        }
+
+cache_embeddings = CacheEmbeddings(
+    max_entradas=settings.EMBEDDING_CACHE_MAX_ENTRADAS,
+    ttl_segundos=settings.EMBEDDING_CACHE_TTL_SEGUNDOS
+)
@@ -0,0 +1,120 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+
+ClaveCampania = Tuple[int, Optional[str]]
+
+class _RespuestasCampania:
+    """Preguntas ya respondidas de una campaña: embeddings normalizados en una matriz fija (anillo)"""
+    def __init__(self, capacidad: int, dimension: int):
+        self.matriz = np.zeros((capacidad, dimension), dtype=np.float32)
+        self.respuestas: List[Optional[str]] = [None] * capacidad
+        self.creado = np.zeros(capacidad, dtype=np.float64)
+        self.cantidad = 0
+        self.siguiente = 0
+    
+    def agregar(self, vector: np.ndarray, respuesta: str):
+        self.matriz[self.siguiente] = vector
+        self.respuestas[self.siguiente] = respuesta
+        self.creado[self.siguiente] = time.monotonic()
+        self.siguiente = (self.siguiente + 1) % len(self.respuestas)
+        self.cantidad = min(self.cantidad + 1, len(self.respuestas))
+    
+    def mas_parecida(self, vector: np.ndarray, ttl_segundos: float) -> Tuple[Optional[str], float]:
+        if not self.cantidad:
+            return None, 0.0
+        similitudes = self.matriz[:self.cantidad] @ vector
+        # Las vencidas no cuentan
+        similitudes[self.creado[:self.cantidad] < time.monotonic() - ttl_segundos] = -1.0
+        mejor = int(np.argmax(similitudes))
+        return self.respuestas[mejor], float(similitudes[mejor])
+
+class CacheRespuestas:
+    """
+    Cache semántico de respuestas por (empresa, campaña): si una pregunta nueva tiene
+    similitud coseno >= `umbral` con otra ya respondida se reutiliza esa respuesta y no
+    se llama al LLM. Se invalida por campaña cuando cambian sus documentos. Solo se
+    guardan respuestas que no dependen del cliente (ver MotorConversacion._generar).
+    """
+    def __init__(self, umbral: float, max_por_campania: int, max_campanias: int, ttl_segundos: float):
+        self.umbral = umbral
+        self.max_por_campania = max_por_campania
+        self.max_campanias = max_campanias
+        self.ttl_segundos = ttl_segundos
+        self._campanias: "OrderedDict[ClaveCampania, _RespuestasCampania]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+    
+    @property
+    def activo(self) -> bool:
+        return self.max_por_campania > 0
+    
+    @staticmethod
+    def _normalizar(embedding: List[float]) -> Optional[np.ndarray]:
+        vector = np.array(embedding, dtype=np.float32)
+        norma = np.linalg.norm(vector)
+        return vector / norma if norma else None
+    
+    def buscar(self, empresa_id: int, campania_id: Optional[str], embedding: List[float]) -> Optional[str]:
+        """Respuesta a una pregunta equivalente, o None"""
+        vector = self._normalizar(embedding)
+        with self._lock:
+            campania = self._campanias.get((empresa_id, campania_id))
+            respuesta, similitud = (None, 0.0)
+            if campania is not None and vector is not None and campania.matriz.shape[1] == len(vector):
+                self._campanias.move_to_end((empresa_id, campania_id))
+                respuesta, similitud = campania.mas_parecida(vector, self.ttl_segundos)
+            
+            if respuesta is not None and similitud >= self.umbral:
+                self.aciertos += 1
+                print(f"🎯 Respuesta reutilizada del cache (similitud {similitud:.4f})")
+                return respuesta
+            self.fallos += 1
+            return None
+    
+    def guardar(self, empresa_id: int, campania_id: Optional[str], embedding: List[float], respuesta: str):
+        vector = self._normalizar(embedding)
+        if vector is None or not respuesta:
+            return
+        
+        clave = (empresa_id, campania_id)
+        with self._lock:
+            campania = self._campanias.get(clave)
+            if campania is None or campania.matriz.shape[1] != len(vector):
+                campania = self._campanias[clave] = _RespuestasCampania(self.max_por_campania, len(vector))
+            self._campanias.move_to_end(clave)
+            campania.agregar(vector, respuesta)
+            while len(self._campanias) > self.max_campanias:
+                self._campanias.popitem(last=False)
+    
+    def invalidar(self, empresa_id: int, campania_id: Optional[str] = None):
+        """
+        Olvida las respuestas de una campaña (o de toda la empresa sin campania_id).
+        La clave (empresa, None) mezcla todas las campañas, así que siempre se borra.
+        """
+        with self._lock:
+            for clave in list(self._campanias):
+                if clave[0] == empresa_id and (campania_id is None or clave[1] is None or clave[1] == campania_id):
+                    del self._campanias[clave]
+    
+    def estadisticas(self) -> Dict[str, Any]:
+        consultas = self.aciertos + self.fallos
+        return {
+            "campanias": len(self._campanias),
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "tasa_aciertos": round(self.aciertos / consultas, 4) if consultas else 0.0
+        }
+
+respuestas_cacheadas = CacheRespuestas(
+    umbral=settings.RESPUESTAS_CACHE_UMBRAL,
+    max_por_campania=settings.RESPUESTAS_CACHE_MAX_POR_CAMPANIA,
+    max_campanias=settings.RESPUESTAS_CACHE_MAX_CAMPANIAS,
+    ttl_segundos=settings.RESPUESTAS_CACHE_TTL_SEGUNDOS
+)
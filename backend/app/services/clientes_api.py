@@ -0,0 +1,135 @@
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import httpx
+from groq import AsyncGroq, Groq
+from openai import AsyncOpenAI, OpenAI
+
+from app.core.config import settings
+
+try:
+    import h2  # noqa: F401  (httpx necesita h2 para HTTP/2)
+    HTTP2_DISPONIBLE = True
+except ImportError:
+    HTTP2_DISPONIBLE = False
+
+# Conexiones keep-alive compartidas por todos los mensajes de un mismo proveedor
+LIMITES = httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=60)
+TIMEOUT_API = httpx.Timeout(60.0, connect=5.0)
+TIMEOUT_META = httpx.Timeout(10.0, connect=5.0)
+# Un cliente desalojado se cierra después de esto, cuando ya terminaron las llamadas que lo usaban
+ESPERA_CIERRE_SEGUNDOS = 300
+
+# LRU: las credenciales que ya no se usan (rotadas o de empresas borradas) salen primero
+_lock = threading.Lock()
+_clientes: "OrderedDict[tuple, object]" = OrderedDict()
+
+def _clave(tipo: str, *credenciales: Optional[str]) -> tuple:
+    """Clave del registro: no se guardan las API keys en claro como llaves del dict"""
+    huella = hashlib.sha256("\x00".join(c or "" for c in credenciales).encode("utf-8")).hexdigest()
+    return (tipo, huella)
+
+def _obtener(clave: tuple, crear):
+    desalojados = []
+    with _lock:
+        cliente = _clientes.get(clave)
+        if cliente is None:
+            cliente = crear()
+            _clientes[clave] = cliente
+            while len(_clientes) > settings.CLIENTES_API_MAX_ENTRADAS:
+                desalojados.append(_clientes.popitem(last=False)[1])
+        else:
+            _clientes.move_to_end(clave)
+    
+    for desalojado in desalojados:
+        _cerrar_mas_tarde(desalojado)
+    return cliente
+
+def _cerrar_mas_tarde(cliente):
+    """Cierra un cliente desalojado del registro sin cortar las llamadas en curso"""
+    if isinstance(cliente, (OpenAI, Groq)):
+        temporizador = threading.Timer(ESPERA_CIERRE_SEGUNDOS, cliente.close)
+        temporizador.daemon = True
+        temporizador.start()
+        return
+    
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        # Los clientes asíncronos se crean desde el event loop; sin él los libera el GC
+        return
+    loop.call_later(ESPERA_CIERRE_SEGUNDOS, lambda: loop.create_task(_cerrar(cliente)))
+
+async def _cerrar(cliente):
+    try:
+        if isinstance(cliente, httpx.AsyncClient):
+            await cliente.aclose()
+        elif isinstance(cliente, (AsyncOpenAI, AsyncGroq)):
+            await cliente.close()
+        else:
+            cliente.close()
+    except Exception as e:
+        print(f"⚠️ Error cerrando cliente {type(cliente).__name__}: {e}")
+
+def obtener_openai(api_key: str, base_url: Optional[str] = None) -> OpenAI:
+    """Cliente OpenAI síncrono reutilizable por credenciales de la empresa"""
+    return _obtener(
+        _clave("openai", api_key, base_url),
+        lambda: OpenAI(
+            api_key=api_key,
+            base_url=base_url or None,
+            http_client=httpx.Client(limits=LIMITES, timeout=TIMEOUT_API)
+        )
+    )
+
+def obtener_openai_async(api_key: str, base_url: Optional[str] = None) -> AsyncOpenAI:
+    """Cliente OpenAI asíncrono reutilizable por credenciales de la empresa"""
+    return _obtener(
+        _clave("openai_async", api_key, base_url),
+        lambda: AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url or None,
+            http_client=httpx.AsyncClient(limits=LIMITES, timeout=TIMEOUT_API)
+        )
+    )
+
+def obtener_groq(api_key: str) -> Groq:
+    """Cliente Groq síncrono reutilizable por API key"""
+    return _obtener(
+        _clave("groq", api_key),
+        lambda: Groq(api_key=api_key, http_client=httpx.Client(limits=LIMITES, timeout=TIMEOUT_API))
+    )
+
+def obtener_groq_async(api_key: str) -> AsyncGroq:
+    """Cliente Groq asíncrono reutilizable por API key"""
+    return _obtener(
+        _clave("groq_async", api_key),
+        lambda: AsyncGroq(api_key=api_key, http_client=httpx.AsyncClient(limits=LIMITES, timeout=TIMEOUT_API))
+    )
+
+def obtener_http_meta() -> httpx.AsyncClient:
+    """Cliente HTTP/2 compartido para graph.facebook.com (el token va en cada request)"""
+    return _obtener(
+        ("meta",),
+        lambda: httpx.AsyncClient(http2=HTTP2_DISPONIBLE, limits=LIMITES, timeout=TIMEOUT_META)
+    )
+
+def obtener_http() -> httpx.AsyncClient:
+    """Cliente HTTP compartido para descargar medios de WhatsApp"""
+    return _obtener(
+        ("http",),
+        lambda: httpx.AsyncClient(http2=HTTP2_DISPONIBLE, limits=LIMITES, timeout=TIMEOUT_API, follow_redirects=True)
+    )
+
+async def cerrar_clientes():
+    """Cierra todas las conexiones abiertas (se llama al apagar FastAPI)"""
+    with _lock:
+        clientes = list(_clientes.values())
+        _clientes.clear()
+    
+    for cliente in clientes:
+        await _cerrar(cliente)
+    print(f"🔌 {len(clientes)} clientes de APIs cerrados")
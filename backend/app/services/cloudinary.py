@@ -1,17 +1,112 @@
-import cloudinary
+import hashlib
+import os
+import tempfile
+import threading
+from pathlib import Path
 from cloudinary.uploader import upload
 from cloudinary.utils import cloudinary_url
-from typing import Optional, Dict
+from typing import BinaryIO, Optional, Dict, Union
 
-def configurar_cloudinary(cloud_name: str, api_key: str, api_secret: str):
+from app.core.config import settings
+
+CARPETA_COMPROBANTES = "comprobantes_pago"
+
+class SubidorCloudinary:
+    """
+    Sube imágenes a la cuenta de Cloudinary de una empresa.
+    Las credenciales van en cada llamada al SDK y nunca en `cloudinary.config`, así
+    subidores de empresas distintas se usan a la vez desde el pool de hilos sin que
+    un comprobante termine en la cuenta de otra empresa.
+    """
+    def __init__(self, cloud_name: str, api_key: str, api_secret: str):
+        self.cloud_name = cloud_name
+        self._credenciales = {"cloud_name": cloud_name, "api_key": api_key, "api_secret": api_secret}
+    
+    def subir(self, origen: Union[str, bytes, BinaryIO], public_id: Optional[str] = None) -> Optional[Dict]:
+        """Sube una URL pública, bytes o un archivo abierto; None si falla"""
+        try:
+            resultado = upload(
+                origen,
+                public_id=public_id,
+                folder=CARPETA_COMPROBANTES,
+                overwrite=True,
+                resource_type="image",
+                **self._credenciales
+            )
+            return {
+                "public_id": resultado["public_id"],
+                "url": resultado["secure_url"],
+                "formato": resultado["format"],
+                "tamano": resultado["bytes"]
+            }
+        except Exception as e:
+            print(f"❌ Error subiendo imagen a Cloudinary: {e}")
+            return None
+    
+    def url(self, public_id: str, **options) -> str:
+        url, _ = cloudinary_url(public_id, **self._credenciales, **options)
+        return url
+
+class SubidorLocal:
     """
-    Configura Cloudinary con las credenciales de una empresa específica.
+    Backend falso para pruebas y desarrollo (MEDIOS_BACKEND=local): guarda las imágenes
+    en `directorio/<cloud_name>/comprobantes_pago` y devuelve URLs file://. Responde
+    con el mismo diccionario que SubidorCloudinary.
     """
-    cloudinary.config(
-        cloud_name=cloud_name,
-        api_key=api_key,
-        api_secret=api_secret
-    )
+    FIRMAS = {b"\xff\xd8\xff": "jpg", b"\x89PNG": "png", b"RIFF": "webp", b"%PDF": "pdf"}
+    
+    def __init__(self, directorio: str, cloud_name: str):
+        self.cloud_name = cloud_name
+        self.carpeta = Path(directorio).resolve() / (cloud_name or "sin_cuenta") / CARPETA_COMPROBANTES
+    
+    def subir(self, origen: Union[str, bytes, BinaryIO], public_id: Optional[str] = None) -> Optional[Dict]:
+        try:
+            if isinstance(origen, str):
+                raise ValueError("el backend local no descarga URLs")
+            contenido = origen if isinstance(origen, bytes) else origen.read()
+            formato = next((f for firma, f in self.FIRMAS.items() if contenido.startswith(firma)), "bin")
+            public_id = public_id or hashlib.sha256(contenido).hexdigest()[:20]
+            
+            self.carpeta.mkdir(parents=True, exist_ok=True)
+            destino = self.carpeta / f"{public_id}.{formato}"
+            # Se escribe aparte y se renombra: nunca queda un archivo a medias
+            descriptor, temporal = tempfile.mkstemp(dir=self.carpeta)
+            with os.fdopen(descriptor, "wb") as archivo:
+                archivo.write(contenido)
+            os.replace(temporal, destino)
+            
+            return {
+                "public_id": f"{CARPETA_COMPROBANTES}/{public_id}",
+                "url": destino.as_uri(),
+                "formato": formato,
+                "tamano": len(contenido)
+            }
+        except Exception as e:
+            print(f"❌ Error guardando imagen en el almacenamiento local: {e}")
+            return None
+    
+    def url(self, public_id: str, **options) -> str:
+        coincidencias = sorted(self.carpeta.parent.glob(f"{public_id}.*"))
+        return coincidencias[0].as_uri() if coincidencias else (self.carpeta.parent / public_id).as_uri()
+
+Subidor = Union[SubidorCloudinary, SubidorLocal]
+
+_lock = threading.Lock()
+_subidores: Dict[tuple, Subidor] = {}
+
+def obtener_subidor(cloud_name: str, api_key: str, api_secret: str) -> Subidor:
+    """Subidor de la empresa (uno por credenciales) según MEDIOS_BACKEND"""
+    huella = hashlib.sha256("\x00".join(c or "" for c in (cloud_name, api_key, api_secret)).encode("utf-8")).hexdigest()
+    clave = (settings.MEDIOS_BACKEND, huella)
+    with _lock:
+        subidor = _subidores.get(clave)
+        if subidor is None:
+            if settings.MEDIOS_BACKEND == "local":
+                subidor = SubidorLocal(settings.MEDIOS_DIRECTORIO_LOCAL, cloud_name)
+            else:
+                subidor = SubidorCloudinary(cloud_name, api_key, api_secret)
+            _subidores[clave] = subidor
+        return subidor
 
 def subir_imagen_desde_url(
     url_imagen: str,
@@ -24,54 +119,20 @@ def subir_imagen_desde_url(
     Sube una imagen a Cloudinary proporcionando una URL pública.
     Nota: No funciona con URLs protegidas de WhatsApp (requieren token).
     """
-    try:
-        configurar_cloudinary(cloud_name, api_key, api_secret)
-        resultado = upload(
-            url_imagen,
-            public_id=public_id,
-            folder="comprobantes_pago",
-            overwrite=True,
-            resource_type="image"
-        )
-        return {
-            "public_id": resultado["public_id"],
-            "url": resultado["secure_url"],
-            "formato": resultado["format"],
-            "tamano": resultado["bytes"]
-        }
-    except Exception as e:
-        print(f"❌ Error subiendo imagen a Cloudinary desde URL: {e}")
-        return None
+    return obtener_subidor(cloud_name, api_key, api_secret).subir(url_imagen, public_id=public_id)
 
 def subir_imagen_desde_bytes(
-    imagen_bytes: bytes,
+    imagen_bytes: Union[bytes, BinaryIO],
     cloud_name: str,
     api_key: str,
     api_secret: str,
     public_id: Optional[str] = None
 ) -> Optional[Dict]:
     """
-    Sube el contenido binario (bytes) de una imagen a Cloudinary.
+    Sube el contenido binario (bytes o un archivo abierto) de una imagen a Cloudinary.
     Esta es la función que usaremos para las imágenes de WhatsApp.
     """
-    try:
-        configurar_cloudinary(cloud_name, api_key, api_secret)
-        resultado = upload(
-            imagen_bytes,
-            public_id=public_id,
-            folder="comprobantes_pago",
-            overwrite=True,
-            resource_type="image"
-        )
-        return {
-            "public_id": resultado["public_id"],
-            "url": resultado["secure_url"],
-            "formato": resultado["format"],
-            "tamano": resultado["bytes"]
-        }
-    except Exception as e:
-        print(f"❌ Error subiendo imagen a Cloudinary desde bytes: {e}")
-        return None
+    return obtener_subidor(cloud_name, api_key, api_secret).subir(imagen_bytes, public_id=public_id)
 
 def obtener_url_imagen(
     public_id: str,
@@ -83,6 +144,4 @@ def obtener_url_imagen(
     """
     Genera una URL optimizada para una imagen ya subida.
     """
-    configurar_cloudinary(cloud_name, api_key, api_secret)
-    url, _ = cloudinary_url(public_id, **options)
-    return url
\ No newline at end of file
+    return obtener_subidor(cloud_name, api_key, api_secret).url(public_id, **options)
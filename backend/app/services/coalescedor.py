@@ -0,0 +1,87 @@
+import time
+from typing import Dict, Hashable, List
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.services.cache import CacheTTL
+from app.services.cola_webhook import cancelar_evento, encolar_evento, posponer_evento
+
+class _Pendiente:
+    def __init__(self, evento_id: int, textos: List[str], datos: dict):
+        self.evento_id = evento_id
+        self.textos = textos
+        self.datos = datos
+        self.primero = time.monotonic()
+
+class Coalescedor:
+    """
+    Agrupa los mensajes seguidos de una conversación ("hola" / "quiero info" /
+    "del curso de repostería") y los responde juntos con una sola búsqueda y una
+    sola llamada al LLM.
+    
+    La espera vive en la cola de webhooks: el primer mensaje encola un evento de
+    seguimiento programado para dentro de `ventana_segundos` y cada mensaje nuevo le
+    suma su texto y lo pospone, hasta un máximo de `max_segundos` desde el primero
+    para no demorar de más a quien escribe sin parar. La respuesta la genera un
+    worker como cualquier evento (con reintentos y dead-letter), así un error o un
+    reinicio no pierde los mensajes.
+    """
+    def __init__(self, ventana_segundos: float, max_segundos: float, max_conversaciones: int = 100000):
+        self.ventana_segundos = ventana_segundos
+        self.max_segundos = max(max_segundos, ventana_segundos)
+        # Conversación -> evento que la va a responder. Vence con la ventana: pasado
+        # ese plazo el evento ya se tomó y el próximo mensaje abre otro
+        self._pendientes = CacheTTL(max_conversaciones, self.max_segundos)
+        self.mensajes = 0
+        self.eventos = 0
+    
+    @property
+    def activo(self) -> bool:
+        return self.ventana_segundos > 0
+    
+    async def agregar(self, db: AsyncSession, clave: Hashable, texto: str, datos: dict) -> int:
+        """
+        Suma `texto` a la conversación `clave` y devuelve el ID del evento que la va a
+        responder. `datos` es el payload del mensaje: se combina con el de los mensajes
+        anteriores (un campo que el último trae en None, como el audio_url de un texto
+        después de una nota de voz, conserva el valor anterior) y los textos acumulados
+        van en payload["textos"].
+        """
+        self.mensajes += 1
+        pendiente = self._pendientes.obtener(clave)
+        if pendiente is not None:
+            textos = pendiente.textos + [texto]
+            combinados = {**pendiente.datos, **{campo: valor for campo, valor in datos.items() if valor is not None}}
+            restante = pendiente.primero + self.max_segundos - time.monotonic()
+            espera = max(min(self.ventana_segundos, restante), 0)
+            if await posponer_evento(db, pendiente.evento_id, {**combinados, "textos": textos}, espera):
+                pendiente.textos = textos
+                pendiente.datos = combinados
+                self._pendientes.guardar(clave, pendiente)
+                return pendiente.evento_id
+        
+        # Primer mensaje, o un worker ya tomó el evento anterior: se abre otra ventana
+        evento_id = await encolar_evento(db, {**datos, "textos": [texto]}, self.ventana_segundos)
+        self._pendientes.guardar(clave, _Pendiente(evento_id, [texto], datos))
+        self.eventos += 1
+        return evento_id
+    
+    async def descartar(self, db: AsyncSession, clave: Hashable):
+        """Olvida lo acumulado (por ejemplo si el cliente cambió de campaña)"""
+        pendiente = self._pendientes.obtener(clave)
+        self._pendientes.eliminar(clave)
+        if pendiente is not None:
+            await cancelar_evento(db, pendiente.evento_id)
+    
+    def estadisticas(self) -> Dict[str, int]:
+        return {
+            "conversaciones_en_espera": len(self._pendientes),
+            "mensajes_recibidos": self.mensajes,
+            "respuestas_encoladas": self.eventos
+        }
+
+coalescedor = Coalescedor(
+    ventana_segundos=settings.COALESCENCIA_SEGUNDOS,
+    max_segundos=settings.COALESCENCIA_MAX_SEGUNDOS
+)
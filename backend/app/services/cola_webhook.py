@@ -0,0 +1,201 @@
+import asyncio
+import datetime
+import traceback
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db.base import AsyncSessionLocal
+from app.models.evento_webhook import EventoWebhook, EstadoEvento
+
+# Función que procesa el body de un webhook con su propia sesión
+Procesador = Callable[[AsyncSession, dict], Awaitable[dict]]
+
+# Tiempo máximo para procesar un evento: por debajo del plazo de reserva, así otro
+# worker solo lo retoma si el que lo tenía se cayó (no si está tardando)
+LIMITE_PROCESAMIENTO_SEGUNDOS = settings.WEBHOOK_TIMEOUT_PROCESAMIENTO_SEGUNDOS * 0.8
+
+# Despierta a los workers apenas se encola un evento (sin esperar al próximo sondeo)
+_hay_eventos = asyncio.Event()
+_workers: List[asyncio.Task] = []
+
+async def encolar_evento(db: AsyncSession, payload: dict, demora_segundos: float = 0) -> int:
+    """
+    Guarda el webhook crudo (o un evento de seguimiento del handler) en la cola y
+    devuelve su ID. Con `demora_segundos` ningún worker lo toma antes de ese plazo.
+    """
+    evento = EventoWebhook(payload=payload, estado=EstadoEvento.PENDIENTE, intentos=0)
+    if demora_segundos:
+        evento.proximo_intento = func.now() + datetime.timedelta(seconds=demora_segundos)
+    db.add(evento)
+    await db.commit()
+    _hay_eventos.set()
+    return evento.id
+
+def _sin_tomar(evento_id: int):
+    # Pendiente y nunca intentado: ningún worker lo tiene ni lo tuvo
+    return (
+        EventoWebhook.id == evento_id,
+        EventoWebhook.estado == EstadoEvento.PENDIENTE,
+        EventoWebhook.intentos == 0
+    )
+
+async def posponer_evento(db: AsyncSession, evento_id: int, payload: dict, demora_segundos: float) -> bool:
+    """
+    Reemplaza el payload de un evento que todavía no tomó ningún worker y lo corre
+    `demora_segundos` desde ahora. False si ya se tomó (o no existe).
+    """
+    resultado = await db.execute(
+        update(EventoWebhook).where(*_sin_tomar(evento_id)).values(
+            payload=payload,
+            proximo_intento=func.now() + datetime.timedelta(seconds=demora_segundos)
+        )
+    )
+    await db.commit()
+    return resultado.rowcount == 1
+
+async def cancelar_evento(db: AsyncSession, evento_id: int) -> bool:
+    """Borra un evento que todavía no tomó ningún worker. False si ya se tomó"""
+    resultado = await db.execute(delete(EventoWebhook).where(*_sin_tomar(evento_id)))
+    await db.commit()
+    return resultado.rowcount == 1
+
+async def _tomar_evento() -> Optional[Tuple[int, dict, int]]:
+    """
+    Reserva el próximo evento listo. FOR UPDATE SKIP LOCKED permite varios workers
+    (y varias réplicas de la API) sin que dos tomen el mismo evento. Mientras se
+    procesa, proximo_intento marca el vencimiento: si el worker se cae, otro lo
+    retoma después (entrega al menos una vez). Si ya se tomó WEBHOOK_MAX_INTENTOS
+    veces sin terminar (tira abajo al worker) pasa a fallido en vez de volver a tomarse.
+    """
+    async with AsyncSessionLocal() as db:
+        while True:
+            evento = await db.scalar(
+                select(EventoWebhook).where(
+                    EventoWebhook.estado.in_([EstadoEvento.PENDIENTE, EstadoEvento.PROCESANDO]),
+                    EventoWebhook.proximo_intento <= func.now()
+                ).order_by(EventoWebhook.proximo_intento).limit(1).with_for_update(skip_locked=True)
+            )
+            if not evento:
+                return None
+            if evento.intentos < settings.WEBHOOK_MAX_INTENTOS:
+                break
+            
+            evento.estado = EstadoEvento.FALLIDO
+            evento.error = evento.error or f"Se tomó {evento.intentos} veces sin terminar de procesarse"
+            await db.commit()
+            print(f"☠️ Evento {evento.id} pasó a fallidos: se tomó {evento.intentos} veces sin terminar")
+        
+        tomado = (evento.id, evento.payload, evento.intentos + 1)
+        evento.estado = EstadoEvento.PROCESANDO
+        evento.intentos = tomado[2]
+        evento.proximo_intento = func.now() + datetime.timedelta(seconds=settings.WEBHOOK_TIMEOUT_PROCESAMIENTO_SEGUNDOS)
+        await db.commit()
+        return tomado
+
+async def _terminar_evento(evento_id: int):
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(EventoWebhook).where(EventoWebhook.id == evento_id))
+        await db.commit()
+
+async def _registrar_fallo(evento_id: int, intentos: int, error: Exception):
+    """Reprograma el evento con backoff exponencial o lo pasa a fallido (dead-letter)"""
+    async with AsyncSessionLocal() as db:
+        evento = await db.get(EventoWebhook, evento_id)
+        if not evento:
+            return
+        
+        evento.error = f"{type(error).__name__}: {error}"
+        if intentos >= settings.WEBHOOK_MAX_INTENTOS:
+            evento.estado = EstadoEvento.FALLIDO
+            print(f"☠️ Evento {evento_id} pasó a fallidos después de {intentos} intentos")
+        else:
+            espera = min(settings.WEBHOOK_REINTENTO_BASE_SEGUNDOS * 2 ** (intentos - 1), 3600)
+            evento.estado = EstadoEvento.PENDIENTE
+            evento.proximo_intento = func.now() + datetime.timedelta(seconds=espera)
+            print(f"🔁 Evento {evento_id} se reintenta en {espera}s (intento {intentos})")
+        await db.commit()
+
+async def _procesar_con_sesion(procesar: Procesador, payload: dict) -> dict:
+    async with AsyncSessionLocal() as db:
+        return await procesar(db, payload)
+
+async def _worker(numero: int, procesar: Procesador):
+    while True:
+        _hay_eventos.clear()
+        try:
+            tomado = await _tomar_evento()
+        except Exception as e:
+            print(f"❌ Worker {numero}: error leyendo la cola de webhooks: {e}")
+            tomado = None
+        
+        if tomado is None:
+            # Nada listo: esperar un aviso del endpoint o el próximo sondeo (reintentos)
+            try:
+                await asyncio.wait_for(_hay_eventos.wait(), timeout=settings.WEBHOOK_POLL_SEGUNDOS)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        
+        evento_id, payload, intentos = tomado
+        try:
+            try:
+                resultado = await asyncio.wait_for(
+                    _procesar_con_sesion(procesar, payload),
+                    timeout=LIMITE_PROCESAMIENTO_SEGUNDOS
+                )
+            except asyncio.TimeoutError:
+                raise TimeoutError(f"El procesamiento superó {LIMITE_PROCESAMIENTO_SEGUNDOS:.0f}s")
+        except Exception as e:
+            print(f"❌ Error procesando evento {evento_id}: {e}")
+            traceback.print_exc()
+            try:
+                await _registrar_fallo(evento_id, intentos, e)
+            except Exception as e_registro:
+                # Queda en "procesando" y se retoma cuando venza
+                print(f"❌ No se pudo registrar el fallo del evento {evento_id}: {e_registro}")
+            continue
+        
+        try:
+            await _terminar_evento(evento_id)
+        except Exception as e:
+            print(f"❌ No se pudo cerrar el evento {evento_id}: {e}")
+        print(f"✅ Evento {evento_id} procesado: {resultado}")
+
+def iniciar_workers(procesar: Procesador):
+    """Arranca los workers de la cola (desde el lifespan de FastAPI)"""
+    for numero in range(settings.WEBHOOK_WORKERS):
+        _workers.append(asyncio.create_task(_worker(numero, procesar)))
+    print(f"🚀 {settings.WEBHOOK_WORKERS} workers de webhooks iniciados")
+
+async def detener_workers():
+    """
+    Cancela los workers. Un evento a medio procesar queda en "procesando"
+    y otro worker lo retoma cuando vence su plazo.
+    """
+    for tarea in _workers:
+        tarea.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+
+async def listar_fallidos(db: AsyncSession, limite: int = 100) -> List[EventoWebhook]:
+    return (await db.scalars(
+        select(EventoWebhook).where(
+            EventoWebhook.estado == EstadoEvento.FALLIDO
+        ).order_by(EventoWebhook.id.desc()).limit(limite)
+    )).all()
+
+async def reintentar_evento(db: AsyncSession, evento_id: int) -> bool:
+    """Devuelve un evento fallido a la cola con los intentos en cero"""
+    evento = await db.get(EventoWebhook, evento_id)
+    if not evento or evento.estado != EstadoEvento.FALLIDO:
+        return False
+    
+    evento.estado = EstadoEvento.PENDIENTE
+    evento.intentos = 0
+    evento.proximo_intento = func.now()
+    await db.commit()
+    _hay_eventos.set()
+    return True
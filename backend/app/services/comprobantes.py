@@ -0,0 +1,75 @@
+from typing import Optional
+
+from sqlalchemy import select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.cliente import Cliente
+from app.models.comprobante import Comprobante
+from app.models.pedido import Pedido
+from app.models.ventas import EstadoVenta, Venta
+
+async def buscar_comprobante(db: AsyncSession, empresa_id: int, cliente_id: int, sha256: Optional[str]) -> Optional[Comprobante]:
+    """Comprobante ya procesado con la misma imagen para el cliente, o None"""
+    if not sha256:
+        return None
+    return await db.scalar(select(Comprobante).where(
+        Comprobante.empresa_id == empresa_id,
+        Comprobante.cliente_id == cliente_id,
+        Comprobante.sha256 == sha256
+    ))
+
+async def registrar_comprobante(
+    db: AsyncSession,
+    empresa_id: int,
+    cliente_id: int,
+    sha256: Optional[str],
+    url: str,
+    pedido_id: Optional[int] = None
+):
+    """
+    Guarda el comprobante recién subido. Si otro proceso ya guardó la misma imagen
+    se conserva el primero (ON CONFLICT DO NOTHING).
+    """
+    if not sha256:
+        return
+    await db.execute(insert(Comprobante).values(
+        empresa_id=empresa_id,
+        cliente_id=cliente_id,
+        sha256=sha256,
+        url=url,
+        pedido_id=pedido_id,
+        veces_repetido=0
+    ).on_conflict_do_nothing(constraint="uq_comprobantes_empresa_cliente_sha256"))
+    await db.commit()
+
+async def contar_repeticion(db: AsyncSession, comprobante: Comprobante) -> int:
+    """Suma un reenvío de la imagen y devuelve cuántas veces se repitió"""
+    veces = await db.scalar(update(Comprobante).where(
+        Comprobante.id == comprobante.id
+    ).values(veces_repetido=Comprobante.veces_repetido + 1).returning(Comprobante.veces_repetido))
+    await db.commit()
+    return veces
+
+async def estado_comprobante(db: AsyncSession, cliente: Cliente, comprobante: Comprobante) -> Optional[str]:
+    """
+    Cómo quedó el pago del comprobante: "pendiente", "confirmado" o "rechazado", o
+    None si ya no se puede saber (pedido borrado, o el cliente mandó otro comprobante
+    después y el anterior no terminó en una venta)
+    """
+    if comprobante.pedido_id:
+        estado = await db.scalar(select(Pedido.estado).where(Pedido.id == comprobante.pedido_id))
+        return estado.value if estado else None
+    
+    # Venta única: el último comprobante del cliente guarda su estado de pago
+    ultimo = (cliente.datos_estructurados or {}).get("ultimo_comprobante") or {}
+    if ultimo.get("url") == comprobante.url and ultimo.get("estado_pago"):
+        return ultimo["estado_pago"]
+    
+    # Uno anterior: solo queda rastro si se aprobó (la venta guarda su URL)
+    venta = await db.scalar(select(Venta.estado).where(
+        Venta.empresa_id == comprobante.empresa_id,
+        Venta.cliente_id == comprobante.cliente_id,
+        Venta.comprobante_url == comprobante.url
+    ).limit(1))
+    return "confirmado" if venta == EstadoVenta.CONFIRMADA else None
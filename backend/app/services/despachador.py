@@ -0,0 +1,70 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, TypeVar
+
+from app.core.config import settings
+from app.services.cache import CacheTTL
+
+T = TypeVar("T")
+
+class Despachador:
+    """
+    Ejecuta el trabajo de cada conversación (empresa_id, telefono) de a uno y en
+    orden de llegada, mientras que conversaciones distintas corren en paralelo.
+
+    Además recuerda los IDs de mensajes de WhatsApp ya procesados (acotado y con
+    TTL) para descartar las re-entregas de Meta sin consultar la base.
+    """
+    def __init__(self, max_mensajes_vistos: int, ttl_mensajes_vistos: float):
+        self._candados: Dict[Hashable, asyncio.Lock] = {}
+        # Tareas usando (o esperando) cada candado: al llegar a cero se libera
+        self._usuarios: Dict[Hashable, int] = {}
+        self.mensajes_vistos = CacheTTL(max_mensajes_vistos, ttl_mensajes_vistos)
+        self.duplicados = 0
+
+    async def ejecutar(
+        self,
+        clave: Hashable,
+        funcion: Callable[[], Awaitable[T]],
+        mensaje_id: Optional[str] = None
+    ) -> Optional[T]:
+        """
+        Corre `funcion()` cuando terminó todo lo anterior de la misma `clave`.
+        Si `mensaje_id` ya se procesó devuelve None sin ejecutarla. El ID se marca
+        solo si `funcion` termina bien, así un error deja que la cola lo reintente.
+        """
+        candado = self._candados.get(clave)
+        if candado is None:
+            candado = self._candados[clave] = asyncio.Lock()
+        self._usuarios[clave] = self._usuarios.get(clave, 0) + 1
+
+        try:
+            async with candado:
+                # Se revisa dentro de la sección serializada: un duplicado que llegó
+                # a la par espera al original y acá ya lo encuentra marcado
+                if mensaje_id and self.mensajes_vistos.obtener((clave, mensaje_id)):
+                    self.duplicados += 1
+                    print(f"♻️ Mensaje {mensaje_id} ya procesado, se descarta")
+                    return None
+
+                resultado = await funcion()
+
+                if mensaje_id:
+                    self.mensajes_vistos.guardar((clave, mensaje_id), True)
+                return resultado
+        finally:
+            self._usuarios[clave] -= 1
+            if not self._usuarios[clave]:
+                del self._usuarios[clave]
+                del self._candados[clave]
+
+    def estadisticas(self) -> Dict[str, Any]:
+        return {
+            "conversaciones_activas": len(self._candados),
+            "mensajes_vistos": len(self.mensajes_vistos),
+            "duplicados_descartados": self.duplicados
+        }
+
+despachador = Despachador(
+    max_mensajes_vistos=settings.MENSAJES_VISTOS_MAX_ENTRADAS,
+    ttl_mensajes_vistos=settings.MENSAJES_VISTOS_TTL_SEGUNDOS
+)
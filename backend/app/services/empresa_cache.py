@@ -0,0 +1,94 @@
+from dataclasses import dataclass, fields
+from typing import Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.empresa import Empresa
+from app.services.cache import CacheTTL
+
+@dataclass(frozen=True)
+class EmpresaConfig:
+    """
+    Copia inmutable de la configuración de una empresa (credenciales y modelos).
+    Tiene los mismos nombres de atributos que el modelo Empresa, así que los
+    handlers la usan igual, pero no está atada a ninguna sesión de base de datos.
+    """
+    id: int
+    nombre: str
+    telefono_whatsapp: str
+    telefono_dueño: Optional[str]
+    prompt_personalizado: Optional[str]
+    activa: bool
+    whatsapp_token: str
+    phone_number_id: str
+    verify_token: str
+    openai_api_key: str
+    openai_embedding_model: Optional[str]
+    openai_chat_model: Optional[str]
+    openai_api_base: Optional[str]
+    groq_api_key: str
+    cloudinary_cloud_name: str
+    cloudinary_api_key: str
+    cloudinary_api_secret: str
+
+    @classmethod
+    def desde_modelo(cls, empresa: Empresa) -> "EmpresaConfig":
+        return cls(**{campo.name: getattr(empresa, campo.name) for campo in fields(cls)})
+
+# id -> EmpresaConfig; phone_number_id / teléfono -> id
+_por_id = CacheTTL(settings.EMPRESA_CACHE_MAX_ENTRADAS, settings.EMPRESA_CACHE_TTL_SEGUNDOS)
+_alias = CacheTTL(settings.EMPRESA_CACHE_MAX_ENTRADAS * 2, settings.EMPRESA_CACHE_TTL_SEGUNDOS)
+
+def _guardar(empresa: Empresa) -> EmpresaConfig:
+    config = EmpresaConfig.desde_modelo(empresa)
+    _por_id.guardar(config.id, config)
+    _alias.guardar(("phone_number_id", config.phone_number_id), config.id)
+    _alias.guardar(("telefono", config.telefono_whatsapp), config.id)
+    return config
+
+def obtener_empresa_por_id(db: Session, empresa_id: int) -> Optional[EmpresaConfig]:
+    """Configuración de la empresa por ID (activa o no)"""
+    config = _por_id.obtener(empresa_id)
+    if config:
+        return config
+
+    empresa = db.query(Empresa).filter(Empresa.id == empresa_id).first()
+    return _guardar(empresa) if empresa else None
+
+async def obtener_empresa_por_phone_number_id(db: AsyncSession, phone_number_id: str) -> Optional[EmpresaConfig]:
+    """Empresa activa dueña del phone_number_id que llega en el webhook de Meta"""
+    empresa_id = _alias.obtener(("phone_number_id", phone_number_id))
+    config = _por_id.obtener(empresa_id) if empresa_id else None
+    # El alias puede haber quedado viejo si la empresa cambió de número
+    if config and config.phone_number_id == phone_number_id:
+        return config if config.activa else None
+
+    empresa = await db.scalar(select(Empresa).where(
+        Empresa.phone_number_id == phone_number_id,
+        Empresa.activa == True
+    ).limit(1))
+    return _guardar(empresa) if empresa else None
+
+async def obtener_empresa_por_telefono(db: AsyncSession, telefono_whatsapp: str) -> Optional[EmpresaConfig]:
+    """Empresa activa por su número de WhatsApp visible (sin '+')"""
+    empresa_id = _alias.obtener(("telefono", telefono_whatsapp))
+    config = _por_id.obtener(empresa_id) if empresa_id else None
+    if config and config.telefono_whatsapp == telefono_whatsapp:
+        return config if config.activa else None
+
+    empresa = await db.scalar(select(Empresa).where(
+        Empresa.telefono_whatsapp == telefono_whatsapp,
+        Empresa.activa == True
+    ).limit(1))
+    return _guardar(empresa) if empresa else None
+
+def invalidar_empresa(empresa_id: int):
+    """Descarta la configuración cacheada (llamar al editar o eliminar la empresa)"""
+    config = _por_id.obtener(empresa_id)
+    _por_id.eliminar(empresa_id)
+    if config:
+        _alias.eliminar(("phone_number_id", config.phone_number_id))
+        _alias.eliminar(("telefono", config.telefono_whatsapp))
@@ -0,0 +1,135 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+
+ClaveIndice = Tuple[int, Optional[str]]
+
+class IndiceCampania:
+    """
+    Embeddings normalizados de una (empresa, campaña) en una matriz float32 contigua,
+    con el id de cada chunk en el arreglo paralelo chunk_ids.
+    """
+    def __init__(self, chunk_ids: np.ndarray, matriz: np.ndarray):
+        self.chunk_ids = chunk_ids
+        self.matriz = matriz
+        self.creado = time.monotonic()
+    
+    @classmethod
+    def desde_filas(cls, filas: List[Tuple[int, List[float]]]) -> "IndiceCampania":
+        """Construye el índice a partir de tuplas (chunk_id, embedding)"""
+        if not filas:
+            return cls(np.empty(0, dtype=np.int64), np.empty((0, 0), dtype=np.float32))
+        
+        chunk_ids = np.fromiter((fila[0] for fila in filas), dtype=np.int64, count=len(filas))
+        matriz = np.ascontiguousarray(np.vstack([fila[1] for fila in filas]), dtype=np.float32)
+        
+        normas = np.linalg.norm(matriz, axis=1, keepdims=True)
+        normas[normas == 0] = 1.0
+        matriz /= normas
+        return cls(chunk_ids, matriz)
+    
+    @property
+    def tamano_bytes(self) -> int:
+        return self.matriz.nbytes + self.chunk_ids.nbytes
+    
+    def buscar(self, embedding_consulta: List[float], top_k: int) -> List[Tuple[int, float]]:
+        """Devuelve [(chunk_id, similitud)] de los top_k chunks más parecidos, ordenados"""
+        total = len(self.chunk_ids)
+        if total == 0 or top_k <= 0:
+            return []
+        
+        consulta = np.array(embedding_consulta, dtype=np.float32)
+        norma = np.linalg.norm(consulta)
+        if norma == 0:
+            return []
+        consulta /= norma
+        
+        puntajes = self.matriz @ consulta
+        k = min(top_k, total)
+        if k < total:
+            candidatos = np.argpartition(-puntajes, k - 1)[:k]
+        else:
+            candidatos = np.arange(total)
+        candidatos = candidatos[np.argsort(-puntajes[candidatos])]
+        
+        return [(int(self.chunk_ids[i]), float(puntajes[i])) for i in candidatos]
+
+class IndiceVectorialCache:
+    """
+    Cache LRU de índices por (empresa_id, campania_id) con tope de memoria total.
+    Los índices se construyen la primera vez que se consultan y se descartan
+    cuando cambian los documentos de la empresa o cuando vence su TTL.
+    """
+    def __init__(self, max_bytes: int, ttl_segundos: float):
+        self.max_bytes = max_bytes
+        self.ttl_segundos = ttl_segundos
+        self._indices: "OrderedDict[ClaveIndice, IndiceCampania]" = OrderedDict()
+        self._versiones: Dict[int, int] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+    
+    async def obtener(self, empresa_id: int, campania_id: Optional[str], construir: Callable[[], Awaitable[IndiceCampania]]) -> IndiceCampania:
+        """Devuelve el índice cacheado o lo construye con `construir` (consultas con AsyncSession)"""
+        indice, version = self._vigente(empresa_id, campania_id)
+        if indice:
+            return indice
+        
+        # Construir fuera del lock para no frenar las búsquedas de otras empresas
+        indice = await construir()
+        self._guardar(empresa_id, campania_id, version, indice)
+        return indice
+    
+    def _vigente(self, empresa_id: int, campania_id: Optional[str]) -> Tuple[Optional[IndiceCampania], int]:
+        """Índice cacheado si sigue vigente, y la versión de la empresa al momento de consultar"""
+        clave = (empresa_id, campania_id)
+        with self._lock:
+            indice = self._indices.get(clave)
+            if indice and time.monotonic() - indice.creado < self.ttl_segundos:
+                self._indices.move_to_end(clave)
+                return indice, self._versiones.get(empresa_id, 0)
+            if indice:
+                self._quitar(clave)
+            return None, self._versiones.get(empresa_id, 0)
+    
+    def _guardar(self, empresa_id: int, campania_id: Optional[str], version: int, indice: IndiceCampania):
+        clave = (empresa_id, campania_id)
+        with self._lock:
+            # Si invalidaron la empresa mientras construíamos, no guardamos un índice viejo
+            if self._versiones.get(empresa_id, 0) == version and clave not in self._indices:
+                if indice.tamano_bytes <= self.max_bytes:
+                    self._indices[clave] = indice
+                    self._bytes += indice.tamano_bytes
+                    self._liberar_memoria()
+    
+    def invalidar(self, empresa_id: int, campania_id: Optional[str] = None):
+        """
+        Descarta los índices afectados por un cambio de documentos.
+        Sin campania_id se descartan todas las campañas de la empresa.
+        """
+        with self._lock:
+            self._versiones[empresa_id] = self._versiones.get(empresa_id, 0) + 1
+            for clave in list(self._indices):
+                if clave[0] != empresa_id:
+                    continue
+                # La clave (empresa, None) agrupa todas las campañas, siempre queda vieja
+                if campania_id is None or clave[1] is None or clave[1] == campania_id:
+                    self._quitar(clave)
+    
+    def _quitar(self, clave: ClaveIndice):
+        indice = self._indices.pop(clave)
+        self._bytes -= indice.tamano_bytes
+    
+    def _liberar_memoria(self):
+        while self._bytes > self.max_bytes and self._indices:
+            clave_vieja = next(iter(self._indices))
+            self._quitar(clave_vieja)
+
+indices_vectoriales = IndiceVectorialCache(
+    max_bytes=settings.RAG_INDICE_MAX_MB * 1024 * 1024,
+    ttl_segundos=settings.RAG_INDICE_TTL_SEGUNDOS
+)
@@ -0,0 +1,178 @@
+import asyncio
+import datetime
+import os
+import threading
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+from app.core.config import settings
+from app.db.base import SessionLocal
+from app.services.rag import RAGService
+from app.socket_manager import emitir_progreso_ingesta
+
+class TrabajoIngesta:
+    """Estado de un documento que se está procesando en segundo plano"""
+    def __init__(self, empresa_id: int, nombre_archivo: str):
+        self.id = uuid.uuid4().hex
+        self.empresa_id = empresa_id
+        self.nombre_archivo = nombre_archivo
+        self.estado = "en_cola"  # en_cola, procesando, completado, error
+        self.etapa = "en_cola"
+        self.progreso = 0
+        self.documento_id: Optional[int] = None
+        self.campania_id: Optional[str] = None
+        self.chunks = 0
+        self.duplicado = False
+        self.error: Optional[str] = None
+        self.creado = datetime.datetime.now()
+        self.actualizado = self.creado
+    
+    @property
+    def terminado(self) -> bool:
+        return self.estado in ("completado", "error")
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "empresa_id": self.empresa_id,
+            "nombre": self.nombre_archivo,
+            "estado": self.estado,
+            "etapa": self.etapa,
+            "progreso": self.progreso,
+            "documento_id": self.documento_id,
+            "campania_id": self.campania_id,
+            "chunks": self.chunks,
+            "duplicado": self.duplicado,
+            "error": self.error,
+            "creado": self.creado.isoformat(),
+            "actualizado": self.actualizado.isoformat()
+        }
+
+# Los trabajos viven en memoria del proceso: GET /documentos/jobs/{id}
+# debe llegar al mismo worker de uvicorn que recibió la subida.
+_trabajos: Dict[str, TrabajoIngesta] = {}
+_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=settings.INGESTA_WORKERS, thread_name_prefix="ingesta")
+
+def encolar_ingesta(
+    empresa_id: int,
+    nombre_archivo: str,
+    ruta_archivo: str,
+    campania_id: Optional[str] = None,
+    mensaje_entrega: Optional[str] = None,
+    precio: Optional[float] = None,
+    tipo_campania: Optional[str] = "producto_unico"
+) -> TrabajoIngesta:
+    """
+    Registra el trabajo y lo manda al pool: extraer → dividir → embeddings → guardar.
+    `ruta_archivo` es un temporal que el trabajo borra al terminar (o acá mismo si
+    no se pudo encolar). Debe llamarse desde el event loop (lo usa para emitir el
+    progreso por Socket.IO).
+    """
+    loop = asyncio.get_running_loop()
+    trabajo = TrabajoIngesta(empresa_id, nombre_archivo)
+    
+    try:
+        with _lock:
+            _trabajos[trabajo.id] = trabajo
+            _podar_trabajos()
+        
+        futuro = _executor.submit(
+            _ejecutar_ingesta, trabajo, loop, ruta_archivo, campania_id, mensaje_entrega, precio, tipo_campania
+        )
+    except Exception:
+        # Sin trabajo en el pool nadie más va a borrar el temporal
+        with _lock:
+            _trabajos.pop(trabajo.id, None)
+        _borrar_temporal(ruta_archivo)
+        raise
+    
+    futuro.add_done_callback(lambda f: _cancelado(trabajo, ruta_archivo) if f.cancelled() else None)
+    print(f"📥 Ingesta encolada: {trabajo.id} ({nombre_archivo}) para empresa {empresa_id}")
+    return trabajo
+
+def cerrar_ingesta():
+    """
+    Se llama al apagar la aplicación: espera a los documentos que se están
+    procesando y los que siguen en cola no empiezan (quedan con error)
+    """
+    _executor.shutdown(wait=True, cancel_futures=True)
+
+def obtener_trabajo(job_id: str) -> Optional[TrabajoIngesta]:
+    with _lock:
+        return _trabajos.get(job_id)
+
+def _podar_trabajos():
+    """Olvida los trabajos terminados más viejos para no crecer sin límite"""
+    terminados = [t for t in _trabajos.values() if t.terminado]
+    sobrantes = len(terminados) - settings.INGESTA_MAX_TRABAJOS_GUARDADOS
+    if sobrantes > 0:
+        terminados.sort(key=lambda t: t.actualizado)
+        for trabajo in terminados[:sobrantes]:
+            del _trabajos[trabajo.id]
+
+def _borrar_temporal(ruta_archivo: str):
+    if os.path.exists(ruta_archivo):
+        os.remove(ruta_archivo)
+
+def _cancelado(trabajo: TrabajoIngesta, ruta_archivo: str):
+    """Trabajo que no llegó a empezar porque se apagó la aplicación"""
+    trabajo.estado = "error"
+    trabajo.etapa = "error"
+    trabajo.error = "La aplicación se apagó antes de procesar el documento; vuelve a subirlo"
+    trabajo.actualizado = datetime.datetime.now()
+    _borrar_temporal(ruta_archivo)
+    print(f"⚠️ Ingesta {trabajo.id} cancelada al apagar ({trabajo.nombre_archivo})")
+
+def _reportar(trabajo: TrabajoIngesta, loop: asyncio.AbstractEventLoop, etapa: str, progreso: int):
+    """Actualiza el trabajo y avisa a la sala empresa_{id} (llamado desde el hilo del pool)"""
+    trabajo.etapa = etapa
+    trabajo.progreso = progreso
+    trabajo.actualizado = datetime.datetime.now()
+    if loop.is_closed():
+        return
+    asyncio.run_coroutine_threadsafe(
+        emitir_progreso_ingesta(trabajo.to_dict(), trabajo.empresa_id), loop
+    )
+
+def _ejecutar_ingesta(
+    trabajo: TrabajoIngesta,
+    loop: asyncio.AbstractEventLoop,
+    ruta_archivo: str,
+    campania_id: Optional[str],
+    mensaje_entrega: Optional[str],
+    precio: Optional[float],
+    tipo_campania: Optional[str]
+):
+    db = SessionLocal()
+    try:
+        trabajo.estado = "procesando"
+        rag_service = RAGService(db, trabajo.empresa_id)
+        documento = rag_service.guardar_documento(
+            trabajo.nombre_archivo,
+            ruta_archivo,
+            campania_id,
+            mensaje_entrega,
+            precio,
+            tipo_campania,
+            progreso=lambda etapa, porcentaje: _reportar(trabajo, loop, etapa, porcentaje)
+        )
+        trabajo.documento_id = documento.id
+        trabajo.campania_id = documento.campania_id
+        trabajo.chunks = len(documento.chunks) if documento.chunks else 0
+        trabajo.duplicado = trabajo.etapa == "duplicado"
+        trabajo.estado = "completado"
+        _reportar(trabajo, loop, "completado", 100)
+        print(f"✅ Ingesta {trabajo.id} completada: documento {documento.id} con {trabajo.chunks} chunks")
+    except Exception as e:
+        db.rollback()
+        trabajo.estado = "error"
+        trabajo.error = str(e)
+        _reportar(trabajo, loop, "error", trabajo.progreso)
+        print(f"❌ Error en ingesta {trabajo.id}: {e}")
+        traceback.print_exc()
+    finally:
+        db.close()
+        _borrar_temporal(ruta_archivo)
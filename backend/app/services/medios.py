@@ -0,0 +1,121 @@
+import asyncio
+import tempfile
+from typing import Dict, Optional
+
+import httpx
+
+from app.core.config import settings
+from app.services.clientes_api import obtener_http
+from app.services.cloudinary import obtener_subidor
+from app.services.empresa_cache import EmpresaConfig
+from app.utils.hilos import en_hilo
+
+# Errores de Meta que vale la pena reintentar (el resto no cambia al repetir)
+ESTADOS_REINTENTABLES = {408, 429, 500, 502, 503, 504}
+
+class MedioInvalido(Exception):
+    """El medio no se puede procesar: reintentar no sirve (URL vencida, demasiado grande...)"""
+
+class PipelineMedios:
+    """
+    Descarga un medio de WhatsApp y lo sube a Cloudinary (o al backend de
+    MEDIOS_BACKEND) sin bloquear el event loop.
+    
+    La descarga va por chunks a un SpooledTemporaryFile (en memoria hasta
+    `bytes_en_memoria`, después en disco) que se entrega abierto al SDK de
+    Cloudinary: el contenido no se copia a otro buffer antes de subirlo. Cada paso
+    se reintenta `reintentos` veces con espera exponencial y la descarga se corta
+    al pasar `max_bytes`.
+    """
+    def __init__(self, max_bytes: int, bytes_en_memoria: int, reintentos: int, espera_reintento: float):
+        self.max_bytes = max_bytes
+        self.bytes_en_memoria = bytes_en_memoria
+        self.reintentos = reintentos
+        self.espera_reintento = espera_reintento
+        self.subidos = 0
+        self.fallidos = 0
+        self.reintentados = 0
+        self.bytes_subidos = 0
+    
+    async def subir_comprobante(self, url_whatsapp: Optional[str], whatsapp_token: str, empresa: EmpresaConfig, public_id: str) -> Optional[str]:
+        """URL del comprobante en Cloudinary, o None si no se pudo descargar o subir"""
+        try:
+            if not url_whatsapp:
+                raise MedioInvalido("No se recibió URL de la imagen")
+            
+            archivo = await self._con_reintentos(self._descargar, url_whatsapp, whatsapp_token)
+            with archivo:
+                tamano = archivo.tell()
+                resultado = await self._con_reintentos(self._subir, archivo, empresa, public_id)
+            
+            self.subidos += 1
+            self.bytes_subidos += tamano
+            print(f"☁️ Comprobante subido ({tamano} bytes): {resultado['url']}")
+            return resultado["url"]
+        except Exception as e:
+            self.fallidos += 1
+            print(f"❌ Error procesando imagen: {e}")
+            return None
+    
+    async def _con_reintentos(self, paso, *args):
+        for intento in range(self.reintentos + 1):
+            try:
+                return await paso(*args)
+            except MedioInvalido:
+                raise
+            except Exception as e:
+                if intento == self.reintentos:
+                    raise
+                espera = self.espera_reintento * (2 ** intento)
+                self.reintentados += 1
+                print(f"🔁 {paso.__name__} falló ({e}), reintento en {espera:.1f}s")
+                await asyncio.sleep(espera)
+    
+    async def _descargar(self, url: str, whatsapp_token: str) -> tempfile.SpooledTemporaryFile:
+        headers = {"Authorization": f"Bearer {whatsapp_token}"}
+        archivo = tempfile.SpooledTemporaryFile(max_size=self.bytes_en_memoria)
+        try:
+            async with obtener_http().stream("GET", url, headers=headers) as response:
+                if response.status_code != 200:
+                    error = f"Falló descarga de Meta: {response.status_code}"
+                    if response.status_code in ESTADOS_REINTENTABLES:
+                        raise httpx.HTTPStatusError(error, request=response.request, response=response)
+                    raise MedioInvalido(error)
+                
+                declarado = int(response.headers.get("content-length") or 0)
+                if declarado > self.max_bytes:
+                    raise MedioInvalido(f"El medio pesa {declarado} bytes (máximo {self.max_bytes})")
+                
+                async for chunk in response.aiter_bytes():
+                    if archivo.tell() + len(chunk) > self.max_bytes:
+                        raise MedioInvalido(f"El medio supera el máximo de {self.max_bytes} bytes")
+                    archivo.write(chunk)
+        except BaseException:
+            archivo.close()
+            raise
+        return archivo
+    
+    async def _subir(self, archivo, empresa: EmpresaConfig, public_id: str) -> Dict:
+        archivo.seek(0)
+        subidor = obtener_subidor(empresa.cloudinary_cloud_name, empresa.cloudinary_api_key, empresa.cloudinary_api_secret)
+        # El SDK de Cloudinary es síncrono: se sube desde el pool de hilos (las
+        # credenciales van en cada subida, así empresas distintas suben en paralelo)
+        resultado = await en_hilo(subidor.subir, archivo, public_id=public_id)
+        if not resultado:
+            raise Exception("Cloudinary no devolvió resultado")
+        return resultado
+    
+    def estadisticas(self) -> Dict[str, int]:
+        return {
+            "subidos": self.subidos,
+            "fallidos": self.fallidos,
+            "reintentos": self.reintentados,
+            "bytes_subidos": self.bytes_subidos
+        }
+
+pipeline_medios = PipelineMedios(
+    max_bytes=settings.MEDIOS_MAX_BYTES,
+    bytes_en_memoria=settings.MEDIOS_BYTES_EN_MEMORIA,
+    reintentos=settings.MEDIOS_REINTENTOS,
+    espera_reintento=settings.MEDIOS_ESPERA_REINTENTO_SEGUNDOS
+)
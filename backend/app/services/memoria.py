@@ -1,49 +1,65 @@
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.models.cliente import Cliente
 from app.models.conversacion import Conversacion
 import json
+from typing import Optional
+
+# Resumen de un cliente que todavía no tiene uno
+RESUMEN_SIN_HISTORIAL = "Cliente sin historial previo"
 
 class MemoriaService:
-    def __init__(self, db: Session, cliente_id: int):
+    def __init__(self, db: AsyncSession, cliente_id: int, cliente: Optional[Cliente] = None):
         self.db = db
         self.cliente_id = cliente_id
-        self.cliente = db.query(Cliente).filter(Cliente.id == cliente_id).first()
+        # Si el webhook ya cargó el cliente en esta sesión no se vuelve a consultar
+        self.cliente = cliente
+    
+    async def _obtener_cliente(self) -> Optional[Cliente]:
+        if self.cliente is None:
+            self.cliente = await self.db.get(Cliente, self.cliente_id)
+        return self.cliente
     
-    def obtener_resumen(self) -> str:
+    async def obtener_resumen(self) -> str:
         """Obtiene el resumen actual del cliente"""
-        if self.cliente and self.cliente.resumen:
-            return self.cliente.resumen
-        return "Cliente sin historial previo"
+        cliente = await self._obtener_cliente()
+        if cliente and cliente.resumen:
+            return cliente.resumen
+        return RESUMEN_SIN_HISTORIAL
     
-    def obtener_datos_estructurados(self) -> dict:
+    async def obtener_datos_estructurados(self) -> dict:
         """Obtiene los datos estructurados del cliente"""
-        if self.cliente and self.cliente.datos_estructurados:
-            return self.cliente.datos_estructurados
+        cliente = await self._obtener_cliente()
+        if cliente and cliente.datos_estructurados:
+            return cliente.datos_estructurados
         return {}
     
-    def actualizar_resumen(self, pregunta: str, respuesta: str):
+    async def actualizar_resumen(self, pregunta: str, respuesta: str, confirmar: bool = True):
         """
         Actualiza el resumen del cliente basado en la interacción
         Por ahora es simple, después se puede mejorar con LLM
+        Con confirmar=False queda pendiente en la sesión para el commit del turno
         """
-        if not self.cliente:
+        cliente = await self._obtener_cliente()
+        if not cliente:
             return
         
         # Versión simple: concatenar últimas interacciones
         nuevo_resumen = f"Última interacción - P: {pregunta[:50]}... R: {respuesta[:50]}..."
         
         # Actualizar cliente
-        self.cliente.resumen = nuevo_resumen
-        self.cliente.ultima_interaccion = None  
-        self.db.commit()
+        cliente.resumen = nuevo_resumen
+        cliente.ultima_interaccion = None
+        if confirmar:
+            await self.db.commit()
     
-    def guardar_dato_estructurado(self, clave: str, valor):
+    async def guardar_dato_estructurado(self, clave: str, valor):
         """Guarda un dato estructurado en el campo JSON"""
-        if not self.cliente:
+        cliente = await self._obtener_cliente()
+        if not cliente:
             return
         
-        datos = self.cliente.datos_estructurados or {}
+        datos = cliente.datos_estructurados or {}
         datos[clave] = valor
         
-        self.cliente.datos_estructurados = datos
-        self.db.commit()
\ No newline at end of file
+        cliente.datos_estructurados = datos
+        await self.db.commit()
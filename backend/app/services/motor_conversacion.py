@@ -0,0 +1,217 @@
+import asyncio
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.cliente import Cliente
+from app.models.conversacion import TipoEmisor
+from app.services.empresa_cache import EmpresaConfig
+from app.services.memoria import RESUMEN_SIN_HISTORIAL, MemoriaService
+from app.services.rag import RAGService
+from app.services.registro_conversaciones import registro_conversaciones
+from app.services.whatsapp_sender import enviar_mensaje_whatsapp, enviar_mensaje_en_partes
+
+@dataclass
+class Turno:
+    """Un mensaje del cliente que hay que responder"""
+    db: AsyncSession
+    empresa: EmpresaConfig
+    cliente: Cliente
+    texto_mensaje: str
+    campania_id: Optional[str]
+    whatsapp_token: str
+    phone_number_id: str
+    imagen_info: Optional[dict] = None
+    audio_url: Optional[str] = None
+    # Lo que se guarda como mensajes del cliente (por defecto texto_mensaje): uno por
+    # mensaje cuando el turno responde varios agrupados
+    mensajes_cliente: Optional[List[str]] = None
+
+class Estrategia:
+    """
+    Lo que cambia según el tipo de campaña. Por defecto se responde con RAG + LLM y
+    la primera pregunta de una conversación reutiliza la respuesta de otra equivalente
+    (ver CacheRespuestas).
+    """
+    cachea_respuestas = True
+    # Imprime el comienzo de cada chunk encontrado además del documento
+    detalle_documentos = False
+    
+    def respuesta_fija(self, turno: Turno) -> Optional[str]:
+        """Respuesta que no pasa por el RAG; None = responder con el LLM"""
+        return None
+    
+    def prefijo(self, turno: Turno) -> str:
+        """Texto antepuesto a la respuesta del LLM (no se guarda en el cache)"""
+        return ""
+
+class EstrategiaInformativo(Estrategia):
+    """Documento informativo: solo responde preguntas (no guarda ventas ni pedidos)"""
+
+class EstrategiaRestaurante(Estrategia):
+    """
+    Pedido múltiple: preguntas del menú, horarios, direcciones, etc. Las respuestas
+    dependen del pedido que el cliente va armando, así que no se reutilizan.
+    """
+    cachea_respuestas = False
+
+class EstrategiaVentaUnica(Estrategia):
+    """Producto único: venta individual, con respuesta fija para los comprobantes"""
+    detalle_documentos = True
+    
+    def respuesta_fija(self, turno: Turno) -> Optional[str]:
+        if turno.imagen_info:
+            return "✅ ¡Gracias por enviar tu comprobante! Hemos notificado al asesor. En breve recibirás la confirmación. 😊"
+        return None
+    
+    def prefijo(self, turno: Turno) -> str:
+        return "🎤 He recibido tu audio. " if turno.audio_url else ""
+
+class MotorConversacion:
+    """
+    Responde un turno de conversación con la estrategia del tipo de campaña:
+    resumen e historial se leen mientras se calcula el embedding de la consulta,
+    y la respuesta se envía mientras se guarda. El resumen va en un solo commit y
+    los mensajes del cliente y del bot al registro de conversaciones (escritura por
+    lotes) recién cuando el turno terminó bien.
+    """
+    def __init__(self, estrategias: Dict[str, Estrategia], por_defecto: str):
+        self.estrategias = estrategias
+        self.por_defecto = por_defecto
+    
+    def estrategia(self, tipo_campania: Optional[str]) -> Estrategia:
+        return self.estrategias.get(tipo_campania) or self.estrategias[self.por_defecto]
+    
+    async def responder(self, tipo_campania: Optional[str], turno: Turno) -> str:
+        """
+        Genera, guarda y envía la respuesta. Lo que haya quedado pendiente en la
+        sesión se confirma en el mismo commit que el resumen.
+        """
+        estrategia = self.estrategia(tipo_campania)
+        rag = RAGService(
+            db=turno.db,
+            empresa_id=turno.empresa.id,
+            cliente_id=turno.cliente.id,
+            campania_id=turno.campania_id,
+            empresa=turno.empresa
+        )
+        memoria = MemoriaService(turno.db, turno.cliente.id, cliente=turno.cliente)
+        
+        prefijo = estrategia.prefijo(turno)
+        respuesta_texto = estrategia.respuesta_fija(turno)
+        ya_enviada = False
+        if respuesta_texto is None:
+            respuesta_llm, ya_enviada = await self._generar(estrategia, turno, rag, memoria, prefijo)
+            respuesta_texto = f"{prefijo}{respuesta_llm}"
+        
+        await memoria.actualizar_resumen(turno.texto_mensaje, respuesta_texto, confirmar=False)
+        
+        if ya_enviada:
+            await turno.db.commit()
+        else:
+            await asyncio.gather(
+                turno.db.commit(),
+                enviar_mensaje_whatsapp(
+                    telefono_destino=turno.cliente.telefono,
+                    mensaje=respuesta_texto,
+                    token=turno.whatsapp_token,
+                    phone_number_id=turno.phone_number_id
+                )
+            )
+        
+        # Si algo falló antes la cola reintenta el turno: el mensaje del cliente no
+        # queda repetido en la conversación
+        for mensaje in turno.mensajes_cliente or [turno.texto_mensaje]:
+            registro_conversaciones.registrar(turno.cliente.id, mensaje, TipoEmisor.CLIENTE)
+        registro_conversaciones.registrar(turno.cliente.id, respuesta_texto, TipoEmisor.BOT)
+        
+        return respuesta_texto
+    
+    async def _generar(
+        self,
+        estrategia: Estrategia,
+        turno: Turno,
+        rag: RAGService,
+        memoria: MemoriaService,
+        prefijo: str
+    ) -> Tuple[str, bool]:
+        """Respuesta del LLM (sin el prefijo) y si ya se envió en streaming"""
+        consulta = turno.texto_mensaje
+        
+        async def contexto_cliente() -> Tuple[str, list]:
+            # Comparten la sesión, así que van una después de la otra
+            return await memoria.obtener_resumen(), await rag.obtener_mensajes_recientes()
+        
+        embedding, (resumen_cliente, mensajes) = await asyncio.gather(
+            rag.generar_embedding_consulta(consulta),
+            contexto_cliente()
+        )
+        
+        # El cache lo comparten todos los clientes de la campaña: solo se usa en turnos
+        # sin conversación previa (el bot todavía no respondió nada) y esa respuesta se
+        # genera sin resumen ni historial, así no lleva nada propio del cliente
+        usa_cache = estrategia.cachea_respuestas and not any(m.emisor == TipoEmisor.BOT for m in mensajes)
+        if usa_cache:
+            # Una pregunta equivalente ya respondida en esta campaña no pasa por la búsqueda ni el LLM
+            respuesta_cacheada = await rag.buscar_respuesta_cacheada(consulta, embedding=embedding)
+            if respuesta_cacheada is not None:
+                return respuesta_cacheada, False
+            resumen_cliente, historial = RESUMEN_SIN_HISTORIAL, ""
+        else:
+            historial = rag.formatear_historial(mensajes)
+        
+        print(f"🔍 Buscando en campaña '{turno.campania_id}' para: '{consulta}'")
+        documentos_relevantes = await rag.buscar_similares(consulta, top_k=3, embedding_consulta=embedding)
+        self._imprimir_documentos(documentos_relevantes, estrategia.detalle_documentos)
+        
+        contexto = "\n\n".join([doc["texto"] for doc in documentos_relevantes])
+        
+        ya_enviada = settings.LLM_STREAMING
+        if ya_enviada:
+            # Se envía frase a frase mientras el modelo genera
+            respuesta_completa, completa = await enviar_mensaje_en_partes(
+                telefono_destino=turno.cliente.telefono,
+                partes=rag.generar_respuesta_llm_stream(
+                    consulta=consulta,
+                    contexto=contexto,
+                    resumen_cliente=resumen_cliente,
+                    historial=historial
+                ),
+                token=turno.whatsapp_token,
+                phone_number_id=turno.phone_number_id,
+                prefijo=prefijo
+            )
+            respuesta_llm = respuesta_completa[len(prefijo):]
+            if not completa:
+                # Se guarda en la conversación lo que leyó el cliente, pero no se cachea
+                return respuesta_llm, ya_enviada
+        else:
+            respuesta_llm = await rag.generar_respuesta_llm(
+                consulta=consulta,
+                contexto=contexto,
+                resumen_cliente=resumen_cliente,
+                historial=historial
+            )
+        
+        if usa_cache:
+            await rag.guardar_respuesta_cacheada(consulta, respuesta_llm, embedding=embedding)
+        return respuesta_llm, ya_enviada
+    
+    @staticmethod
+    def _imprimir_documentos(documentos: List[dict], detalle: bool):
+        print(f"📚 Documentos encontrados: {len(documentos)}")
+        for i, doc in enumerate(documentos):
+            print(f"  {i+1}. Documento: {doc.get('documento', 'N/A')} - Similitud: {doc.get('similitud', 0):.4f}")
+            if detalle:
+                print(f"     Texto: {doc.get('texto', '')[:100]}...")
+
+motor_conversacion = MotorConversacion(
+    estrategias={
+        "producto_unico": EstrategiaVentaUnica(),
+        "pedido_multiple": EstrategiaRestaurante(),
+        "informativo": EstrategiaInformativo()
+    },
+    por_defecto="producto_unico"
+)
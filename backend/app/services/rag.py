@@ -1,48 +1,74 @@
 import os
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Callable, Iterable, Iterator, AsyncIterator, Tuple, Union
+from collections import deque
+from itertools import islice
 import numpy as np
 from sqlalchemy.orm import Session
-from sqlalchemy import func, select
-from openai import OpenAI
-from PyPDF2 import PdfReader
-from io import BytesIO
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, select, text, insert, delete
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import hashlib
-from app.models.empresa import Empresa
+import pickle
+import tempfile
+from app.services.empresa_cache import EmpresaConfig, obtener_empresa_por_id
+from app.services.clientes_api import obtener_openai, obtener_openai_async
+from app.core.config import settings
+from app.services.indice_vectorial import IndiceCampania, indices_vectoriales
+from app.services.cache import CacheEmbeddings, cache_embeddings
+from app.services.cache_respuestas import respuestas_cacheadas
+from app.services.registro_conversaciones import registro_conversaciones
+from app.utils.procesar_pdf import OrigenPDF, calcular_md5, contar_paginas, iterar_paginas
+from app.utils.chunks import dividir_en_chunks_tokens
+from app.utils.hilos import en_hilo
+from app.utils.frases import SegmentadorFrases
+
+# Versión de pgvector instalada (se consulta una vez): desde 0.8 el índice HNSW
+# puede seguir buscando hasta juntar top_k filas que pasen el filtro
+_version_pgvector: Optional[Tuple[int, ...]] = None
 
 class RAGService:
-    def __init__(self, db: Session, empresa_id: int, cliente_id: int = None, campania_id: Optional[str] = None):
+    """
+    Con una Session síncrona se usa para la ingesta de documentos (guardar_documento).
+    Con una AsyncSession responde mensajes: buscar_similares, generar_respuesta_llm y
+    obtener_historial_reciente son corrutinas y no bloquean el event loop.
+    """
+    def __init__(self, db: Union[Session, AsyncSession], empresa_id: int, cliente_id: int = None, campania_id: Optional[str] = None, empresa: Optional[EmpresaConfig] = None):
         self.db = db
         self.empresa_id = empresa_id
         self.cliente_id = cliente_id
         self.campania_id = campania_id
         
-        # 🔥 OBTENER LA EMPRESA DE LA BASE DE DATOS PARA SUS CREDENCIALES
-        self.empresa = db.query(Empresa).filter(Empresa.id == empresa_id).first()
+        # 🔥 CREDENCIALES DE LA EMPRESA: las que ya trae el handler o las del cache
+        if empresa is None and isinstance(db, AsyncSession):
+            raise ValueError("Con una AsyncSession hay que pasar la configuración de la empresa")
+        self.empresa = empresa or obtener_empresa_por_id(db, empresa_id)
         if not self.empresa:
             raise ValueError(f"Empresa con ID {empresa_id} no encontrada")
         
-        # 🔥 INICIALIZAR CLIENTE DE OPENAI CON LA API KEY DE LA EMPRESA
-        self.client = OpenAI(
-            api_key=self.empresa.openai_api_key,
-            base_url=self.empresa.openai_api_base if self.empresa.openai_api_base else None
-        )
+        # 🔥 INICIALIZAR CLIENTES DE OPENAI CON LA API KEY DE LA EMPRESA
+        # (reutilizados entre mensajes: mantienen las conexiones abiertas)
+        self.client = obtener_openai(self.empresa.openai_api_key, self.empresa.openai_api_base)
+        self.client_async = obtener_openai_async(self.empresa.openai_api_key, self.empresa.openai_api_base)
         
         # 🔥 MODELOS CONFIGURABLES POR EMPRESA
         self.embedding_model = self.empresa.openai_embedding_model or "text-embedding-ada-002"
         self.chat_model = self.empresa.openai_chat_model or "gpt-4o"
     
-    def obtener_historial_reciente(self, limite: int = 5) -> str:
+    async def obtener_historial_reciente(self, limite: int = 5) -> str:
         """Obtiene los últimos mensajes de la conversación actual"""
+        return self.formatear_historial(await self.obtener_mensajes_recientes(limite))
+    
+    async def obtener_mensajes_recientes(self, limite: int = 5) -> list:
+        """Últimos mensajes de la conversación actual, del más viejo al más nuevo"""
         if not self.cliente_id:
-            return ""
-        
-        from app.models.conversacion import Conversacion, TipoEmisor
-        
-        mensajes = self.db.query(Conversacion).filter(
-            Conversacion.cliente_id == self.cliente_id
-        ).order_by(Conversacion.timestamp.desc()).limit(limite).all()
-        
-        mensajes.reverse()
+            return []
+        # Incluye los mensajes que todavía esperan su escritura por lotes
+        return await registro_conversaciones.leer(self.db, self.cliente_id, limite)
+    
+    @staticmethod
+    def formatear_historial(mensajes: list) -> str:
+        """Mensajes como "Cliente: ..." / "Bot: ..." para el prompt"""
+        from app.models.conversacion import TipoEmisor
         
         historial = []
         for msg in mensajes:
@@ -53,23 +79,42 @@ class RAGService:
     
     def extraer_texto_pdf(self, archivo_bytes: bytes) -> str:
         """Extrae texto de un archivo PDF"""
-        texto = ""
-        pdf = PdfReader(BytesIO(archivo_bytes))
-        for pagina in pdf.pages:
-            texto += pagina.extract_text()
-        return texto
+        return "".join(texto for _, texto in self.iterar_paginas_pdf(archivo_bytes))
+    
+    def iterar_paginas_pdf(self, archivo: OrigenPDF) -> Iterator[Tuple[int, str]]:
+        """Recorre las páginas del PDF (bytes o ruta) sin juntar todo el texto en memoria"""
+        return iterar_paginas(
+            archivo,
+            umbral_paralelo=settings.PDF_PAGINAS_PARALELO,
+            paginas_por_tarea=settings.PDF_PAGINAS_POR_TAREA,
+            workers=settings.PDF_WORKERS
+        )
     
     def dividir_en_chunks(self, texto: str, tamano_chunk: int = 500, solapamiento: int = 50) -> List[str]:
         """Divide el texto en fragmentos más pequeños para embedding"""
-        palabras = texto.split()
-        chunks = []
-        
-        for i in range(0, len(palabras), tamano_chunk - solapamiento):
-            chunk = " ".join(palabras[i:i + tamano_chunk])
-            if chunk:
-                chunks.append(chunk)
-        
-        return chunks
+        return list(self.dividir_en_chunks_stream([texto], tamano_chunk, solapamiento))
+    
+    def dividir_en_chunks_stream(self, textos: Iterable[str], tamano_chunk: int = 500, solapamiento: int = 50) -> Iterator[str]:
+        """
+        Igual que dividir_en_chunks pero consume el texto por partes (una página a la vez)
+        y entrega cada chunk apenas se completa. Solo retiene las palabras del chunk actual.
+        """
+        paso = tamano_chunk - solapamiento
+        ventana = deque()
+        palabras_nuevas = 0  # palabras de la ventana que todavía no salieron en ningún chunk
+        
+        for texto in textos:
+            for palabra in texto.split():
+                ventana.append(palabra)
+                palabras_nuevas += 1
+                if len(ventana) == tamano_chunk:
+                    yield " ".join(ventana)
+                    palabras_nuevas = 0
+                    for _ in range(paso):
+                        ventana.popleft()
+        
+        if palabras_nuevas:
+            yield " ".join(ventana)
     
     def generar_embedding(self, texto: str) -> List[float]:
         """Genera embedding usando el modelo configurado de OpenAI"""
@@ -79,10 +124,66 @@ class RAGService:
         )
         return respuesta.data[0].embedding
     
-    def generar_respuesta_llm(self, consulta: str, contexto: str, resumen_cliente: str = "") -> str:
-        """Genera respuesta usando el modelo configurado de OpenAI con historial de conversación"""
+    def generar_embeddings_lote(self, textos: List[str], progreso: Optional[Callable[[int, int], None]] = None) -> List[List[float]]:
+        """
+        Genera los embeddings de muchos textos enviando listas a la API,
+        con varios lotes en vuelo a la vez. Respeta el orden de `textos`.
+        `progreso(lotes_hechos, total_lotes)` se llama al terminar cada lote.
+        """
+        tamano_lote = settings.EMBEDDING_TAMANO_LOTE
+        lotes = [textos[i:i + tamano_lote] for i in range(0, len(textos), tamano_lote)]
+        
+        resultados: List[List[List[float]]] = [[] for _ in lotes]
+        
+        def embeber_lote(posicion: int):
+            respuesta = self.client.embeddings.create(
+                model=self.embedding_model,
+                input=lotes[posicion]
+            )
+            resultados[posicion] = [dato.embedding for dato in sorted(respuesta.data, key=lambda dato: dato.index)]
+        
+        with ThreadPoolExecutor(max_workers=settings.EMBEDDING_CONCURRENCIA) as executor:
+            futuros = [executor.submit(embeber_lote, posicion) for posicion in range(len(lotes))]
+            for hechos, futuro in enumerate(as_completed(futuros), start=1):
+                futuro.result()
+                if progreso:
+                    progreso(hechos, len(lotes))
+        
+        return [embedding for lote in resultados for embedding in lote]
+    
+    async def generar_embedding_consulta(self, consulta: str) -> List[float]:
+        """Embedding de un mensaje del cliente, reutilizando el cache por (modelo, texto normalizado)"""
+        texto = CacheEmbeddings.normalizar(consulta)
+        # El cache puede ir a Redis (cliente síncrono), así que corre en el pool de hilos
+        embedding = await en_hilo(cache_embeddings.obtener, self.embedding_model, texto)
+        if embedding is None:
+            respuesta = await self.client_async.embeddings.create(
+                model=self.embedding_model,
+                input=texto
+            )
+            embedding = respuesta.data[0].embedding
+            await en_hilo(cache_embeddings.guardar, self.embedding_model, texto, embedding)
+        return embedding
+    
+    async def buscar_respuesta_cacheada(self, consulta: str, embedding: Optional[List[float]] = None) -> Optional[str]:
+        """Respuesta ya dada en esta campaña a una pregunta equivalente (ver CacheRespuestas)"""
+        if not respuestas_cacheadas.activo:
+            return None
+        embedding = embedding or await self.generar_embedding_consulta(consulta)
+        return respuestas_cacheadas.buscar(self.empresa_id, self.campania_id, embedding)
+    
+    async def guardar_respuesta_cacheada(self, consulta: str, respuesta: str, embedding: Optional[List[float]] = None):
+        if not respuestas_cacheadas.activo:
+            return
+        # El embedding ya está en el cache de embeddings por la búsqueda
+        embedding = embedding or await self.generar_embedding_consulta(consulta)
+        respuestas_cacheadas.guardar(self.empresa_id, self.campania_id, embedding, respuesta)
+    
+    async def _mensajes_llm(self, consulta: str, contexto: str, resumen_cliente: str = "", historial: Optional[str] = None) -> List[Dict[str, str]]:
+        """Prompt de sistema (contexto, resumen e historial) más la consulta del cliente"""
         
-        historial = self.obtener_historial_reciente()
+        if historial is None:
+            historial = await self.obtener_historial_reciente()
         
         info_campania = f"Estás vendiendo el curso de {self.campania_id}." if self.campania_id else ""
         
@@ -104,24 +205,79 @@ class RAGService:
         Si no sabes algo, sugiere contactar a un asesor humano.
         Respondé como una persona normal en WhatsApp, sin usar asteriscos, guiones ni ningún símbolo raro. Texto plano siempre."""
         
-        respuesta = self.client.chat.completions.create(
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": consulta}
+        ]
+    
+    async def generar_respuesta_llm(self, consulta: str, contexto: str, resumen_cliente: str = "", historial: Optional[str] = None) -> str:
+        """
+        Genera respuesta usando el modelo configurado de OpenAI con historial de conversación
+        (si no se pasa `historial` se consulta acá)
+        """
+        respuesta = await self.client_async.chat.completions.create(
             model=self.chat_model,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": consulta}
-            ],
+            messages=await self._mensajes_llm(consulta, contexto, resumen_cliente, historial),
             temperature=0.4
         )
         
         return respuesta.choices[0].message.content
     
-    def guardar_documento(self, nombre_archivo: str, contenido_bytes: bytes, campania_id: Optional[str] = None, mensaje_entrega: Optional[str] = None, precio: Optional[float] = None, tipo_campania: Optional[str] = "producto_unico"):
-        """Procesa y guarda un documento en la base de datos vectorial"""
+    async def generar_respuesta_llm_stream(self, consulta: str, contexto: str, resumen_cliente: str = "", historial: Optional[str] = None) -> AsyncIterator[str]:
+        """
+        Igual que generar_respuesta_llm pero consume la respuesta como stream y la
+        entrega por frases apenas se completan (unidas dan el texto completo).
+        """
+        stream = await self.client_async.chat.completions.create(
+            model=self.chat_model,
+            messages=await self._mensajes_llm(consulta, contexto, resumen_cliente, historial),
+            temperature=0.4,
+            stream=True
+        )
+        
+        segmentador = SegmentadorFrases(settings.LLM_STREAMING_MIN_CARACTERES)
+        async for evento in stream:
+            if not evento.choices:
+                continue
+            delta = evento.choices[0].delta.content
+            if delta:
+                for frase in segmentador.agregar(delta):
+                    yield frase
+        
+        resto = segmentador.terminar()
+        if resto:
+            yield resto
+    
+    def guardar_documento(self, nombre_archivo: str, archivo: OrigenPDF, campania_id: Optional[str] = None, mensaje_entrega: Optional[str] = None, precio: Optional[float] = None, tipo_campania: Optional[str] = "producto_unico", progreso: Optional[Callable[[str, int], None]] = None):
+        """
+        Procesa y guarda un documento en la base de datos vectorial.
+        `archivo` puede ser el contenido en bytes o la ruta del PDF en disco. Las páginas
+        se leen en streaming, se dividen en chunks de CHUNK_TOKENS tokens (guardando página
+        y offsets) y se embeben por ventanas que esperan en disco, así la memoria no depende
+        del tamaño del documento. El documento y sus chunks se escriben al final, en una
+        sola transacción corta.
+        `progreso(etapa, porcentaje)` permite informar el avance a quien lo llama.
+        """
         from app.models.documento import Documento, ChunkDocumento
         import re
         import random
         import string
         
+        def reportar(etapa: str, porcentaje: int):
+            if progreso:
+                progreso(etapa, porcentaje)
+        
+        # Si la empresa ya subió exactamente este archivo no hay nada que procesar
+        hash_contenido = calcular_md5(archivo)
+        existente = self.db.query(Documento).filter(
+            Documento.empresa_id == self.empresa_id,
+            Documento.hash_contenido == hash_contenido
+        ).first()
+        if existente:
+            print(f"♻️ Documento duplicado, ya existe como ID {existente.id} (campaña {existente.campania_id})")
+            reportar("duplicado", 100)
+            return existente
+        
         # GENERAR IDENTIFICADOR AUTOMÁTICO SI NO VIENE
         if not campania_id or not campania_id.strip():
             nombre_base = os.path.splitext(nombre_archivo)[0]
@@ -141,60 +297,325 @@ class RAGService:
         if tipo_campania not in ["producto_unico", "pedido_multiple", "informativo"]:
             tipo_campania = "producto_unico"
         
-        # Extraer texto
-        texto = self.extraer_texto_pdf(contenido_bytes)
-        
-        # Crear registro del documento
-        doc = Documento(
-            empresa_id=self.empresa_id,
-            nombre=nombre_archivo,
-            hash_contenido=hashlib.md5(contenido_bytes).hexdigest(),
-            campania_id=campania_id,
-            mensaje_entrega=mensaje_entrega,
-            precio=precio,
-            tipo_campania=tipo_campania  # 🔥 NUEVO CAMPO
+        # Mismo nombre en la misma campaña = nueva versión de un documento existente
+        version_anterior = self.db.query(Documento).filter(
+            Documento.empresa_id == self.empresa_id,
+            Documento.campania_id == campania_id,
+            Documento.nombre == nombre_archivo
+        ).first()
+        ultimo_chunk_anterior = None
+        if version_anterior:
+            # Sus chunks siguen en la tabla hasta el final para reutilizar sus embeddings
+            ultimo_chunk_anterior = self.db.query(func.max(ChunkDocumento.id)).filter(
+                ChunkDocumento.documento_id == version_anterior.id
+            ).scalar()
+        
+        def preparar_documento():
+            """Crea el documento (o actualiza la versión anterior) con los chunks ya embebidos"""
+            if version_anterior:
+                # Reemplazar el contenido de la versión anterior conservando su ID
+                version_anterior.hash_contenido = hash_contenido
+                version_anterior.tipo_campania = tipo_campania
+                if mensaje_entrega is not None:
+                    version_anterior.mensaje_entrega = mensaje_entrega
+                if precio is not None:
+                    version_anterior.precio = precio
+                print(f"🔁 Actualizando documento ID {version_anterior.id} con la nueva versión")
+                return version_anterior
+            
+            # Crear registro del documento
+            nuevo = Documento(
+                empresa_id=self.empresa_id,
+                nombre=nombre_archivo,
+                hash_contenido=hash_contenido,
+                campania_id=campania_id,
+                mensaje_entrega=mensaje_entrega,
+                precio=precio,
+                tipo_campania=tipo_campania  # 🔥 NUEVO CAMPO
+            )
+            self.db.add(nuevo)
+            self.db.flush()
+            return nuevo
+        
+        reportar("extrayendo_texto", 5)
+        total_paginas = max(contar_paginas(archivo), 1)
+        pagina_actual = 0
+        
+        def paginas() -> Iterator[Tuple[int, str]]:
+            nonlocal pagina_actual
+            for numero, texto_pagina in self.iterar_paginas_pdf(archivo):
+                pagina_actual = numero
+                yield numero, texto_pagina
+        
+        chunks_stream = dividir_en_chunks_tokens(
+            paginas(),
+            self.embedding_model,
+            tamano_chunk=settings.CHUNK_TOKENS,
+            solapamiento=settings.CHUNK_SOLAPAMIENTO_TOKENS
         )
-        self.db.add(doc)
-        self.db.flush()
-        
-        # Dividir en chunks y generar embeddings
-        chunks = self.dividir_en_chunks(texto)
-        for i, chunk_texto in enumerate(chunks):
-            embedding = self.generar_embedding(chunk_texto)
+        tamano_ventana = settings.EMBEDDING_TAMANO_LOTE * settings.EMBEDDING_CONCURRENCIA
+        total_chunks = 0
+        total_reutilizados = 0
+        # Las ventanas ya embebidas esperan en un archivo temporal y se insertan al final en
+        # una transacción corta: las llamadas a la API de embeddings no quedan dentro de una
+        # transacción con el documento y los chunks escritos (locks de filas y de la clave única)
+        ventanas = tempfile.TemporaryFile()
+        cantidad_ventanas = 0
+        
+        while True:
+            chunks = list(islice(chunks_stream, tamano_ventana))
+            if not chunks:
+                break
+            hashes = [self._hash_chunk(chunk.texto) for chunk in chunks]
+            
+            # Solo se piden embeddings para los chunks cuyo texto no se conoce todavía
+            embeddings_por_hash = self._embeddings_existentes(hashes)
+            pendientes = {}
+            for chunk, hash_texto in zip(chunks, hashes):
+                if hash_texto not in embeddings_por_hash:
+                    pendientes.setdefault(hash_texto, chunk.texto)
+            nuevos = self.generar_embeddings_lote(list(pendientes.values()))
+            embeddings_por_hash.update(zip(pendientes.keys(), nuevos))
+            # Solo se leyó: no se deja la transacción abierta durante la próxima ventana
+            self.db.rollback()
             
-            chunk = ChunkDocumento(
-                documento_id=doc.id,
-                indice=i,
-                texto=chunk_texto,
-                embedding=embedding
+            pickle.dump(
+                [
+                    {
+                        "indice": total_chunks + i,
+                        "texto": chunk.texto,
+                        "hash_texto": hash_texto,
+                        "embedding": embeddings_por_hash[hash_texto],
+                        "pagina_inicio": chunk.pagina_inicio,
+                        "pagina_fin": chunk.pagina_fin,
+                        "char_inicio": chunk.char_inicio,
+                        "char_fin": chunk.char_fin
+                    }
+                    for i, (chunk, hash_texto) in enumerate(zip(chunks, hashes))
+                ],
+                ventanas
+            )
+            cantidad_ventanas += 1
+            total_chunks += len(chunks)
+            total_reutilizados += len(chunks) - len(pendientes)
+            reportar("generando_embeddings", 5 + int(85 * pagina_actual / total_paginas))
+        
+        print(f"🧩 {total_chunks} chunks: {total_reutilizados} reutilizados, {total_chunks - total_reutilizados} embebidos")
+        reportar("guardando", 92)
+        
+        doc = preparar_documento()
+        # Un INSERT masivo por ventana
+        with ventanas:
+            ventanas.seek(0)
+            for _ in range(cantidad_ventanas):
+                filas = pickle.load(ventanas)
+                self.db.execute(insert(ChunkDocumento), [{"documento_id": doc.id, **fila} for fila in filas])
+        if ultimo_chunk_anterior is not None:
+            self.db.execute(
+                delete(ChunkDocumento).where(
+                    ChunkDocumento.documento_id == doc.id,
+                    ChunkDocumento.id <= ultimo_chunk_anterior
+                )
             )
-            self.db.add(chunk)
         
         self.db.commit()
+        indices_vectoriales.invalidar(self.empresa_id, campania_id)
+        respuestas_cacheadas.invalidar(self.empresa_id, campania_id)
         return doc
     
-    def buscar_similares(self, consulta: str, top_k: int = 3) -> List[Dict[str, Any]]:
-        """Busca chunks similares usando pgvector con filtro por campaña"""
+    def _hash_chunk(self, texto: str) -> str:
+        """
+        Hash del modelo de embeddings y el texto: un embedding solo se reutiliza si
+        salió del mismo modelo (si la empresa lo cambia, los vectores viejos no sirven).
+        Los chunks sin hash o con el hash anterior (solo texto) se vuelven a embeber.
+        """
+        return hashlib.sha256(f"{self.embedding_model}\x00{texto}".encode("utf-8")).hexdigest()
+    
+    def _embeddings_existentes(self, hashes: List[str]) -> Dict[str, Any]:
+        """Embeddings ya guardados en la empresa para chunks con el mismo texto y modelo, por hash"""
         from app.models.documento import ChunkDocumento, Documento
         
-        embedding_consulta = self.generar_embedding(consulta)
+        embeddings_por_hash = {}
+        if not hashes:
+            return embeddings_por_hash
         
-        query = self.db.query(
+        existentes = self.db.query(ChunkDocumento.hash_texto, ChunkDocumento.embedding).join(
+            Documento, ChunkDocumento.documento_id == Documento.id
+        ).filter(
+            Documento.empresa_id == self.empresa_id,
+            ChunkDocumento.hash_texto.in_(set(hashes)),
+            ChunkDocumento.embedding.isnot(None)
+        ).all()
+        for hash_texto, embedding in existentes:
+            embeddings_por_hash.setdefault(hash_texto, embedding)
+        
+        return embeddings_por_hash
+    
+    async def buscar_similares(self, consulta: str, top_k: int = 3, embedding_consulta: Optional[List[float]] = None) -> List[Dict[str, Any]]:
+        """Busca chunks similares con filtro por campaña (con el embedding de la consulta si ya se calculó)"""
+        embedding_consulta = embedding_consulta or await self.generar_embedding_consulta(consulta)
+        
+        if self.campania_id:
+            print(f"🔍 Buscando en campaña: {self.campania_id}")
+        else:
+            print("⚠️ Buscando en TODOS los documentos (sin filtro de campaña)")
+        
+        if settings.RAG_MODO_BUSQUEDA == "memoria":
+            return await self._buscar_similares_memoria(embedding_consulta, top_k)
+        if settings.RAG_MODO_BUSQUEDA == "python":
+            return await self._buscar_similares_python(embedding_consulta, top_k)
+        return await self._buscar_similares_pgvector(embedding_consulta, top_k)
+    
+    @staticmethod
+    def _ubicacion_chunk(fila) -> Dict[str, Optional[int]]:
+        """Página y offsets del chunk en el documento (None en chunks anteriores a estas columnas)"""
+        return {
+            "pagina_inicio": fila.pagina_inicio,
+            "pagina_fin": fila.pagina_fin,
+            "char_inicio": fila.char_inicio,
+            "char_fin": fila.char_fin
+        }
+    
+    async def _buscar_similares_pgvector(self, embedding_consulta: List[float], top_k: int) -> List[Dict[str, Any]]:
+        """Ordena por distancia coseno en PostgreSQL (índice HNSW) y trae solo los top_k"""
+        from app.models.documento import ChunkDocumento, Documento
+        
+        distancia = ChunkDocumento.embedding.cosine_distance(embedding_consulta)
+        
+        query = select(
+            ChunkDocumento.id,
+            ChunkDocumento.documento_id,
+            ChunkDocumento.texto,
+            ChunkDocumento.pagina_inicio,
+            ChunkDocumento.pagina_fin,
+            ChunkDocumento.char_inicio,
+            ChunkDocumento.char_fin,
+            Documento.nombre.label("documento_nombre"),
+            distancia.label("distancia")
+        ).join(
+            Documento, ChunkDocumento.documento_id == Documento.id
+        ).where(
+            Documento.empresa_id == self.empresa_id
+        )
+        
+        if self.campania_id:
+            query = query.where(Documento.campania_id == self.campania_id)
+        
+        # Solo afecta a la transacción actual
+        await self.db.execute(
+            text("SELECT set_config('hnsw.ef_search', :ef, true)"),
+            {"ef": str(settings.RAG_HNSW_EF_SEARCH)}
+        )
+        # El filtro por empresa/campaña se aplica sobre los candidatos del índice global:
+        # con iterative_scan el índice sigue explorando hasta completar top_k
+        if await self._version_pgvector() >= (0, 8):
+            await self.db.execute(text("SELECT set_config('hnsw.iterative_scan', 'relaxed_order', true)"))
+        
+        # relaxed_order puede devolverlas apenas desordenadas
+        filas = sorted((await self.db.execute(query.order_by(distancia).limit(top_k))).all(), key=lambda f: f.distancia)
+        
+        if len(filas) < top_k:
+            # Empresa o campaña con pocos chunks del total (o pgvector < 0.8): búsqueda
+            # exacta sobre los chunks del filtro. Ordenar por distancia + 0 evita el índice HNSW
+            filas = (await self.db.execute(query.order_by(distancia + 0).limit(top_k))).all()
+        
+        return [
+            {
+                "texto": fila.texto,
+                "similitud": 1 - float(fila.distancia),
+                "documento": fila.documento_nombre,
+                "documento_id": fila.documento_id,
+                "chunk_id": fila.id,
+                **self._ubicacion_chunk(fila)
+            }
+            for fila in filas
+        ]
+    
+    async def _version_pgvector(self) -> Tuple[int, ...]:
+        global _version_pgvector
+        if _version_pgvector is None:
+            version = await self.db.scalar(text("SELECT extversion FROM pg_extension WHERE extname = 'vector'"))
+            _version_pgvector = tuple(int(parte) for parte in (version or "0").split(".") if parte.isdigit())
+        return _version_pgvector
+    
+    async def _construir_indice(self) -> IndiceCampania:
+        """Carga los embeddings de la empresa/campaña para el índice en memoria"""
+        from app.models.documento import ChunkDocumento, Documento
+        
+        query = select(
+            ChunkDocumento.id,
+            ChunkDocumento.embedding
+        ).join(
+            Documento, ChunkDocumento.documento_id == Documento.id
+        ).where(
+            Documento.empresa_id == self.empresa_id,
+            ChunkDocumento.embedding.isnot(None)
+        )
+        
+        if self.campania_id:
+            query = query.where(Documento.campania_id == self.campania_id)
+        
+        filas = (await self.db.execute(query)).all()
+        print(f"🧮 Índice en memoria construido: {len(filas)} chunks (empresa {self.empresa_id}, campaña {self.campania_id})")
+        # Armar la matriz es CPU puro: fuera del event loop
+        return await en_hilo(IndiceCampania.desde_filas, filas)
+    
+    async def _buscar_similares_memoria(self, embedding_consulta: List[float], top_k: int) -> List[Dict[str, Any]]:
+        """Puntúa todos los chunks con un producto matriz-vector sobre el índice cacheado"""
+        from app.models.documento import ChunkDocumento, Documento
+        
+        indice = await indices_vectoriales.obtener(self.empresa_id, self.campania_id, self._construir_indice)
+        mejores = await en_hilo(indice.buscar, embedding_consulta, top_k)
+        if not mejores:
+            return []
+        
+        # Solo se leen de la base los textos de los chunks ganadores
+        filas = (await self.db.execute(select(
+            ChunkDocumento.id,
+            ChunkDocumento.documento_id,
+            ChunkDocumento.texto,
+            ChunkDocumento.pagina_inicio,
+            ChunkDocumento.pagina_fin,
+            ChunkDocumento.char_inicio,
+            ChunkDocumento.char_fin,
+            Documento.nombre.label("documento_nombre")
+        ).join(
+            Documento, ChunkDocumento.documento_id == Documento.id
+        ).where(
+            ChunkDocumento.id.in_([chunk_id for chunk_id, _ in mejores])
+        ))).all()
+        por_id = {fila.id: fila for fila in filas}
+        
+        return [
+            {
+                "texto": por_id[chunk_id].texto,
+                "similitud": similitud,
+                "documento": por_id[chunk_id].documento_nombre,
+                "documento_id": por_id[chunk_id].documento_id,
+                "chunk_id": chunk_id,
+                **self._ubicacion_chunk(por_id[chunk_id])
+            }
+            for chunk_id, similitud in mejores
+            if chunk_id in por_id
+        ]
+    
+    async def _buscar_similares_python(self, embedding_consulta: List[float], top_k: int) -> List[Dict[str, Any]]:
+        """Cálculo legacy: trae todos los chunks y compara uno por uno en Python"""
+        from app.models.documento import ChunkDocumento, Documento
+        
+        query = select(
             ChunkDocumento,
             Documento.nombre.label("documento_nombre")
         ).join(
             Documento, ChunkDocumento.documento_id == Documento.id
-        ).filter(
+        ).where(
             Documento.empresa_id == self.empresa_id
         )
         
         if self.campania_id:
-            query = query.filter(Documento.campania_id == self.campania_id)
-            print(f"🔍 Buscando en campaña: {self.campania_id}")
-        else:
-            print("⚠️ Buscando en TODOS los documentos (sin filtro de campaña)")
+            query = query.where(Documento.campania_id == self.campania_id)
         
-        chunks = query.all()
+        chunks = (await self.db.execute(query)).all()
         
         resultados = []
         for chunk, doc_nombre in chunks:
@@ -206,7 +627,8 @@ class RAGService:
                 "similitud": similitud,
                 "documento": doc_nombre,
                 "documento_id": chunk.documento_id,
-                "chunk_id": chunk.id
+                "chunk_id": chunk.id,
+                **self._ubicacion_chunk(chunk)
             })
         
         resultados.sort(key=lambda x: x["similitud"], reverse=True)
@@ -0,0 +1,239 @@
+import asyncio
+import datetime
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from sqlalchemy import insert, select
+from sqlalchemy.exc import DataError, IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db.base import AsyncSessionLocal
+from app.models.conversacion import Conversacion, TipoEmisor
+from app.services.cache import CacheTTL
+
+class RegistroConversaciones:
+    """
+    Escritura diferida de los mensajes de Conversacion: se acumulan en memoria y se
+    insertan por lotes (un executemany y un commit) cada `intervalo_segundos` o al
+    juntar `max_lote` filas, en vez de un commit por mensaje. Si el lote falla por
+    una fila inválida (por ejemplo de un cliente ya borrado) se inserta de a una y
+    se descartan las que fallan; si la base no responde se reintenta, con a lo sumo
+    `max_pendientes` mensajes en memoria.
+    
+    El timestamp se fija al registrar el mensaje, así el orden no depende de cuándo
+    se inserta. `leer` combina la base con lo pendiente para que el historial vea
+    los mensajes recién registrados.
+    
+    Además guarda los últimos `max_recientes` mensajes de cada cliente activo (LRU de
+    `max_clientes`): se completan en cada `registrar` y el historial se lee de ahí,
+    yendo a Postgres solo al cargarlos. La copia vence `ttl_segundos` después de
+    cargarse: con varias réplicas, los turnos que atendió otra aparecen al recargar.
+    """
+    def __init__(
+        self,
+        intervalo_segundos: float,
+        max_lote: int,
+        max_pendientes: int,
+        max_recientes: int,
+        max_clientes: int,
+        ttl_segundos: float
+    ):
+        self.intervalo_segundos = intervalo_segundos
+        self.max_lote = max_lote
+        self.max_pendientes = max(max_pendientes, max_lote)
+        self.max_recientes = max_recientes
+        # Cliente -> deque de sus últimos mensajes. El vencimiento se fija al cargar
+        # de la base; registrar agrega a la misma deque sin renovarlo
+        self._recientes = CacheTTL(max_clientes, ttl_segundos)
+        self._pendientes: List[Dict[str, Any]] = []
+        # Lote que se está insertando: sigue visible para `leer` hasta el commit
+        self._en_vuelo: List[Dict[str, Any]] = []
+        self._escribiendo = asyncio.Lock()
+        self._lote_lleno = asyncio.Event()
+        self._tarea: Optional[asyncio.Task] = None
+        self._cerrando = False
+        self.insertados = 0
+        self.lotes = 0
+        self.descartados = 0
+        self.historial_aciertos = 0
+        self.historial_fallos = 0
+    
+    def registrar(self, cliente_id: int, mensaje: str, emisor: TipoEmisor):
+        fila = {
+            "cliente_id": cliente_id,
+            "mensaje": mensaje,
+            "emisor": emisor,
+            "timestamp": datetime.datetime.now(datetime.timezone.utc)
+        }
+        self._pendientes.append(fila)
+        self._recortar_pendientes()
+        if len(self._pendientes) >= self.max_lote:
+            self._lote_lleno.set()
+        
+        recientes = self._recientes.obtener(cliente_id)
+        if recientes is not None:
+            recientes.append(fila)
+    
+    async def leer(self, db: AsyncSession, cliente_id: int, limite: Optional[int] = None) -> List[Conversacion]:
+        """
+        Mensajes del cliente en orden cronológico (los últimos `limite` si se pasa),
+        incluyendo los que todavía no se insertaron. Hasta `max_recientes` se
+        responde desde memoria.
+        """
+        if limite and limite <= self.max_recientes:
+            recientes = self._recientes.obtener(cliente_id)
+            if recientes is None:
+                self.historial_fallos += 1
+                recientes = await self._cargar_recientes(db, cliente_id)
+            else:
+                self.historial_aciertos += 1
+            return [Conversacion(**fila) for fila in list(recientes)[-limite:]]
+        
+        return [Conversacion(**fila) for fila in await self._leer_base(db, cliente_id, limite)]
+    
+    async def _cargar_recientes(self, db: AsyncSession, cliente_id: int) -> Deque[Dict[str, Any]]:
+        recientes = deque(await self._leer_base(db, cliente_id, self.max_recientes), maxlen=self.max_recientes)
+        self._recientes.guardar(cliente_id, recientes)
+        return recientes
+    
+    async def _leer_base(self, db: AsyncSession, cliente_id: int, limite: Optional[int]) -> List[Dict[str, Any]]:
+        """Últimos mensajes en Postgres más los pendientes de escribir, como filas"""
+        # Se toman antes y después de consultar: si un lote se confirma mientras
+        # tanto la consulta lo trae o sigue en la primera copia, y lo registrado
+        # durante la consulta está en la segunda (los repetidos se descartan)
+        pendientes = self._pendientes_de(cliente_id)
+        
+        consulta = select(Conversacion).where(
+            Conversacion.cliente_id == cliente_id
+        ).order_by(Conversacion.timestamp.desc())
+        if limite:
+            consulta = consulta.limit(limite)
+        filas = [
+            {"cliente_id": m.cliente_id, "mensaje": m.mensaje, "emisor": m.emisor, "timestamp": m.timestamp}
+            for m in (await db.scalars(consulta)).all()
+        ]
+        
+        vistas = {(f["timestamp"], f["emisor"], f["mensaje"]) for f in filas}
+        for fila in pendientes + self._pendientes_de(cliente_id):
+            clave = (fila["timestamp"], fila["emisor"], fila["mensaje"])
+            if clave not in vistas:
+                vistas.add(clave)
+                filas.append(fila)
+        filas.sort(key=lambda f: f["timestamp"])
+        return filas[-limite:] if limite else filas
+    
+    def _recortar_pendientes(self):
+        sobrantes = len(self._pendientes) - self.max_pendientes
+        if sobrantes > 0:
+            del self._pendientes[:sobrantes]
+            self.descartados += sobrantes
+            print(f"⚠️ Se descartaron {sobrantes} mensajes de conversación sin guardar (tope de pendientes)")
+    
+    def _pendientes_de(self, cliente_id: int) -> List[Dict[str, Any]]:
+        return [fila for fila in self._en_vuelo + self._pendientes if fila["cliente_id"] == cliente_id]
+    
+    async def descartar(self, cliente_id: int):
+        """
+        Olvida lo pendiente y el historial en memoria del cliente antes de borrar su
+        historial. Si hay un lote insertándose con mensajes suyos se espera a que
+        termine, para que el borrado no quede antes que esas filas.
+        """
+        self._recientes.eliminar(cliente_id)
+        self._pendientes = [fila for fila in self._pendientes if fila["cliente_id"] != cliente_id]
+        if any(fila["cliente_id"] == cliente_id for fila in self._en_vuelo):
+            async with self._escribiendo:
+                # Si el lote falló sus filas volvieron a pendientes
+                self._pendientes = [fila for fila in self._pendientes if fila["cliente_id"] != cliente_id]
+    
+    async def escribir(self):
+        """Inserta todo lo pendiente en un solo lote"""
+        async with self._escribiendo:
+            if not self._pendientes:
+                return
+            self._en_vuelo, self._pendientes = self._pendientes, []
+            self._lote_lleno.clear()
+            try:
+                async with AsyncSessionLocal() as db:
+                    try:
+                        await db.execute(insert(Conversacion), self._en_vuelo)
+                        await db.commit()
+                        insertados = len(self._en_vuelo)
+                    except (IntegrityError, DataError):
+                        # Una fila inválida no frena a las demás
+                        await db.rollback()
+                        insertados = await self._escribir_de_a_una(db, self._en_vuelo)
+            except Exception:
+                # La base no responde: vuelven adelante para el próximo intento, en el mismo orden
+                self._pendientes = self._en_vuelo + self._pendientes
+                self._recortar_pendientes()
+                raise
+            finally:
+                self._en_vuelo = []
+            self.insertados += insertados
+            self.lotes += 1
+    
+    async def _escribir_de_a_una(self, db: AsyncSession, filas: List[Dict[str, Any]]) -> int:
+        """Inserta cada fila en su savepoint y descarta las que fallan (un solo commit)"""
+        insertados = 0
+        for fila in filas:
+            try:
+                async with db.begin_nested():
+                    await db.execute(insert(Conversacion), [fila])
+                insertados += 1
+            except (IntegrityError, DataError) as e:
+                self.descartados += 1
+                print(f"⚠️ Mensaje de conversación descartado (cliente {fila['cliente_id']}): {getattr(e, 'orig', e)}")
+        await db.commit()
+        return insertados
+    
+    async def _escribir_periodicamente(self):
+        while not self._cerrando:
+            try:
+                await asyncio.wait_for(self._lote_lleno.wait(), timeout=self.intervalo_segundos)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.escribir()
+            except Exception as e:
+                print(f"❌ Error guardando mensajes de conversación (se reintenta): {e}")
+    
+    def iniciar(self):
+        """Arranca la escritura periódica (desde el lifespan de FastAPI)"""
+        self._cerrando = False
+        self._tarea = asyncio.create_task(self._escribir_periodicamente())
+    
+    async def cerrar(self):
+        """
+        Guarda lo que quedó pendiente y detiene la escritura periódica (al apagar).
+        No se cancela la tarea: un lote a medio insertar se perdería.
+        """
+        self._cerrando = True
+        self._lote_lleno.set()
+        if self._tarea:
+            await self._tarea
+            self._tarea = None
+        try:
+            await self.escribir()
+        except Exception as e:
+            print(f"❌ Se perdieron {len(self._pendientes)} mensajes de conversación al cerrar: {e}")
+    
+    def estadisticas(self) -> Dict[str, int]:
+        return {
+            "pendientes": len(self._pendientes),
+            "mensajes_insertados": self.insertados,
+            "lotes": self.lotes,
+            "descartados": self.descartados,
+            "historiales_en_memoria": len(self._recientes),
+            "historial_aciertos": self.historial_aciertos,
+            "historial_fallos": self.historial_fallos
+        }
+
+registro_conversaciones = RegistroConversaciones(
+    intervalo_segundos=settings.CONVERSACIONES_ESCRITURA_SEGUNDOS,
+    max_lote=settings.CONVERSACIONES_MAX_LOTE,
+    max_pendientes=settings.CONVERSACIONES_MAX_PENDIENTES,
+    max_recientes=settings.HISTORIAL_RECIENTE_MAX_MENSAJES,
+    max_clientes=settings.HISTORIAL_RECIENTE_MAX_CLIENTES,
+    ttl_segundos=settings.HISTORIAL_RECIENTE_TTL_SEGUNDOS
+)
@@ -0,0 +1,95 @@
+import asyncio
+from typing import Dict, Hashable, Optional
+
+from app.core.config import settings
+from app.services.cache import CacheTTL
+from app.services.clientes_api import obtener_groq_async, obtener_http
+
+async def transcribir_audio(url_audio: str, groq_api_key: str, whatsapp_token: str) -> str:
+    """Transcribe audio usando Groq Whisper desde URL directa (lanza la excepción si falla)"""
+    client = obtener_groq_async(groq_api_key)
+    
+    headers = {"Authorization": f"Bearer {whatsapp_token}"}
+    response = await obtener_http().get(url_audio, headers=headers)
+    
+    if response.status_code != 200:
+        raise Exception(f"Error descargando audio: {response.status_code}")
+    
+    archivo = ("audio.ogg", response.content, "audio/ogg")
+    
+    return await client.audio.transcriptions.create(
+        file=archivo,
+        model="whisper-large-v3",
+        response_format="text"
+    )
+
+class Transcriptor:
+    """
+    Transcribe las notas de voz en tareas aparte del mensaje que las trae.
+    
+    Cada audio se transcribe una sola vez: el futuro queda guardado por (empresa,
+    sha256 o id del medio), así una re-entrega de Meta, un reintento de la cola o
+    el evento que responde un audio demorado recibe el resultado (o espera la
+    transcripción en curso) sin volver a llamar a Whisper. Los errores no se guardan. Por empresa corren a lo sumo
+    `concurrencia_por_empresa` transcripciones a la vez.
+    """
+    def __init__(self, concurrencia_por_empresa: int, max_entradas: int, ttl_segundos: float):
+        self.concurrencia_por_empresa = concurrencia_por_empresa
+        self._resultados = CacheTTL(max_entradas, ttl_segundos)
+        self._semaforos: Dict[int, asyncio.Semaphore] = {}
+        self.transcritos = 0
+        self.reutilizados = 0
+        self.fallidos = 0
+    
+    def transcribir(
+        self,
+        empresa_id: int,
+        clave_medio: Optional[Hashable],
+        url_audio: str,
+        groq_api_key: str,
+        whatsapp_token: str
+    ) -> "asyncio.Future[str]":
+        """
+        Futuro con el texto del audio. Conviene esperarlo con
+        asyncio.wait_for(asyncio.shield(futuro), ...): vencer la espera no cancela
+        la transcripción.
+        """
+        clave = (empresa_id, clave_medio or url_audio)
+        futuro = self._resultados.obtener(clave)
+        if futuro is not None:
+            self.reutilizados += 1
+            return futuro
+        
+        futuro = asyncio.ensure_future(self._transcribir(empresa_id, clave, url_audio, groq_api_key, whatsapp_token))
+        self._resultados.guardar(clave, futuro)
+        return futuro
+    
+    async def _transcribir(self, empresa_id: int, clave: tuple, url_audio: str, groq_api_key: str, whatsapp_token: str) -> str:
+        semaforo = self._semaforos.get(empresa_id)
+        if semaforo is None:
+            semaforo = self._semaforos[empresa_id] = asyncio.Semaphore(self.concurrencia_por_empresa)
+        try:
+            async with semaforo:
+                texto = await transcribir_audio(url_audio, groq_api_key, whatsapp_token)
+        except Exception as e:
+            # Se olvida para que el próximo intento vuelva a transcribir
+            self._resultados.eliminar(clave)
+            self.fallidos += 1
+            print(f"❌ Error en transcripción con Groq: {type(e).__name__}: {str(e)}")
+            raise
+        self.transcritos += 1
+        return texto
+    
+    def estadisticas(self) -> Dict[str, int]:
+        return {
+            "transcritos": self.transcritos,
+            "reutilizados": self.reutilizados,
+            "fallidos": self.fallidos,
+            "en_cache": len(self._resultados)
+        }
+
+transcriptor = Transcriptor(
+    concurrencia_por_empresa=settings.TRANSCRIPCION_CONCURRENCIA_POR_EMPRESA,
+    max_entradas=settings.TRANSCRIPCIONES_CACHE_MAX_ENTRADAS,
+    ttl_segundos=settings.TRANSCRIPCIONES_CACHE_TTL_SEGUNDOS
+)
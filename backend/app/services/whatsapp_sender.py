@@ -1,6 +1,10 @@
 import os
 import httpx
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, AsyncIterator, Tuple
+from app.services.clientes_api import obtener_http_meta
+
+# Cierre para una respuesta en streaming que se cortó después de enviar alguna parte
+RESPUESTA_INTERRUMPIDA = "⚠️ Se me cortó la respuesta. Si te faltó algo, escríbeme de nuevo y te ayudo. 😊"
 
 async def enviar_mensaje_whatsapp(
     telefono_destino: str,
@@ -54,8 +58,7 @@ async def enviar_mensaje_whatsapp(
     }
     
     try:
-        async with httpx.AsyncClient(timeout=10) as client:
-            response = await client.post(base_url, headers=headers, json=payload)
+        response = await obtener_http_meta().post(base_url, headers=headers, json=payload)
         
         if response.status_code == 200 or response.status_code == 201:
             return {
@@ -68,7 +71,7 @@ async def enviar_mensaje_whatsapp(
                 "error": f"Error {response.status_code}",
                 "detalles": response.json()
             }
-            
+    
     except httpx.TimeoutException:
         return {
             "exito": False,
@@ -132,14 +135,13 @@ async def enviar_mensaje_con_plantilla(
     }
     
     try:
-        async with httpx.AsyncClient(timeout=10) as client:
-            response = await client.post(base_url, headers=headers, json=payload)
+        response = await obtener_http_meta().post(base_url, headers=headers, json=payload)
         
         if response.status_code == 200 or response.status_code == 201:
             return {"exito": True, "data": response.json()}
         else:
             return {"exito": False, "error": f"Error {response.status_code}", "detalles": response.json()}
-            
+    
     except Exception as e:
         return {"exito": False, "error": f"Error: {str(e)}"}
 
@@ -209,17 +211,67 @@ async def enviar_mensaje_con_botones(
     }
     
     try:
-        async with httpx.AsyncClient(timeout=10) as client:
-            response = await client.post(base_url, headers=headers, json=payload)
+        response = await obtener_http_meta().post(base_url, headers=headers, json=payload)
         
         if response.status_code == 200 or response.status_code == 201:
             return {"exito": True, "data": response.json()}
         else:
             return {"exito": False, "error": f"Error {response.status_code}", "detalles": response.json()}
-            
+    
     except httpx.TimeoutException:
         return {"exito": False, "error": "Timeout al conectar con la API de WhatsApp"}
     except httpx.ConnectError:
         return {"exito": False, "error": "Error de conexión con la API de WhatsApp"}
     except Exception as e:
-        return {"exito": False, "error": f"Error inesperado: {str(e)}"}
\ No newline at end of file
+        return {"exito": False, "error": f"Error inesperado: {str(e)}"}
+
+async def enviar_mensaje_en_partes(
+    telefono_destino: str,
+    partes: AsyncIterator[str],
+    token: str,
+    phone_number_id: str,
+    prefijo: str = ""
+) -> Tuple[str, bool]:
+    """
+    Envía cada parte de un texto generado en streaming como un mensaje aparte,
+    a medida que van llegando (el cliente lee la primera frase sin esperar el resto)
+    
+    Si el stream o el envío de una parte fallan antes de entregar nada se propaga el
+    error (el turno se puede reintentar entero). Si fallan después, reintentar
+    repetiría lo que el cliente ya leyó: se cierra con RESPUESTA_INTERRUMPIDA y no
+    se propaga.
+    
+    Args:
+        telefono_destino: Número de teléfono del destinatario
+        partes: Frases en orden (por ejemplo de RAGService.generar_respuesta_llm_stream)
+        token: Token de acceso de la empresa
+        phone_number_id: ID del número de WhatsApp de la empresa
+        prefijo: Texto que se antepone a la primera parte
+    
+    Returns:
+        Tuple[str, bool]: El texto completo enviado (prefijo incluido), para guardarlo en
+        la conversación, y si la respuesta llegó entera
+    """
+    texto_completo = prefijo
+    pendiente = prefijo
+    enviado = ""
+    try:
+        async for parte in partes:
+            texto_completo += parte
+            pendiente += parte
+            if not pendiente.strip():
+                continue
+            
+            resultado = await enviar_mensaje_whatsapp(telefono_destino, pendiente.strip(), token, phone_number_id)
+            if not resultado.get("exito"):
+                raise Exception(f"Error enviando parte de la respuesta: {resultado.get('error')}")
+            enviado = texto_completo
+            pendiente = ""
+    except Exception as e:
+        if not enviado:
+            raise
+        print(f"❌ Se cortó la respuesta en streaming después de entregar {len(enviado)} caracteres: {e}")
+        await enviar_mensaje_whatsapp(telefono_destino, RESPUESTA_INTERRUMPIDA, token, phone_number_id)
+        return f"{enviado}\n{RESPUESTA_INTERRUMPIDA}", False
+    
+    return texto_completo, True
@@ -83,4 +83,16 @@ async def emitir_pedido_actualizado(pedido_dict: Dict[str, Any], empresa_id: int
     """
     room_name = f"empresa_{empresa_id}"
     print(f"📢 Emitiendo pedido actualizado a sala: {room_name}")
-    await sio.emit("pedido_actualizado", pedido_dict, room=room_name)
\ No newline at end of file
+    await sio.emit("pedido_actualizado", pedido_dict, room=room_name)
+
+
+# ==============================================
+# FUNCIONES PARA DOCUMENTOS (ingesta en segundo plano)
+# ==============================================
+async def emitir_progreso_ingesta(trabajo_dict: Dict[str, Any], empresa_id: int):
+    """
+    Emite un evento 'progreso_ingesta' con el estado del procesamiento
+    de un documento a la sala de la empresa correspondiente
+    """
+    room_name = f"empresa_{empresa_id}"
+    await sio.emit("progreso_ingesta", trabajo_dict, room=room_name)
\ No newline at end of file
@@ -0,0 +1,129 @@
+import re
+import time
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Tuple
+
+try:
+    import tiktoken
+except ImportError:  # sin tiktoken se aproxima un token por palabra
+    tiktoken = None
+
+# Máximo de tokens que aceptan los modelos de embeddings de OpenAI por texto
+MAX_TOKENS_EMBEDDING = 8191
+
+_PATRON_PALABRAS = re.compile(r"\S+")
+
+class Chunk(NamedTuple):
+    """Fragmento de un documento con su ubicación en el original"""
+    texto: str
+    tokens: int
+    pagina_inicio: int
+    pagina_fin: int
+    # Offsets sobre el texto completo del documento (páginas unidas con "\n")
+    char_inicio: int
+    char_fin: int
+
+# Tras un fallo se cuentan palabras y se vuelve a intentar cargar el tokenizador
+# recién pasado este tiempo (no en cada página)
+REINTENTO_TOKENIZADOR_SEGUNDOS = 300
+_tokenizadores_fallidos: Dict[str, float] = {}
+
+@lru_cache(maxsize=16)
+def _cargar_tokenizador(modelo: str):
+    try:
+        return tiktoken.encoding_for_model(modelo)
+    except KeyError:
+        # Modelos que tiktoken no conoce (endpoints compatibles): el de los embeddings actuales
+        return tiktoken.get_encoding("cl100k_base")
+
+def obtener_tokenizador(modelo: str):
+    """
+    Tokenizador de tiktoken para el modelo (cacheado), o None si tiktoken no está
+    instalado o no pudo descargar su vocabulario (se aproxima con palabras).
+    Los fallos no se cachean: se reintenta pasados REINTENTO_TOKENIZADOR_SEGUNDOS.
+    """
+    if tiktoken is None:
+        return None
+    fallo = _tokenizadores_fallidos.get(modelo)
+    if fallo is not None and time.monotonic() - fallo < REINTENTO_TOKENIZADOR_SEGUNDOS:
+        return None
+    try:
+        tokenizador = _cargar_tokenizador(modelo)
+    except Exception as e:
+        _tokenizadores_fallidos[modelo] = time.monotonic()
+        print(f"⚠️ No se pudo cargar el tokenizador para {modelo}, se cuentan palabras: {e}")
+        return None
+    _tokenizadores_fallidos.pop(modelo, None)
+    return tokenizador
+
+def inicios_de_tokens(texto: str, modelo: str) -> List[int]:
+    """Posición (en caracteres) donde empieza cada token de `texto`"""
+    tokenizador = obtener_tokenizador(modelo)
+    if tokenizador is None:
+        return [coincidencia.start() for coincidencia in _PATRON_PALABRAS.finditer(texto)]
+
+    tokens = tokenizador.encode(texto, disallowed_special=())
+    _, inicios = tokenizador.decode_with_offsets(tokens)
+    return inicios
+
+def dividir_en_chunks_tokens(
+    paginas: Iterable[Tuple[int, str]],
+    modelo: str,
+    tamano_chunk: int = 512,
+    solapamiento: int = 64
+) -> Iterator[Chunk]:
+    """
+    Consume (numero_pagina, texto) en orden y genera chunks de `tamano_chunk` tokens
+    que se solapan `solapamiento` tokens con el anterior.
+
+    Solo se retiene el texto desde el inicio del chunk en curso, así que la memoria
+    no depende de la cantidad de páginas. Los chunks pueden cruzar páginas.
+    """
+    tamano_chunk = min(tamano_chunk, MAX_TOKENS_EMBEDDING)
+    paso = max(tamano_chunk - solapamiento, 1)
+
+    # Texto retenido y el offset global en el que empieza
+    retenido = ""
+    base = 0
+    cursor = 0
+    # Tokens pendientes: (offset global de inicio, página)
+    tokens: List[Tuple[int, int]] = []
+    # Cuántos de los tokens pendientes ya salieron en el chunk anterior (el solapamiento)
+    cubiertos = 0
+
+    def armar_chunk(cantidad: int, fin: int) -> Chunk:
+        inicio = tokens[0][0]
+        crudo = retenido[inicio - base:fin - base]
+        sin_inicio = crudo.lstrip()
+        inicio += len(crudo) - len(sin_inicio)
+        texto = sin_inicio.rstrip()
+        return Chunk(
+            texto=texto,
+            tokens=cantidad,
+            pagina_inicio=tokens[0][1],
+            pagina_fin=tokens[cantidad - 1][1],
+            char_inicio=inicio,
+            char_fin=inicio + len(texto)
+        )
+
+    for numero_pagina, texto_pagina in paginas:
+        inicio_pagina = cursor
+        tokens.extend((inicio_pagina + inicio, numero_pagina) for inicio in inicios_de_tokens(texto_pagina, modelo))
+        retenido += texto_pagina + "\n"
+        cursor += len(texto_pagina) + 1
+
+        # Hace falta el token siguiente para saber dónde termina el chunk
+        while len(tokens) > tamano_chunk:
+            chunk = armar_chunk(tamano_chunk, tokens[tamano_chunk][0])
+            if chunk.texto:
+                yield chunk
+            del tokens[:paso]
+            cubiertos = tamano_chunk - paso
+            # Descartar el texto que ya no pertenece a ningún chunk futuro
+            retenido = retenido[tokens[0][0] - base:]
+            base = tokens[0][0]
+
+    if len(tokens) > cubiertos:
+        chunk = armar_chunk(len(tokens), cursor)
+        if chunk.texto:
+            yield chunk
@@ -0,0 +1,33 @@
+import re
+from typing import List, Optional
+
+# Fin de frase: signo de cierre seguido de espacio (no corta "3.5" ni "www.sitio.com") o saltos de línea
+_FIN_FRASE = re.compile(r'[.!?…]+["\')\]]*\s+|\n+')
+
+class SegmentadorFrases:
+    """
+    Recibe texto por pedazos (deltas de un stream del LLM) y entrega frases completas
+    de al menos `min_caracteres`, para mandarlas como mensajes separados.
+    Las frases conservan sus espacios, así que unidas reproducen el texto exacto.
+    """
+    def __init__(self, min_caracteres: int = 80):
+        self.min_caracteres = min_caracteres
+        self._buffer = ""
+
+    def agregar(self, delta: str) -> List[str]:
+        self._buffer += delta
+        frases = []
+        while True:
+            corte = next(
+                (fin.end() for fin in _FIN_FRASE.finditer(self._buffer) if fin.end() >= self.min_caracteres),
+                None
+            )
+            if corte is None:
+                return frases
+            frases.append(self._buffer[:corte])
+            self._buffer = self._buffer[corte:]
+
+    def terminar(self) -> Optional[str]:
+        """Lo que quedó sin cerrar al terminar el stream"""
+        resto, self._buffer = self._buffer, ""
+        return resto or None
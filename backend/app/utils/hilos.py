@@ -0,0 +1,18 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from app.core.config import settings
+
+# Pool acotado para las librerías que solo tienen API síncrona (Cloudinary, Redis, NumPy):
+# así una llamada lenta no bloquea el event loop y tampoco se crean hilos sin límite
+_executor = ThreadPoolExecutor(max_workers=settings.SDK_HILOS, thread_name_prefix="sdk")
+
+async def en_hilo(funcion, *args, **kwargs):
+    """Ejecuta `funcion` en el pool de hilos y espera su resultado sin frenar el event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, partial(funcion, *args, **kwargs))
+
+def cerrar_hilos():
+    """Se llama al apagar la aplicación"""
+    _executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,101 @@
+import hashlib
+import multiprocessing
+import os
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from io import BytesIO
+from itertools import islice
+from typing import Iterator, List, Optional, Tuple, Union
+
+from PyPDF2 import PdfReader
+
+# Un PDF puede venir como bytes en memoria o como ruta a un archivo en disco
+OrigenPDF = Union[bytes, str]
+
+def _abrir(origen: OrigenPDF) -> PdfReader:
+    if isinstance(origen, bytes):
+        return PdfReader(BytesIO(origen))
+    return PdfReader(origen)
+
+@contextmanager
+def _como_ruta(origen: OrigenPDF):
+    """Los procesos hijos abren el PDF por su cuenta, así que necesitan una ruta"""
+    if not isinstance(origen, bytes):
+        yield origen
+        return
+
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as temporal:
+        temporal.write(origen)
+    try:
+        yield temporal.name
+    finally:
+        os.remove(temporal.name)
+
+def _extraer_rango(ruta: str, inicio: int, fin: int) -> List[str]:
+    """Corre en un proceso hijo: extrae el texto de las páginas [inicio, fin)"""
+    lector = PdfReader(ruta)
+    return [lector.pages[i].extract_text() or "" for i in range(inicio, fin)]
+
+def calcular_md5(origen: OrigenPDF, tamano_bloque: int = 1024 * 1024) -> str:
+    """MD5 del archivo leyendo por bloques (no carga archivos en disco completos)"""
+    if isinstance(origen, bytes):
+        return hashlib.md5(origen).hexdigest()
+
+    md5 = hashlib.md5()
+    with open(origen, "rb") as archivo:
+        for bloque in iter(lambda: archivo.read(tamano_bloque), b""):
+            md5.update(bloque)
+    return md5.hexdigest()
+
+def contar_paginas(origen: OrigenPDF) -> int:
+    return len(_abrir(origen).pages)
+
+def iterar_paginas(
+    origen: OrigenPDF,
+    umbral_paralelo: int = 40,
+    paginas_por_tarea: int = 16,
+    workers: Optional[int] = None
+) -> Iterator[Tuple[int, str]]:
+    """
+    Genera (numero_pagina, texto) en orden, empezando en 1.
+
+    Los PDFs con menos de `umbral_paralelo` páginas se leen en este proceso.
+    Los más grandes se reparten en tareas de `paginas_por_tarea` páginas sobre un
+    pool de procesos, con un número acotado de tareas en vuelo: la memoria no crece
+    con el total de páginas porque cada resultado se entrega y se descarta.
+    """
+    workers = workers or os.cpu_count() or 1
+    lector = _abrir(origen)
+    total = len(lector.pages)
+
+    if total < umbral_paralelo or workers <= 1:
+        for numero in range(total):
+            yield numero + 1, lector.pages[numero].extract_text() or ""
+        return
+
+    del lector
+    with _como_ruta(origen) as ruta:
+        yield from _iterar_paralelo(ruta, total, paginas_por_tarea, workers)
+
+def _iterar_paralelo(ruta: str, total: int, paginas_por_tarea: int, workers: int) -> Iterator[Tuple[int, str]]:
+    rangos = ((inicio, min(inicio + paginas_por_tarea, total)) for inicio in range(0, total, paginas_por_tarea))
+
+    # "spawn" evita heredar por fork los hilos y conexiones del servidor
+    contexto = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=contexto) as executor:
+        en_vuelo = deque(
+            (inicio, executor.submit(_extraer_rango, ruta, inicio, fin))
+            for inicio, fin in islice(rangos, workers * 2)
+        )
+        while en_vuelo:
+            inicio, futuro = en_vuelo.popleft()
+            textos = futuro.result()
+
+            siguiente = next(rangos, None)
+            if siguiente:
+                en_vuelo.append((siguiente[0], executor.submit(_extraer_rango, ruta, *siguiente)))
+
+            for desplazamiento, texto in enumerate(textos):
+                yield inicio + desplazamiento + 1, texto
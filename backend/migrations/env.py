@@ -0,0 +1,35 @@
+from alembic import context
+from sqlalchemy import text
+
+from app.db.base import Base, engine
+from app.db.migraciones import INDICES_FUERA_DE_MIGRACIONES, LOCK_MIGRACIONES
+# Todos los modelos, para que Base.metadata tenga las tablas (autogenerate)
+from app.models import empresa, usuarios, cliente, conversacion, documento, ventas, pedido, evento_webhook, comprobante
+
+target_metadata = Base.metadata
+
+def include_object(objeto, nombre, tipo, reflejado, comparado_con):
+    """Autogenerate no toca los índices que se administran fuera de las migraciones"""
+    return not (tipo == "index" and nombre in INDICES_FUERA_DE_MIGRACIONES)
+
+def run_migrations_offline():
+    context.configure(
+        url=engine.url.render_as_string(hide_password=False),
+        target_metadata=target_metadata,
+        include_object=include_object,
+        literal_binds=True
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+def run_migrations_online():
+    with engine.connect() as connection:
+        context.configure(connection=connection, target_metadata=target_metadata, include_object=include_object)
+        with context.begin_transaction():
+            connection.execute(text("SELECT pg_advisory_xact_lock(:clave)"), {"clave": LOCK_MIGRACIONES})
+            context.run_migrations()
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,231 @@
+"""esquema inicial
+
+Reemplaza a Base.metadata.create_all + app/db/migraciones.py. Es idempotente: en
+una base creada antes de usar Alembic solo crea las tablas que falten y aplica
+los cambios que hacía migraciones.py, así no hace falta marcarla a mano.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+from pgvector.sqlalchemy import Vector
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+# Lo que aplicaba migraciones.py en cada arranque sobre tablas ya existentes
+MIGRACIONES_ANTERIORES = [
+    # El hash del archivo es único por empresa (antes era global)
+    "ALTER TABLE documentos DROP CONSTRAINT IF EXISTS documentos_hash_contenido_key",
+    """
+    DO $$ BEGIN
+        IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'uq_documentos_empresa_hash') THEN
+            ALTER TABLE documentos ADD CONSTRAINT uq_documentos_empresa_hash UNIQUE (empresa_id, hash_contenido);
+        END IF;
+    END $$
+    """,
+    # Hash por chunk para re-embeber solo los fragmentos que cambiaron
+    "ALTER TABLE chunks_documento ADD COLUMN IF NOT EXISTS hash_texto VARCHAR(64)",
+    "CREATE INDEX IF NOT EXISTS ix_chunks_documento_hash_texto ON chunks_documento (hash_texto)",
+    # Ubicación de cada chunk en el PDF (página y offsets de caracteres)
+    "ALTER TABLE chunks_documento ADD COLUMN IF NOT EXISTS pagina_inicio INTEGER",
+    "ALTER TABLE chunks_documento ADD COLUMN IF NOT EXISTS pagina_fin INTEGER",
+    "ALTER TABLE chunks_documento ADD COLUMN IF NOT EXISTS char_inicio INTEGER",
+    "ALTER TABLE chunks_documento ADD COLUMN IF NOT EXISTS char_fin INTEGER",
+    # El índice HNSW no va acá: depende de RAG_MODO_BUSQUEDA (ver app/db/migraciones.py)
+]
+
+def _crear_tabla(nombre: str, *columnas, indices=()):
+    """Crea la tabla con sus índices solo si no existe"""
+    if sa.inspect(op.get_bind()).has_table(nombre):
+        return
+    op.create_table(nombre, *columnas)
+    for nombre_indice, campos, unico in indices:
+        op.create_index(nombre_indice, nombre, campos, unique=unico)
+
+def upgrade():
+    op.execute("CREATE EXTENSION IF NOT EXISTS vector")
+
+    _crear_tabla(
+        "empresas",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("nombre", sa.String(100), nullable=False),
+        sa.Column("telefono_whatsapp", sa.String(20), nullable=False),
+        sa.Column("token_api", sa.String(100), nullable=False, unique=True),
+        sa.Column("prompt_personalizado", sa.Text(), nullable=True),
+        sa.Column("telefono_dueño", sa.String(20), nullable=True),
+        sa.Column("activa", sa.Boolean(), nullable=True),
+        sa.Column("fecha_registro", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("fecha_actualizacion", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("whatsapp_token", sa.String(500), nullable=False),
+        sa.Column("phone_number_id", sa.String(100), nullable=False),
+        sa.Column("verify_token", sa.String(100), nullable=False),
+        sa.Column("openai_api_key", sa.String(500), nullable=False),
+        sa.Column("openai_embedding_model", sa.String(100), nullable=True),
+        sa.Column("openai_chat_model", sa.String(100), nullable=True),
+        sa.Column("openai_api_base", sa.String(500), nullable=True),
+        sa.Column("groq_api_key", sa.String(500), nullable=False),
+        sa.Column("cloudinary_cloud_name", sa.String(100), nullable=False),
+        sa.Column("cloudinary_api_key", sa.String(100), nullable=False),
+        sa.Column("cloudinary_api_secret", sa.String(500), nullable=False),
+        indices=[
+            ("ix_empresas_id", ["id"], False),
+            ("ix_empresas_telefono_whatsapp", ["telefono_whatsapp"], True),
+        ]
+    )
+
+    _crear_tabla(
+        "usuarios",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("empresa_id", sa.Integer(), sa.ForeignKey("empresas.id"), nullable=False),
+        sa.Column("email", sa.String(255), nullable=False),
+        sa.Column("nombre", sa.String(100), nullable=False),
+        sa.Column("password_hash", sa.String(255), nullable=True),
+        sa.Column("google_id", sa.String(255), nullable=True, unique=True),
+        sa.Column("facebook_id", sa.String(255), nullable=True, unique=True),
+        sa.Column("foto_url", sa.String(500), nullable=True),
+        sa.Column("auth_provider", sa.String(50), nullable=False),
+        sa.Column("rol", sa.String(50), nullable=False),
+        sa.Column("activo", sa.Boolean(), nullable=True),
+        sa.Column("ultimo_acceso", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("fecha_registro", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("fecha_actualizacion", sa.DateTime(timezone=True), nullable=True),
+        indices=[
+            ("ix_usuarios_id", ["id"], False),
+            ("ix_usuarios_email", ["email"], True),
+        ]
+    )
+
+    _crear_tabla(
+        "clientes",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("empresa_id", sa.Integer(), sa.ForeignKey("empresas.id"), nullable=False),
+        sa.Column("telefono", sa.String(20), nullable=False),
+        sa.Column("nombre", sa.String(100), nullable=True),
+        sa.Column("resumen", sa.Text(), nullable=True),
+        sa.Column("datos_estructurados", sa.JSON(), nullable=True),
+        sa.Column("sentimiento_ultimo", sa.String(20), nullable=True),
+        sa.Column("ultima_interaccion", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("fecha_registro", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        indices=[
+            ("ix_clientes_id", ["id"], False),
+            ("ix_clientes_telefono", ["telefono"], False),
+        ]
+    )
+
+    _crear_tabla(
+        "conversaciones",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("cliente_id", sa.Integer(), sa.ForeignKey("clientes.id"), nullable=False),
+        sa.Column("mensaje", sa.Text(), nullable=False),
+        sa.Column("emisor", sa.Enum("CLIENTE", "BOT", "ASESOR", name="tipoemisor"), nullable=False),
+        sa.Column("timestamp", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        indices=[
+            ("ix_conversaciones_id", ["id"], False),
+            ("ix_conversaciones_timestamp", ["timestamp"], False),
+        ]
+    )
+
+    _crear_tabla(
+        "documentos",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("empresa_id", sa.Integer(), sa.ForeignKey("empresas.id"), nullable=False),
+        sa.Column("campania_id", sa.String(100), nullable=True),
+        sa.Column("nombre", sa.String(255), nullable=False),
+        sa.Column("hash_contenido", sa.String(64), nullable=True),
+        sa.Column("fecha_subida", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("mensaje_entrega", sa.Text(), nullable=True),
+        sa.Column("precio", sa.Float(), nullable=True),
+        sa.Column("tipo_campania", sa.String(50), nullable=False),
+        sa.UniqueConstraint("empresa_id", "hash_contenido", name="uq_documentos_empresa_hash"),
+        indices=[
+            ("ix_documentos_id", ["id"], False),
+            ("ix_documentos_campania_id", ["campania_id"], False),
+        ]
+    )
+
+    _crear_tabla(
+        "chunks_documento",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("documento_id", sa.Integer(), sa.ForeignKey("documentos.id"), nullable=False),
+        sa.Column("indice", sa.Integer(), nullable=False),
+        sa.Column("texto", sa.Text(), nullable=False),
+        sa.Column("hash_texto", sa.String(64), nullable=True),
+        sa.Column("embedding", Vector(1536), nullable=True),
+        sa.Column("pagina_inicio", sa.Integer(), nullable=True),
+        sa.Column("pagina_fin", sa.Integer(), nullable=True),
+        sa.Column("char_inicio", sa.Integer(), nullable=True),
+        sa.Column("char_fin", sa.Integer(), nullable=True),
+        indices=[
+            ("ix_chunks_documento_id", ["id"], False),
+        ]
+    )
+
+    _crear_tabla(
+        "ventas",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("empresa_id", sa.Integer(), sa.ForeignKey("empresas.id"), nullable=False),
+        sa.Column("cliente_id", sa.Integer(), sa.ForeignKey("clientes.id"), nullable=False),
+        sa.Column("campania_id", sa.String(100), nullable=False),
+        sa.Column("producto_nombre", sa.String(200), nullable=True),
+        sa.Column("cantidad", sa.Integer(), nullable=False),
+        sa.Column("precio_unitario", sa.Float(), nullable=False),
+        sa.Column("monto_total", sa.Float(), nullable=False),
+        sa.Column("estado", sa.Enum("pendiente", "confirmada", "rechazada", name="estadoventa"), nullable=True),
+        sa.Column("fecha_venta", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("fecha_actualizacion", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("comprobante_url", sa.String(500), nullable=True),
+        sa.Column("notas", sa.Text(), nullable=True),
+        indices=[
+            ("ix_ventas_id", ["id"], False),
+            ("ix_ventas_campania_id", ["campania_id"], False),
+        ]
+    )
+
+    _crear_tabla(
+        "pedidos",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("empresa_id", sa.Integer(), sa.ForeignKey("empresas.id"), nullable=False),
+        sa.Column("cliente_id", sa.Integer(), sa.ForeignKey("clientes.id"), nullable=False),
+        sa.Column("campania_id", sa.String(100), nullable=False),
+        sa.Column("texto_pedido", sa.Text(), nullable=False),
+        sa.Column("monto_total", sa.Float(), nullable=False),
+        sa.Column("comprobante_url", sa.String(500), nullable=True),
+        sa.Column("estado", sa.Enum("pendiente", "confirmado", "rechazado", name="estadopedido"), nullable=True),
+        sa.Column("fecha_creacion", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("fecha_confirmacion", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("notas", sa.Text(), nullable=True),
+        indices=[
+            ("ix_pedidos_id", ["id"], False),
+            ("ix_pedidos_campania_id", ["campania_id"], False),
+        ]
+    )
+
+    _crear_tabla(
+        "eventos_webhook",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("payload", sa.JSON(), nullable=False),
+        sa.Column("estado", sa.Enum("pendiente", "procesando", "fallido", name="estadoevento"), nullable=False),
+        sa.Column("intentos", sa.Integer(), nullable=False),
+        sa.Column("error", sa.Text(), nullable=True),
+        sa.Column("proximo_intento", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.Column("fecha_creacion", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        indices=[
+            ("ix_eventos_webhook_id", ["id"], False),
+            ("ix_eventos_webhook_estado_proximo", ["estado", "proximo_intento"], False),
+        ]
+    )
+
+    for sentencia in MIGRACIONES_ANTERIORES:
+        op.execute(sentencia)
+
+def downgrade():
+    for tabla in ("eventos_webhook", "pedidos", "ventas", "chunks_documento", "documentos",
+                  "conversaciones", "clientes", "usuarios", "empresas"):
+        op.drop_table(tabla)
+    for tipo in ("estadoevento", "estadopedido", "estadoventa", "tipoemisor"):
+        op.execute(f"DROP TYPE IF EXISTS {tipo}")
@@ -0,0 +1,44 @@
+"""índices compuestos para las consultas del webhook
+
+- clientes (empresa_id, telefono): buscar el cliente de cada mensaje
+- conversaciones (cliente_id, timestamp): historial reciente ordenado
+- documentos (empresa_id, campania_id) INCLUDE (tipo_campania): tipo de la
+  campaña activa sin leer la tabla (index-only scan)
+- pedidos (cliente_id, empresa_id, estado, fecha_creacion): último pedido
+  pendiente del cliente al aprobar o rechazar
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17
+"""
+from alembic import op
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_index(
+        "ix_clientes_empresa_telefono", "clientes", ["empresa_id", "telefono"],
+        if_not_exists=True
+    )
+    op.create_index(
+        "ix_conversaciones_cliente_timestamp", "conversaciones", ["cliente_id", "timestamp"],
+        if_not_exists=True
+    )
+    op.create_index(
+        "ix_documentos_empresa_campania", "documentos", ["empresa_id", "campania_id"],
+        postgresql_include=["tipo_campania"],
+        if_not_exists=True
+    )
+    op.create_index(
+        "ix_pedidos_cliente_empresa_estado_fecha", "pedidos", ["cliente_id", "empresa_id", "estado", "fecha_creacion"],
+        if_not_exists=True
+    )
+
+def downgrade():
+    op.drop_index("ix_pedidos_cliente_empresa_estado_fecha", table_name="pedidos", if_exists=True)
+    op.drop_index("ix_documentos_empresa_campania", table_name="documentos", if_exists=True)
+    op.drop_index("ix_conversaciones_cliente_timestamp", table_name="conversaciones", if_exists=True)
+    op.drop_index("ix_clientes_empresa_telefono", table_name="clientes", if_exists=True)
@@ -0,0 +1,36 @@
+"""comprobantes por sha256
+
+Tabla de comprobantes de pago ya procesados, única por (empresa, cliente, sha256):
+los reenvíos de la misma imagen reutilizan la URL y no crean otro pedido.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        "comprobantes",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("empresa_id", sa.Integer(), sa.ForeignKey("empresas.id"), nullable=False),
+        sa.Column("cliente_id", sa.Integer(), sa.ForeignKey("clientes.id"), nullable=False),
+        sa.Column("sha256", sa.String(64), nullable=False),
+        sa.Column("url", sa.String(500), nullable=False),
+        sa.Column("pedido_id", sa.Integer(), sa.ForeignKey("pedidos.id", ondelete="SET NULL"), nullable=True),
+        sa.Column("veces_repetido", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("fecha_creacion", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.UniqueConstraint("empresa_id", "cliente_id", "sha256", name="uq_comprobantes_empresa_cliente_sha256"),
+        if_not_exists=True
+    )
+    op.create_index("ix_comprobantes_id", "comprobantes", ["id"], if_not_exists=True)
+
+def downgrade():
+    op.drop_index("ix_comprobantes_id", table_name="comprobantes", if_exists=True)
+    op.drop_table("comprobantes", if_exists=True)